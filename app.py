@@ -1,196 +1,256 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, url_for
 from flask_cors import CORS
-import json
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
-from datetime import datetime
 
-app = Flask(__name__)
+from assets import AssetManifest
+from catalog import CatalogStore, decode_cursor, encode_cursor, parse_fields, parse_sort, sort_key
+from catalog_sqlite import SqliteCatalogStore, SqliteViewCounter
+from contact_queue import ContactQueue, JsonlOutbox
+from http_cache import conditional_json
+from metrics import Metrics, phase
+from prerender import StaticExporter
+from related import RelatedIndex
+from response_cache import ResponseCache
+from view_analytics import ViewAnalytics, parse_window
+from view_counter import ViewCounter, catalog_lock_path
+from view_dedup import ViewDeduplicator
+
+# INSTANCE_PATH / MAPS_JSON_PATH let benchmarks run against a synthetic catalog
+app = Flask(__name__, instance_path=os.environ.get('INSTANCE_PATH'))
 CORS(app)
 
-# Sample maps data (in production, this would come from a database)
-MAPS_DATA = [
-    {
-        "id": "leaflet-choropleth",
-        "title": "Interactive Choropleth Visualization",
-        "description": "A stunning choropleth map showcasing population density with interactive hover effects, custom styling, and real-time data updates.",
-        "url": "https://leafletjs.com/examples/choropleth/",
-        "image": "https://images.unsplash.com/photo-1551288049-bebda4e38f71?w=600&h=400&fit=crop&crop=center",
-        "category": "Statistical Analysis",
-        "technologies": ["Leaflet", "JavaScript", "GeoJSON", "D3.js"],
-        "featured": True,
-        "dateAdded": "2024-01-15",
-        "views": 2847,
-        "rating": 4.8,
-        "complexity": "Intermediate"
-    },
-    {
-        "id": "mapbox-3d-buildings",
-        "title": "3D Urban Architecture Explorer",
-        "description": "Immersive 3D building visualizations with realistic shadow casting, dynamic lighting effects, and smooth camera transitions through urban landscapes.",
-        "url": "https://docs.mapbox.com/mapbox-gl-js/example/3d-buildings/",
-        "image": "https://images.unsplash.com/photo-1486406146926-c627a92ad1ab?w=600&h=400&fit=crop&crop=center",
-        "category": "3D Visualization",
-        "technologies": ["Mapbox GL JS", "WebGL", "Vector Tiles", "3D Rendering"],
-        "featured": True,
-        "dateAdded": "2024-01-20",
-        "views": 3921,
-        "rating": 4.9,
-        "complexity": "Advanced"
-    },
-    {
-        "id": "openlayers-heatmap",
-        "title": "Dynamic Earthquake Heatmap",
-        "description": "Real-time seismic activity visualization with temporal animation controls, customizable intensity gradients, and interactive data filtering.",
-        "url": "https://openlayers.org/en/latest/examples/heatmap-earthquakes.html",
-        "image": "https://images.unsplash.com/photo-1446776653964-20c1d3a81b06?w=600&h=400&fit=crop&crop=center",
-        "category": "Real-time Analysis",
-        "technologies": ["OpenLayers", "Canvas Rendering", "WebGL", "Time Series"],
-        "featured": False,
-        "dateAdded": "2024-01-25",
-        "views": 1573,
-        "rating": 4.5,
-        "complexity": "Intermediate"
-    },
-    {
-        "id": "cesium-terrain",
-        "title": "Global Terrain & Satellite Explorer",
-        "description": "Photorealistic 3D globe with high-resolution terrain data, real-time satellite imagery, and immersive navigation through Earth's landscapes.",
-        "url": "https://sandcastle.cesium.com/index.html?src=Terrain.html",
-        "image": "https://images.unsplash.com/photo-1446776877081-d282a0f896e2?w=600&h=400&fit=crop&crop=center",
-        "category": "3D Globe",
-        "technologies": ["Cesium", "WebGL", "Terrain Data", "Satellite Imagery"],
-        "featured": True,
-        "dateAdded": "2024-02-01",
-        "views": 4205,
-        "rating": 4.9,
-        "complexity": "Advanced"
-    },
-    {
-        "id": "deck-gl-trips",
-        "title": "Animated Transportation Networks",
-        "description": "Mesmerizing visualization of global transportation flows with arc animations, particle systems, and time-based data storytelling.",
-        "url": "https://deck.gl/examples/trips-layer/",
-        "image": "https://images.unsplash.com/photo-1507003211169-0a1dd7228f2d?w=600&h=400&fit=crop&crop=center",
-        "category": "Transportation",
-        "technologies": ["Deck.gl", "WebGL", "React", "Data Animation"],
-        "featured": True,
-        "dateAdded": "2024-02-05",
-        "views": 2934,
-        "rating": 4.7,
-        "complexity": "Advanced"
-    },
-    {
-        "id": "webgl-wind-map",
-        "title": "Global Wind Flow Simulation",
-        "description": "Breathtaking real-time wind flow patterns with particle physics, dynamic weather visualization, and interactive atmospheric data.",
-        "url": "https://earth.nullschool.net/",
-        "image": "https://images.unsplash.com/photo-1504608524841-42fe6f032b4b?w=600&h=400&fit=crop&crop=center",
-        "category": "Weather Systems",
-        "technologies": ["WebGL", "Particle Physics", "Real-time Data", "Atmospheric Modeling"],
-        "featured": True,
-        "dateAdded": "2024-02-15",
-        "views": 5847,
-        "rating": 4.8,
-        "complexity": "Expert"
-    },
-    {
-        "id": "arcgis-dashboard",
-        "title": "Smart City Analytics Dashboard",
-        "description": "Comprehensive urban analytics platform with real-time data streams, predictive modeling, and interactive visualization components.",
-        "url": "https://developers.arcgis.com/javascript/latest/sample-code/widgets-layerlist/",
-        "image": "https://images.unsplash.com/photo-1551288049-bebda4e38f71?w=600&h=400&fit=crop&crop=center",
-        "category": "Urban Analytics",
-        "technologies": ["ArcGIS API", "Machine Learning", "IoT Integration", "Dashboard"],
-        "featured": False,
-        "dateAdded": "2024-02-20",
-        "views": 1892,
-        "rating": 4.4,
-        "complexity": "Advanced"
-    },
-    {
-        "id": "threejs-globe",
-        "title": "Interactive Planetary Explorer",
-        "description": "Custom 3D planetary visualization with atmospheric effects, orbital mechanics, and detailed surface mapping using advanced shaders.",
-        "url": "https://threejs.org/examples/#webgl_earth",
-        "image": "https://images.unsplash.com/photo-1614728263952-84ea256f9679?w=600&h=400&fit=crop&crop=center",
-        "category": "3D Globe",
-        "technologies": ["Three.js", "Custom Shaders", "3D Physics", "Atmospheric Rendering"],
-        "featured": True,
-        "dateAdded": "2024-02-25",
-        "views": 3764,
-        "rating": 4.9,
-        "complexity": "Expert"
-    },
-    {
-        "id": "kepler-gl-demo",
-        "title": "Big Data Geospatial Analytics",
-        "description": "Large-scale geospatial data processing with machine learning integration, temporal analysis, and interactive visual exploration.",
-        "url": "https://kepler.gl/demo",
-        "image": "https://images.unsplash.com/photo-1551288049-bebda4e38f71?w=600&h=400&fit=crop&crop=center",
-        "category": "Big Data Analytics",
-        "technologies": ["Kepler.gl", "WebGL", "Machine Learning", "GPU Computing"],
-        "featured": True,
-        "dateAdded": "2024-03-05",
-        "views": 4521,
-        "rating": 4.6,
-        "complexity": "Expert"
-    },
-    {
-        "id": "mapbox-clustering",
-        "title": "Smart Point Clustering Engine",
-        "description": "Advanced clustering algorithms with dynamic aggregation, hierarchical visualization, and performance-optimized rendering for millions of points.",
-        "url": "https://docs.mapbox.com/mapbox-gl-js/example/cluster/",
-        "image": "https://images.unsplash.com/photo-1581291518857-4e27b48ff24e?w=600&h=400&fit=crop&crop=center",
-        "category": "Data Visualization",
-        "technologies": ["Mapbox GL JS", "Clustering Algorithms", "Performance Optimization", "WebWorkers"],
-        "featured": False,
-        "dateAdded": "2024-04-01",
-        "views": 2156,
-        "rating": 4.3,
-        "complexity": "Intermediate"
+# Number of reverse proxies in front of gunicorn (nginx: 1). Their
+# X-Forwarded-For/-Proto headers are trusted, so request.remote_addr is the
+# visitor's address; PROXY_HOPS=0 when clients connect directly
+app.config.setdefault('PROXY_HOPS', int(os.environ.get('PROXY_HOPS', '1')))
+if app.config['PROXY_HOPS']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_HOPS'],
+                            x_proto=app.config['PROXY_HOPS'])
+
+MAPS_JSON_PATH = os.environ.get('MAPS_JSON_PATH', os.path.join(app.static_folder, 'data', 'maps.json'))
+
+# Catalog storage: 'json' parses maps.json in every worker; 'sqlite' imports
+# it into an indexed database shared by all workers (see catalog_sqlite.py)
+app.config.setdefault('CATALOG_BACKEND', os.environ.get('CATALOG_BACKEND', 'json'))
+app.config.setdefault('CATALOG_DB_PATH', os.path.join(app.instance_path, 'catalog.sqlite3'))
+app.config.setdefault('VIEW_LOG_PATH', os.path.join(app.instance_path, 'views.log'))
+# Compacted view counts (json backend): maps.json is never rewritten for views
+app.config.setdefault('VIEW_COUNTS_PATH', os.path.join(app.instance_path, 'views.json'))
+# Taken by everything that rewrites maps.json (build scripts, SQLite export)
+app.config.setdefault('CATALOG_LOCK_PATH', catalog_lock_path(app.instance_path))
+# Compiled catalog memory-mapped by every worker (json backend, see catalog_records.py)
+app.config.setdefault('CATALOG_COMPILED_PATH', os.path.join(app.instance_path, 'catalog.bin'))
+
+# Content-hashed static files (python assets.py); templates and catalog
+# image URLs resolve through the manifest, falling back to the originals
+assets = AssetManifest(app.static_folder)
+app.extensions['assets'] = assets
+
+@app.template_global()
+def asset_url(filename):
+    """URL of a static file, fingerprinted when it is in the manifest."""
+    return url_for('static', filename=assets.resolve(filename))
+
+if app.config['CATALOG_BACKEND'] == 'sqlite':
+    catalog_store = SqliteCatalogStore(app.config['CATALOG_DB_PATH'], MAPS_JSON_PATH, assets=assets,
+                                       lock_path=app.config['CATALOG_LOCK_PATH'])
+    view_counter = SqliteViewCounter(catalog_store)
+else:
+    catalog_store = CatalogStore(MAPS_JSON_PATH, assets=assets,
+                                 compiled_path=app.config['CATALOG_COMPILED_PATH'])
+    view_counter = ViewCounter(catalog_store, app.config['VIEW_LOG_PATH'],
+                               app.config['VIEW_COUNTS_PATH'])
+
+# Repeated views of a map by the same client (same address and user agent)
+# within VIEW_DEDUP_WINDOW to 2 x VIEW_DEDUP_WINDOW seconds are dropped by
+# shared, rotating Bloom filters (see view_dedup.py)
+app.config.setdefault('VIEW_DEDUP_ENABLED', os.environ.get('VIEW_DEDUP', '1') == '1')
+app.config.setdefault('VIEW_DEDUP_PATH', os.path.join(app.instance_path, 'view_dedup.bin'))
+app.config.setdefault('VIEW_DEDUP_WINDOW', 3600)
+app.config.setdefault('VIEW_DEDUP_CAPACITY', 100000)
+app.config.setdefault('VIEW_DEDUP_ERROR_RATE', 0.001)
+view_dedup = ViewDeduplicator(app.config['VIEW_DEDUP_PATH'],
+                              window=app.config['VIEW_DEDUP_WINDOW'],
+                              capacity=app.config['VIEW_DEDUP_CAPACITY'],
+                              error_rate=app.config['VIEW_DEDUP_ERROR_RATE'])
+app.extensions['view_dedup'] = view_dedup
+
+# Views per map and hour (ring buffers) rolled up per day, for trending
+# rankings and per-map histories (see view_analytics.py)
+app.config.setdefault('ANALYTICS_DIR', os.path.join(app.instance_path, 'analytics'))
+view_analytics = ViewAnalytics(app.config['ANALYTICS_DIR'])
+app.extensions['view_analytics'] = view_analytics
+
+# "Similar maps": top-k TF-IDF neighbours per map, recomputed when the
+# catalog reloads (RELATED_PRECOMPUTE=0 defers it to the first lookup)
+app.config.setdefault('RELATED_TOP_K', 12)
+app.config.setdefault('RELATED_PRECOMPUTE', os.environ.get('RELATED_PRECOMPUTE', '1') == '1')
+related_index = RelatedIndex(catalog_store if app.config['RELATED_PRECOMPUTE'] else None,
+                             k=app.config['RELATED_TOP_K'])
+app.extensions['related_index'] = related_index
+
+# Contact messages: durable SQLite queue drained by a background worker into
+# a rotated JSON Lines outbox (swap `deliver` for an email sender in production)
+app.config.setdefault('CONTACT_QUEUE_PATH', os.path.join(app.instance_path, 'contacts.sqlite3'))
+app.config.setdefault('CONTACT_OUTBOX_PATH', os.path.join(app.instance_path, 'contacts.jsonl'))
+# CONTACT_QUEUE_LEASE must exceed the delivery timeout (see ContactQueue)
+app.config.setdefault('CONTACT_QUEUE_LEASE', 300.0)
+contact_queue = ContactQueue(app.config['CONTACT_QUEUE_PATH'],
+                             deliver=JsonlOutbox(app.config['CONTACT_OUTBOX_PATH']),
+                             lease=app.config['CONTACT_QUEUE_LEASE'])
+
+@app.before_request
+def start_contact_queue():
+    # Each gunicorn worker drains messages left over by earlier runs too,
+    # not only after its own first submission
+    contact_queue.start()
+
+# Cache-Control per API endpoint; responses also carry an ETag so clients
+# revalidate with a cheap 304 once max-age has elapsed
+app.config.setdefault('API_CACHE_CONTROL', {
+    'get_maps': 'public, max-age=60',
+    'get_map': 'public, max-age=60',
+    'get_categories': 'public, max-age=3600',
+    'get_stats': 'public, max-age=10',
+    'get_related_maps': 'public, max-age=300',
+    'get_trending_maps': 'public, max-age=60',
+    'get_map_views': 'public, max-age=60',
+})
+app.config.setdefault('API_CACHE_CONTROL_DEFAULT', 'no-cache')
+# Seconds a stale response may be served while revalidating (0 disables)
+app.config.setdefault('API_STALE_WHILE_REVALIDATE', 0)
+
+# Upper bound for `per_page` on list endpoints
+app.config.setdefault('API_MAX_PER_PAGE', 100)
+
+# Encoded (and gzip/brotli compressed) API bodies, keyed by request and data version
+app.config.setdefault('RESPONSE_CACHE_MAX_BYTES', 16 * 1024 * 1024)
+app.extensions['response_cache'] = ResponseCache(app.config['RESPONSE_CACHE_MAX_BYTES'])
+
+# Latency histograms, Server-Timing and /metrics (Prometheus, all workers)
+metrics = Metrics(app)
+
+# Pre-rendered home page and API snapshots served directly by nginx; each
+# worker re-exports them when the catalog reloads (see prerender.py)
+app.config.setdefault('PRERENDER_ENABLED', os.environ.get('PRERENDER', '1') == '1')
+app.config.setdefault('PRERENDER_DIR', os.path.join(app.instance_path, 'prerendered'))
+app.config.setdefault('PRERENDER_INTERVAL', 60.0)
+static_exporter = StaticExporter(app, catalog_store, view_counter, app.config['PRERENDER_DIR'],
+                                 interval=app.config['PRERENDER_INTERVAL'])
+app.extensions['static_exporter'] = static_exporter
+
+@app.before_request
+def start_static_exporter():
+    if app.config['PRERENDER_ENABLED']:
+        static_exporter.start()
+
+@metrics.register_collector
+def cache_metrics():
+    cache = app.extensions['response_cache'].stats()
+    return [
+        ('counter', 'geovis_catalog_lookups_total', {'result': 'hit'}, catalog_store.hits),
+        ('counter', 'geovis_catalog_lookups_total', {'result': 'reload'}, catalog_store.reloads),
+        ('counter', 'geovis_response_cache_lookups_total', {'result': 'hit'}, cache['hits']),
+        ('counter', 'geovis_response_cache_lookups_total', {'result': 'miss'}, cache['misses']),
+        ('counter', 'geovis_response_cache_evictions_total', {}, cache['evictions']),
+        ('gauge', 'geovis_response_cache_entries', {}, cache['entries']),
+        ('gauge', 'geovis_response_cache_bytes', {}, cache['bytes']),
+        ('counter', 'geovis_static_exports_total', {}, static_exporter.exports),
+        ('counter', 'geovis_related_index_builds_total', {}, related_index.builds),
+        ('counter', 'geovis_view_dedup_total', {'result': 'accepted'}, view_dedup.accepted),
+        ('counter', 'geovis_view_dedup_total', {'result': 'duplicate'}, view_dedup.duplicates),
+    ]
+
+def live_views(fields):
+    """Live view counts when a `fields=` projection returns views, else None
+
+    maps.json only holds each map's initial views; list endpoints report the
+    same counts as /api/maps/<id> and /api/stats.
+    """
+    if fields is None or 'views' in fields:
+        return view_counter.counts()
+    return None
+
+def maps_page(catalog, fields, category='Toutes', search='', page=1, per_page=None,
+              sort=None, offset=0, after=None, views=None):
+    """One /api/maps page: filter by mode and search, then sort and paginate
+
+    Shared by /api/maps and the home page bootstrap, so the embedded first
+    page follows the same paging contract (`total`, `pages`, `next_cursor`).
+    """
+    per_page = per_page or app.config['API_MAX_PER_PAGE']
+    # One extra record tells whether a next page exists
+    with phase('filter'):
+        total, page_maps = catalog.query(
+            mode=None if category == 'Toutes' else category,
+            search=search,
+            offset=offset,
+            limit=per_page + 1,
+            sort=sort,
+            after=after,
+            views=views)
+
+    next_cursor = None
+    if len(page_maps) > per_page:
+        page_maps = page_maps[:per_page]
+        if sort is None:
+            next_cursor = encode_cursor(None, offset + per_page)
+        else:
+            next_cursor = encode_cursor(sort, sort_key(page_maps[-1], sort[0], views))
+
+    return {
+        'maps': catalog.project(page_maps, fields, views),
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': (total + per_page - 1) // per_page,
+        'next_cursor': next_cursor
     }
-]
-
-CATEGORIES = [
-    "All Categories",
-    "Statistical Analysis",
-    "3D Visualization", 
-    "Real-time Analysis",
-    "3D Globe",
-    "Transportation",
-    "Weather Systems",
-    "Urban Analytics",
-    "Big Data Analytics",
-    "Data Visualization"
-]
+
+def gallery_stats():
+    """Gallery statistics shared by the home page and /api/stats"""
+    catalog = catalog_store.get()
+    return catalog.stats.as_dict(total_views=view_counter.total())
+
+# Gallery modes (not the thematic categories), as listed by /api/categories
+GALLERY_MODES = ['Toutes', '2d', 'interactive']
+
+# Fields of the gallery's first /api/maps request (CARD_FIELDS in MapGalleryApp.js)
+BOOTSTRAP_FIELDS = 'card,url,excerpt,maceachren'
+
+# Serialized first page and modes of the latest catalog version: (version, JSON)
+_bootstrap_cache = (None, None)
+
+def script_json(value):
+    """JSON that is safe inside a <script> element"""
+    return app.json.dumps(value).replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026')
+
+def bootstrap_json(stats):
+    """Data the gallery needs for its first render, embedded in the home page
+
+    Holds what MapGalleryApp.js would otherwise fetch on mount: the first
+    page of /api/maps (card fields), /api/categories and /api/stats. Maps and
+    modes only change with the catalog, so they are serialized once per
+    catalog version; the stats are added per request.
+    """
+    global _bootstrap_cache
+    catalog = catalog_store.get()
+    version, cached = _bootstrap_cache
+    if version != catalog.version:
+        # The gallery's initial query: every mode, no search, catalog order
+        maps = maps_page(catalog, parse_fields(BOOTSTRAP_FIELDS))
+        cached = (f'"categories":{script_json(GALLERY_MODES)},'
+                  f'"maps":{script_json(maps)},'
+                  f'"version":{script_json(catalog.version)}')
+        _bootstrap_cache = (catalog.version, cached)
+    return f'{{{cached},"stats":{script_json(stats)}}}'
 
 @app.route('/')
 def index():
     """Main application route"""
     try:
-        import json
-        import os
-        
-        json_path = os.path.join(app.static_folder, 'data', 'maps.json')
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        maps_data = data['maps']
-        categories_data = data['categories']
-        
-        total_maps = len(maps_data)
-        total_categories = len(categories_data)
-        total_views = sum(m['views'] for m in maps_data)
-        avg_rating = sum(m['rating'] for m in maps_data) / total_maps if total_maps > 0 else 0
-        
-        stats = {
-            'total_maps': total_maps,
-            'total_categories': total_categories,
-            'total_views': total_views,
-            'average_rating': round(avg_rating, 1)
-        }
-        
-        return render_template('home.html', stats=stats)
+        stats = gallery_stats()
     except Exception as e:
         print(f"Error loading stats: {e}")
         # Fallback to default values
@@ -200,57 +260,68 @@ def index():
             'total_views': 0,
             'average_rating': 0.0
         }
-        return render_template('home.html', stats=stats)
+    try:
+        bootstrap = bootstrap_json(stats)
+    except Exception as e:
+        # The gallery fetches its data itself when the page has none
+        print(f"Error building bootstrap data: {e}")
+        bootstrap = None
+    return render_template('home.html', stats=stats, bootstrap=bootstrap)
 
 @app.route('/api/maps')
 def get_maps():
-    """API endpoint to get all maps with filtering and pagination"""
+    """API endpoint to get maps with filtering, sorting and pagination
+
+    Pages are addressed either by `page` or by the opaque `cursor` returned
+    as `next_cursor`. With `sort=`, cursors resume after the last record's
+    sort key, so pages stay consistent while view counts change.
+    """
     try:
-        # Charger les données depuis le fichier JSON
-        import json
-        import os
-        
-        json_path = os.path.join(app.static_folder, 'data', 'maps.json')
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        maps_data = data['maps']
-        
-        # Map thumbnail to preview for frontend compatibility
-        for map_item in maps_data:
-            map_item['preview'] = map_item.get('thumbnail', '/static/images/default-map.svg')
+        with phase('load'):
+            catalog = catalog_store.get()
         
         # Get query parameters
         category = request.args.get('category', 'Toutes')
         search = request.args.get('search', '')
         page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 100))  # Increased default to show all maps
-        
-        # Filter maps based on mode and search
-        filtered_maps = maps_data
-        
-        if category != 'Toutes':
-            filtered_maps = [m for m in filtered_maps if m['mode'] == category]
-        
-        if search:
-            search_lower = search.lower()
-            filtered_maps = [m for m in filtered_maps if 
-                            search_lower in m['title'].lower() or 
-                            search_lower in m['description'].lower() or
-                            any(search_lower in tag.lower() for tag in m['tags'])]
-        
-        # Pagination
-        start = (page - 1) * per_page
-        end = start + per_page
-        paginated_maps = filtered_maps[start:end]
-        
-        return jsonify({
-            'maps': paginated_maps,
-            'total': len(filtered_maps),
-            'page': page,
-            'per_page': per_page,
-            'pages': (len(filtered_maps) + per_page - 1) // per_page
-        })
+        per_page = int(request.args.get('per_page', app.config['API_MAX_PER_PAGE']))
+        fields = parse_fields(request.args.get('fields', ''))
+        sort = parse_sort(request.args.get('sort', ''))
+        cursor = request.args.get('cursor', '')
+        if page < 1 or per_page < 1:
+            raise ValueError('page and per_page must be positive')
+        per_page = min(per_page, app.config['API_MAX_PER_PAGE'])
+        
+        offset = (page - 1) * per_page
+        after = None
+        if cursor:
+            position = decode_cursor(cursor, sort)
+            if sort is None:
+                offset = position
+            else:
+                offset, after = 0, position
+        
+        # Live counts only matter when ordering by views or returning them
+        with phase('views'):
+            views = live_views(fields)
+            if views is None and sort and sort[0] == 'views':
+                views = view_counter.counts()
+        
+        def build():
+            return maps_page(catalog, fields, category, search, page, per_page,
+                             sort, offset, after, views)
+        
+        # Views change without touching the catalog: validate on the view
+        # total instead of Last-Modified when ordering by them or returning them
+        if views is None:
+            version, last_modified = (catalog.version,), catalog.last_modified
+        else:
+            version, last_modified = (catalog.version, view_counter.total()), None
+        return conditional_json(build, *version, last_modified=last_modified,
+                                cache_key=(category, search.strip().lower(), page, per_page, fields,
+                                           sort, cursor))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -258,50 +329,135 @@ def get_maps():
 def get_categories():
     """API endpoint to get all modes (2D and Interactive)"""
     try:
+        catalog = catalog_store.get()
         # Return modes instead of thematic categories
-        modes = ['Toutes', '2d', 'interactive']
-        return jsonify(modes)
+        return conditional_json(lambda: GALLERY_MODES, catalog.version, last_modified=catalog.last_modified)
     except Exception as e:
         return jsonify(['Toutes'])
 
 @app.route('/api/maps/<map_id>')
 def get_map(map_id):
     """API endpoint to get a specific map by ID"""
-    map_data = next((m for m in MAPS_DATA if m['id'] == map_id), None)
+    catalog = catalog_store.get()
+    map_data = catalog.get(map_id)
     if map_data:
-        return jsonify(map_data)
+        views = view_counter.count(map_id)
+        return conditional_json(lambda: dict(map_data, views=views), catalog.version, views)
     return jsonify({'error': 'Map not found'}), 404
 
+@app.route('/api/maps/trending')
+def get_trending_maps():
+    """API endpoint to get the most viewed maps over a recent window"""
+    try:
+        catalog = catalog_store.get()
+        window = parse_window(request.args.get('window', ''))
+        limit = int(request.args.get('limit', 12))
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        limit = min(limit, app.config['API_MAX_PER_PAGE'])
+        fields = parse_fields(request.args.get('fields', ''))
+        views = live_views(fields)
+
+        def build():
+            ranked = []
+            for map_id, recent in view_analytics.trending(window):
+                record = catalog.get(map_id)
+                # Views of maps since removed from the catalog are skipped
+                if record is not None:
+                    ranked.append((record, recent))
+                    if len(ranked) == limit:
+                        break
+            cards = catalog.project([record for record, _ in ranked], fields, views)
+            return {
+                'window': window,
+                'maps': [dict(card, recent_views=recent) for card, (_, recent) in zip(cards, ranked)],
+            }
+
+        version = (catalog.version, view_analytics.version)
+        if views is not None:
+            version += (view_counter.total(),)
+        return conditional_json(build, *version)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/maps/<map_id>/views')
+def get_map_views(map_id):
+    """API endpoint to get a map's views per hour (24h) or per day (7d, 30d)"""
+    try:
+        catalog = catalog_store.get()
+        if catalog.get(map_id) is None:
+            return jsonify({'error': 'Map not found'}), 404
+        window = parse_window(request.args.get('range', ''))
+
+        def build():
+            series = view_analytics.series(map_id, window)
+            return {
+                'id': catalog.get(map_id)['id'],
+                'range': window,
+                'total': sum(views for _, views in series),
+                'series': [{'start': start, 'views': views} for start, views in series],
+            }
+
+        return conditional_json(build, catalog.version, view_analytics.version)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/maps/<map_id>/related')
+def get_related_maps(map_id):
+    """API endpoint to get the maps most similar to a map, best first"""
+    try:
+        catalog = catalog_store.get()
+        if catalog.get(map_id) is None:
+            return jsonify({'error': 'Map not found'}), 404
+        limit = int(request.args.get('limit', 6))
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        limit = min(limit, app.config['RELATED_TOP_K'])
+        fields = parse_fields(request.args.get('fields', ''))
+        views = live_views(fields)
+
+        def build():
+            related = related_index.related(catalog, map_id, limit)
+            cards = catalog.project([record for record, _ in related], fields, views)
+            # Projected cards are shared between requests: copy before adding the score
+            return {
+                'id': catalog.get(map_id)['id'],
+                'maps': [dict(card, score=score) for card, (_, score) in zip(cards, related)],
+            }
+
+        if views is not None:
+            return conditional_json(build, catalog.version, view_counter.total())
+        return conditional_json(build, catalog.version, last_modified=catalog.last_modified)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def view_client():
+    """Identity of the visitor for view deduplication (hashed, never stored)"""
+    # remote_addr comes from the socket, or from X-Forwarded-For as set by
+    # the PROXY_HOPS trusted proxies (ProxyFix): clients cannot spoof it
+    return f"{request.remote_addr} {request.user_agent.string}"
+
 @app.route('/api/maps/<map_id>/view', methods=['POST'])
 def increment_view(map_id):
     """API endpoint to increment view count for a map"""
     try:
-        import json
-        import os
-        
-        json_path = os.path.join(app.static_folder, 'data', 'maps.json')
-        
-        # Load current data
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # Find and update the map
-        map_found = False
-        for map_item in data['maps']:
-            if str(map_item['id']) == str(map_id):
-                map_item['views'] += 1
-                map_found = True
-                new_views = map_item['views']
-                break
-        
-        if not map_found:
+        if catalog_store.get().get(map_id) is None:
             return jsonify({'error': 'Map not found'}), 404
         
-        # Save updated data back to file
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # Repeats from the same visitor never reach the counters
+        if app.config['VIEW_DEDUP_ENABLED'] and view_dedup.seen(view_client(), map_id):
+            return jsonify({'views': view_counter.count(map_id), 'counted': False})
         
-        return jsonify({'views': new_views})
+        new_views = view_counter.record(map_id)
+        view_analytics.record(map_id)
+        
+        return jsonify({'views': new_views, 'counted': True})
         
     except Exception as e:
         print(f"Error incrementing view for map {map_id}: {e}")
@@ -311,54 +467,25 @@ def increment_view(map_id):
 def get_stats():
     """API endpoint to get gallery statistics"""
     try:
-        # Load data from JSON file like the maps API
-        import json
-        import os
-        
-        json_path = os.path.join(app.static_folder, 'data', 'maps.json')
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        maps_data = data.get('maps', [])
-        categories_data = data.get('categories', [])
-        
-        total_maps = len(maps_data)
-        total_categories = len(categories_data) if categories_data else len(set(m.get('category', '') for m in maps_data))
-        total_views = sum(m.get('views', 0) for m in maps_data)
-        avg_rating = sum(m.get('rating', 0) for m in maps_data) / total_maps if total_maps > 0 else 0
-        
-        # Technology distribution (if available)
-        tech_count = {}
-        for map_data in maps_data:
-            technologies = map_data.get('technologies', [])
-            for tech in technologies:
-                tech_count[tech] = tech_count.get(tech, 0) + 1
-        
-        # Category distribution
-        category_count = {}
-        for map_data in maps_data:
-            category = map_data.get('category', 'Uncategorized')
-            category_count[category] = category_count.get(category, 0) + 1
-        
-        return jsonify({
-            'total_maps': total_maps,
-            'total_categories': total_categories,
-            'total_views': total_views,
-            'average_rating': round(avg_rating, 1),
-            'technology_distribution': tech_count,
-            'category_distribution': category_count
-        })
+        catalog = catalog_store.get()
+        
+        def build():
+            stats = gallery_stats()
+            if app.config['VIEW_DEDUP_ENABLED']:
+                stats['view_dedup'] = view_dedup.stats()
+            return stats
+        
+        # Views change without touching maps.json: validate on the view
+        # total instead of Last-Modified (the dedup filters only fill up
+        # with counted views, and are reset when their window rotates)
+        return conditional_json(build, catalog.version, view_counter.total(),
+                                view_dedup.current_window())
     except Exception as e:
         print(f"Error loading stats: {e}")
-        # Fallback to hardcoded data if JSON loading fails
-        total_maps = len(MAPS_DATA)
-        total_views = sum(m.get('views', 0) for m in MAPS_DATA)
-        avg_rating = sum(m.get('rating', 0) for m in MAPS_DATA) / total_maps if total_maps > 0 else 0
-        
         return jsonify({
-            'total_maps': total_maps,
-            'total_views': total_views,
-            'average_rating': round(avg_rating, 1),
+            'total_maps': 0,
+            'total_views': 0,
+            'average_rating': 0.0,
             'error': str(e)
         })
 
@@ -374,31 +501,8 @@ def submit_contact_form():
             if not data.get(field):
                 return jsonify({'error': f'Le champ {field} est requis'}), 400
         
-        # Save contact message to file (in production, you'd send an email)
-        import json
-        import os
-        from datetime import datetime
-        
-        contact_data = {
-            'timestamp': datetime.now().isoformat(),
-            'name': data['name'],
-            'email': data['email'],
-            'subject': data['subject'],
-            'message': data['message']
-        }
-        
-        # Create contact messages directory if it doesn't exist
-        contact_dir = os.path.join(app.static_folder, 'data', 'contacts')
-        os.makedirs(contact_dir, exist_ok=True)
-        
-        # Save to JSON file
-        contact_file = os.path.join(contact_dir, f"contact_{int(datetime.now().timestamp())}.json")
-        with open(contact_file, 'w', encoding='utf-8') as f:
-            json.dump(contact_data, f, ensure_ascii=False, indent=2)
-        
-        # In a real application, you would send an email here
-        # For now, we'll just log it
-        print(f"Nouveau message de contact reçu de {data['name']} ({data['email']})")
+        # Queue the message durably; delivery happens in the background
+        contact_queue.enqueue(data)
         
         return jsonify({
             'success': True,
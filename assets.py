@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Content-hashed static assets.
+
+`build()` copies every file under static/css, static/js and static/images
+(plus the logos and favicon at the top of static/) to static/dist/ with a
+content hash in its name (css/main.css -> dist/css/main.3f2a9c1be0.css) and
+writes static/dist/manifest.json mapping logical paths to hashed ones. A
+hashed URL never changes content, so nginx serves static/dist/ as immutable
+for a year: no revalidation round-trips.
+
+`AssetManifest` resolves paths at runtime and falls back to the original
+path for files that are not in the manifest (or before the first build), so
+the site works unchanged without a build. Templates use `asset_url()`, and
+the catalog stores resolve maps.json image URLs through the same manifest.
+
+Usage:
+    python assets.py            # build static/dist and the manifest
+    python assets.py --check    # exit 1 if the manifest is out of date
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+try:
+    import brotli
+except ImportError:  # brotli is optional: .gz siblings only
+    brotli = None
+
+from view_counter import atomic_write_json
+
+ASSET_ROOTS = ('css', 'js', 'images')
+OUTPUT_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 10
+STATIC_URL_PREFIX = '/static/'
+# Text assets get precompressed .gz/.br siblings for nginx's gzip_static
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg')
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(rel_path, digest):
+    stem, ext = os.path.splitext(rel_path)
+    return f"{OUTPUT_DIR}/{stem}.{digest}{ext}"
+
+
+def iter_assets(static_dir, roots=ASSET_ROOTS):
+    """Yield logical paths ('css/main.css', ...) of the files to fingerprint."""
+    for entry in sorted(os.scandir(static_dir), key=lambda e: e.name):
+        if entry.is_file() and not entry.name.startswith('.'):
+            yield entry.name
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(static_dir, root)):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+            for name in sorted(filenames):
+                # Skip hidden files and the image optimizers' own manifests
+                if name.startswith('.') or name == MANIFEST_NAME:
+                    continue
+                path = os.path.join(dirpath, name)
+                yield os.path.relpath(path, static_dir).replace(os.sep, '/')
+
+
+def _copy_atomic(src, dst):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dst), prefix='.tmp-')
+    os.close(fd)
+    try:
+        # A copy, not a hard link: optimizers rewrite sources in place and
+        # must never alter a file already published under an immutable URL
+        shutil.copy2(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _write_compressed_siblings(path):
+    with open(path, 'rb') as f:
+        body = f.read()
+    siblings = [(path + '.gz', gzip.compress(body, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        siblings.append((path + '.br', brotli.compress(body, quality=11)))
+    for target, data in siblings:
+        with open(target, 'wb') as f:
+            f.write(data)
+
+
+def manifest_version(files):
+    return hashlib.sha1(json.dumps(files, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def read_manifest(static_dir):
+    try:
+        with open(os.path.join(static_dir, OUTPUT_DIR, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def build(static_dir, roots=ASSET_ROOTS):
+    """Fingerprint assets into static/dist; return (manifest, copied, removed).
+
+    Hashed files from the previous manifest are kept so pages rendered just
+    before the build can still load their assets; older ones are removed.
+    """
+    previous = read_manifest(static_dir).get('files', {})
+    files = {}
+    copied = 0
+    for rel_path in iter_assets(static_dir, roots):
+        target = hashed_name(rel_path, file_digest(os.path.join(static_dir, rel_path)))
+        files[rel_path] = target
+        target_path = os.path.join(static_dir, target)
+        if not os.path.exists(target_path):
+            _copy_atomic(os.path.join(static_dir, rel_path), target_path)
+            if target_path.endswith(COMPRESSIBLE_EXTENSIONS):
+                _write_compressed_siblings(target_path)
+            copied += 1
+
+    manifest = {'version': manifest_version(files), 'files': files}
+    output_dir = os.path.join(static_dir, OUTPUT_DIR)
+    os.makedirs(output_dir, exist_ok=True)
+    atomic_write_json(os.path.join(output_dir, MANIFEST_NAME), manifest)
+
+    keep = set()
+    for target in (*files.values(), *previous.values()):
+        keep.update((target, target + '.gz', target + '.br'))
+    removed = 0
+    for dirpath, _, filenames in os.walk(output_dir, topdown=False):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            rel_path = os.path.relpath(path, static_dir).replace(os.sep, '/')
+            if name != MANIFEST_NAME and rel_path not in keep:
+                os.unlink(path)
+                removed += 1
+        if dirpath != output_dir and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+    return manifest, copied, removed
+
+
+class AssetManifest:
+    """Runtime view of static/dist/manifest.json, reloaded when it changes."""
+
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self.path = os.path.join(static_dir, OUTPUT_DIR, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._files = {}
+        self._version = None
+
+    def stamp(self):
+        """Cheap change marker for the manifest file (None if absent)."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _current(self):
+        stamp = self.stamp()
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    manifest = {}
+                    if stamp is not None:
+                        try:
+                            with open(self.path, 'r', encoding='utf-8') as f:
+                                manifest = json.load(f)
+                        except ValueError:
+                            manifest = {}
+                    self._files = manifest.get('files', {})
+                    self._version = manifest.get('version')
+                    self._stamp = stamp
+        return self._files
+
+    @property
+    def version(self):
+        """Manifest version, or None when no build is present."""
+        self._current()
+        return self._version
+
+    def resolve(self, filename):
+        """Map a logical path ('css/main.css') to its hashed path, if any."""
+        return self._current().get(filename, filename)
+
+    def url(self, url):
+        """Map a '/static/...' URL to its hashed URL; other URLs pass through."""
+        if not isinstance(url, str) or not url.startswith(STATIC_URL_PREFIX):
+            return url
+        filename = url[len(STATIC_URL_PREFIX):]
+        hashed = self._current().get(filename)
+        return STATIC_URL_PREFIX + hashed if hashed else url
+
+    def has(self, url):
+        """Whether a '/static/...' URL is in the manifest."""
+        return (isinstance(url, str) and url.startswith(STATIC_URL_PREFIX) and
+                url[len(STATIC_URL_PREFIX):] in self._current())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Empreintes de contenu des fichiers statiques")
+    parser.add_argument('--static-dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+    parser.add_argument('--check', action='store_true',
+                        help="Vérifie seulement que le manifeste est à jour")
+    args = parser.parse_args()
+
+    if args.check:
+        current = read_manifest(args.static_dir).get('files', {})
+        expected = {p: hashed_name(p, file_digest(os.path.join(args.static_dir, p)))
+                    for p in iter_assets(args.static_dir)}
+        if current != expected:
+            print("❌ Manifeste obsolète: lancez python assets.py")
+            return 1
+        print("✅ Manifeste à jour")
+        return 0
+
+    print("🔖 Empreintes des fichiers statiques")
+    manifest, copied, removed = build(args.static_dir)
+    print(f"✅ {len(manifest['files'])} fichiers, {copied} copiés, {removed} supprimés "
+          f"(version {manifest['version']})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
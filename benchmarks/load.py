@@ -0,0 +1,122 @@
+"""
+Test de charge de l'application Flask via un serveur WSGI local.
+
+L'application tourne dans un sous-processus (serveur Werkzeug multi-thread)
+pointé sur un catalogue synthétique et un dossier instance jetable, puis
+plusieurs clients HTTP concurrents rejouent un mélange de requêtes réalistes.
+On rapporte p50/p95/p99 et le débit par scénario.
+"""
+import http.client
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from micro import percentile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (nom, poids, méthode, chemin) ; {id} est remplacé par un id de carte
+SCENARIOS = (
+    ('list_cards', 30, 'GET', '/api/maps?fields=card&per_page=24'),
+    ('list_mode_sorted', 15, 'GET', '/api/maps?category=2d&sort=-views&per_page=24'),
+    ('search', 20, 'GET', '/api/maps?search=carte%20pop&fields=id'),
+    ('map_detail', 15, 'GET', '/api/maps/{id}'),
+    ('stats', 10, 'GET', '/api/stats'),
+    ('view', 10, 'POST', '/api/maps/{id}/view'),
+)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve(port):
+    """Point d'entrée du sous-processus serveur."""
+    sys.path.insert(0, REPO_DIR)
+    from werkzeug.serving import make_server
+    from app import app
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+
+def start_server(catalog_path, instance_dir, backend='json'):
+    port = free_port()
+    env = dict(os.environ, MAPS_JSON_PATH=os.path.abspath(catalog_path),
+               INSTANCE_PATH=os.path.abspath(instance_dir), CATALOG_BACKEND=backend,
+               PRERENDER='0', RELATED_PRECOMPUTE='0', VIEW_DEDUP='0')
+    process = subprocess.Popen(
+        [sys.executable, '-c', f'import sys; sys.path.insert(0, {os.path.dirname(__file__)!r}); '
+                               f'import load; load.serve({port})'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("le serveur s'est arrêté au démarrage")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            conn.request('GET', '/api/categories')
+            conn.getresponse().read()
+            return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("le serveur n'a pas démarré à temps")
+
+
+def client(port, map_ids, duration, seed, results):
+    rng = random.Random(seed)
+    weights = [s[1] for s in SCENARIOS]
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        name, _, method, path = rng.choices(SCENARIOS, weights)[0]
+        path = path.replace('{id}', str(rng.choice(map_ids)))
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, headers={'Accept-Encoding': 'gzip, br'})
+            response = conn.getresponse()
+            response.read()
+            ok = response.status < 500
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            ok = False
+        results.append((name, time.perf_counter() - start, ok))
+    conn.close()
+
+
+def run_load(catalog_path, instance_dir, map_ids, clients=8, duration=10.0, backend='json'):
+    """Lance le serveur, exécute les clients, retourne les stats par scénario."""
+    process, port = start_server(catalog_path, instance_dir, backend)
+    try:
+        results = []
+        threads = [threading.Thread(target=client, args=(port, map_ids, duration, i, results))
+                   for i in range(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+
+    report = {}
+    for name in [s[0] for s in SCENARIOS] + ['all']:
+        rows = [r for r in results if name == 'all' or r[0] == name]
+        latencies = sorted(r[1] * 1000 for r in rows)
+        report[name] = {
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'rps': len(rows) / elapsed,
+            'errors': sum(1 for r in rows if not r[2]),
+            'n': len(rows),
+        }
+    return report
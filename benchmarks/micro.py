@@ -0,0 +1,103 @@
+"""
+Micro-benchmarks des chemins critiques du catalogue.
+
+Chaque mesure répète une opération et rapporte p50/p95/p99 en
+microsecondes : chargement de maps.json, recherche, filtrage + pagination,
+tri, statistiques et incrément de vue (JSON ou SQLite).
+"""
+import os
+import random
+import statistics
+import time
+
+from catalog import Catalog, CatalogStore
+from catalog_sqlite import SqliteCatalogStore, SqliteViewCounter
+from view_counter import ViewCounter
+
+from synthetic import TAGS, WORDS
+
+SEARCH_QUERIES = ('carte', 'population europe', 'satel', 'climat', 'réseau urbain', 'nasa')
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, round(p / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def summarize(samples_ns):
+    values = sorted(v / 1000 for v in samples_ns)
+    return {
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'mean': statistics.fmean(values),
+        'n': len(values),
+    }
+
+
+def measure(operation, repeat, budget=2.0):
+    """Time `operation()` up to `repeat` times (or `budget` seconds)."""
+    samples = []
+    deadline = time.perf_counter() + budget
+    for i in range(repeat):
+        start = time.perf_counter_ns()
+        operation()
+        samples.append(time.perf_counter_ns() - start)
+        if time.perf_counter() > deadline and i >= 2:
+            break
+    return summarize(samples)
+
+
+def bench_json(catalog_path, workdir, repeat=200):
+    """Backend JSON : Catalog en mémoire + ViewCounter à journal."""
+    with open(catalog_path, 'rb') as f:
+        raw = f.read()
+    results = {'load': measure(lambda: Catalog.from_bytes(raw), max(3, repeat // 50), budget=10.0)}
+
+    store = CatalogStore(catalog_path)
+    catalog = store.get()
+    results.update(_bench_queries(catalog, repeat))
+    results['stats'] = measure(lambda: catalog.stats.as_dict(total_views=0), repeat)
+
+    counter = ViewCounter(store, os.path.join(workdir, 'views.log'))
+    ids = [m['id'] for m in catalog.maps]
+    rng = random.Random(1)
+    results['view_increment'] = measure(lambda: counter.record(rng.choice(ids)), repeat * 5)
+    counter.flush()
+    return results
+
+
+def bench_sqlite(catalog_path, workdir, repeat=200):
+    """Backend SQLite : import, puis requêtes indexées et UPDATE par vue."""
+    db_path = os.path.join(workdir, 'catalog.sqlite3')
+    start = time.perf_counter_ns()
+    store = SqliteCatalogStore(db_path, catalog_path)
+    catalog = store.get()
+    results = {'load': summarize([time.perf_counter_ns() - start])}
+    results.update(_bench_queries(catalog, repeat))
+    results['stats'] = measure(lambda: catalog.stats.as_dict(total_views=0), repeat)
+
+    counter = SqliteViewCounter(store)
+    ids = list(range(1, len(catalog) + 1))
+    rng = random.Random(1)
+    results['view_increment'] = measure(lambda: counter.record(rng.choice(ids)), repeat * 5)
+    return results
+
+
+def _bench_queries(catalog, repeat):
+    rng = random.Random(0)
+    queries = list(SEARCH_QUERIES) + [w[:4] for w in rng.sample(WORDS, 6)] + [t.lower() for t in TAGS[:6]]
+    total = len(catalog)
+    pages = max(1, total // 24)
+    return {
+        'search': measure(lambda: catalog.query(search=rng.choice(queries), limit=24), repeat),
+        'filter_page': measure(
+            lambda: catalog.query(mode=rng.choice(('2d', 'interactive')),
+                                  offset=24 * rng.randrange(pages) // 2, limit=24), repeat),
+        'sort_title_page': measure(
+            lambda: catalog.query(sort=('title', False), offset=24 * rng.randrange(pages), limit=24),
+            repeat),
+        'get_by_id': measure(lambda: catalog.get(rng.randint(1, total)), repeat),
+    }
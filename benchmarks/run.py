@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Suite de benchmarks reproductible de l'API.
+
+Génère des catalogues synthétiques (17, 1k, 10k, 100k cartes), lance les
+micro-benchmarks du catalogue puis un test de charge HTTP, et compare les
+résultats à une référence enregistrée (benchmarks/baseline.json).
+
+Usage:
+    python benchmarks/run.py                              # tout, toutes tailles
+    python benchmarks/run.py --sizes 17 1000 --no-load    # micro-benchmarks seuls
+    python benchmarks/run.py --backend sqlite
+    python benchmarks/run.py --save-baseline              # avant un changement
+    python benchmarks/run.py --compare                    # après : échoue si régression
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from load import run_load  # noqa: E402
+from micro import bench_json, bench_sqlite  # noqa: E402
+from synthetic import write_catalog  # noqa: E402
+
+SIZES = (17, 1000, 10000, 100000)
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+REGRESSION_THRESHOLD = 0.20  # +20 % de latence (ou -20 % de débit) = régression
+
+
+def flatten(results):
+    """{'1000/micro/search/p95': 12.3, ...} pour la comparaison."""
+    flat = {}
+    for size, sections in results.items():
+        for section, metrics in sections.items():
+            for name, values in metrics.items():
+                for stat in ('p50', 'p95', 'p99', 'rps'):
+                    if stat in values:
+                        flat[f"{size}/{section}/{name}/{stat}"] = values[stat]
+    return flat
+
+
+def compare(current, baseline, threshold):
+    """Affiche les écarts et retourne la liste des régressions."""
+    regressions = []
+    print(f"\n{'métrique':<48} {'référence':>12} {'actuel':>12} {'écart':>8}")
+    for key in sorted(set(current) & set(baseline)):
+        before, after = baseline[key], current[key]
+        if not before:
+            continue
+        change = (after - before) / before
+        # Le débit doit monter, les latences doivent baisser
+        worse = -change if key.endswith('/rps') else change
+        flag = '❌' if worse > threshold else ('✅' if worse < -threshold else '  ')
+        print(f"{key:<48} {before:>12.2f} {after:>12.2f} {change:>+7.0%} {flag}")
+        if worse > threshold:
+            regressions.append(key)
+    return regressions
+
+
+def print_section(title, metrics, unit):
+    print(f"\n  {title} ({unit})")
+    for name, v in metrics.items():
+        extra = f"  {v['rps']:8.1f} req/s  erreurs={v['errors']}" if 'rps' in v else ''
+        print(f"    {name:<18} p50={v['p50']:10.2f}  p95={v['p95']:10.2f}  p99={v['p99']:10.2f}{extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks du catalogue et de l'API")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    parser.add_argument('--backend', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--repeat', type=int, default=200, help="Répétitions par micro-benchmark")
+    parser.add_argument('--no-micro', dest='micro', action='store_false')
+    parser.add_argument('--no-load', dest='load', action='store_false')
+    parser.add_argument('--clients', type=int, default=8, help="Clients HTTP concurrents")
+    parser.add_argument('--duration', type=float, default=10.0, help="Durée du test de charge (s)")
+    parser.add_argument('--output', help="Écrire les résultats bruts (JSON) dans ce fichier")
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    print(f"⏱️  Benchmarks ({args.backend}) — Python {platform.python_version()}, "
+          f"{os.cpu_count()} CPU")
+    print("=" * 60)
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='geovis-bench-') as workdir:
+        for size in args.sizes:
+            print(f"\n🗺️  {size} cartes")
+            size_dir = os.path.join(workdir, str(size))
+            os.makedirs(size_dir)
+            catalog_path = write_catalog(os.path.join(size_dir, 'maps.json'), size)
+            results[size] = {}
+
+            if args.micro:
+                bench = bench_sqlite if args.backend == 'sqlite' else bench_json
+                micro_dir = os.path.join(size_dir, 'micro')
+                os.makedirs(micro_dir)
+                results[size]['micro'] = bench(catalog_path, micro_dir, args.repeat)
+                print_section('micro-benchmarks', results[size]['micro'], 'µs')
+
+            if args.load:
+                instance_dir = os.path.join(size_dir, 'instance')
+                results[size]['load'] = run_load(
+                    catalog_path, instance_dir, list(range(1, size + 1)),
+                    args.clients, args.duration, args.backend)
+                print_section(f'charge HTTP, {args.clients} clients', results[size]['load'], 'ms')
+
+    flat = flatten(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'backend': args.backend,
+                       'python': platform.python_version(), 'cpus': os.cpu_count(),
+                       'metrics': flat}, f, indent=2, sort_keys=True)
+        print(f"\n📝 Référence enregistrée: {args.baseline}")
+
+    if args.compare:
+        try:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            print(f"❌ Pas de référence: lancez d'abord --save-baseline ({args.baseline})")
+            return 2
+        regressions = compare(flat, baseline['metrics'], args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} régression(s) au-delà de {args.threshold:.0%}")
+            return 1
+        print("\n✅ Aucune régression")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
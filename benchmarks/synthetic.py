@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Génère des catalogues maps.json synthétiques pour les benchmarks.
+
+Les entrées ont la même forme que les vraies cartes (description en
+plusieurs paragraphes, images et vidéos, fonctionnalités, tags,
+grille MacEachren) et sont déterministes pour une graine donnée.
+
+Usage:
+    python benchmarks/synthetic.py 10000 /tmp/maps-10k.json
+"""
+import argparse
+import json
+import random
+
+MODES = ('2d', 'interactive')
+CATEGORIES = (
+    'Biologie / Écologie', 'Climatologie', 'Démographie', 'Développement Durable',
+    'Environnement', 'Géologie / Risques Naturels', 'Géopolitique',
+    'Infrastructure & Géopolitique', 'Technologie', 'Transport',
+    'Transport / Qualité de vie', 'Urbanisme & Environnement',
+)
+DIFFICULTIES = ('Grand Public', 'Facile', 'Débutant', 'Intermédiaire', 'Avancé')
+TAGS = (
+    'Population', 'Europe', 'Climat', 'Télédétection', 'SIG', 'NASA', 'Mobilité',
+    'Urbanisme', 'Énergie', 'Biodiversité', 'Océans', 'Séismes', 'Volcans',
+    'Élections', 'Migration', 'Agriculture', 'Eau', 'Forêts', 'Transport',
+    'Statistiques', 'Cartogramme', 'Temps réel', 'Afrique', 'Asie', 'Amériques',
+)
+AUTHORS = ('Our World in Data', 'NASA', 'Eurostat', 'IGN', 'Landgeist', 'ESA',
+           'Copernicus', 'OpenStreetMap', 'INSEE', 'Banque mondiale')
+WORDS = (
+    'carte', 'données', 'visualisation', 'territoire', 'population', 'évolution',
+    'analyse', 'mondiale', 'régionale', 'interactive', 'échelle', 'densité',
+    'réseau', 'satellite', 'couche', 'temporelle', 'spatiale', 'indicateur',
+    'projection', 'légende', 'symbologie', 'choroplèthe', 'flux', 'frontières',
+    'risques', 'climatique', 'urbaine', 'rurale', 'observation', 'série',
+    'comparaison', 'exploration', 'filtrage', 'navigation', 'zoom', 'export',
+    'tendance', 'géographique', 'environnement', 'ressources', 'infrastructure',
+)
+
+
+def sentence(rng, n_min=8, n_max=20):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(n_min, n_max))]
+    return words[0].capitalize() + ' ' + ' '.join(words[1:]) + '.'
+
+
+def paragraph(rng, sentences=(2, 5)):
+    return ' '.join(sentence(rng) for _ in range(rng.randint(*sentences)))
+
+
+def make_map(rng, map_id):
+    slug = f"map-{map_id}"
+    images = [{'url': f"/static/images/{slug}/vue-{i}.png", 'title': sentence(rng, 2, 4)[:-1]}
+              for i in range(rng.randint(2, 6))]
+    if rng.random() < 0.3:
+        images.append({'url': f"/static/videos/{slug}.webm", 'title': 'Démonstration', 'type': 'video'})
+    return {
+        'id': map_id,
+        'mode': rng.choice(MODES),
+        'title': sentence(rng, 3, 8)[:-1],
+        'description': [paragraph(rng) for _ in range(rng.randint(1, 4))],
+        'thumbnail': f"/static/images/thumbnails/{slug}.png",
+        'images': images,
+        'url': f"https://example.org/{slug}",
+        'category': rng.choice(CATEGORIES),
+        'difficulty': rng.choice(DIFFICULTIES),
+        'auteur': rng.choice(AUTHORS),
+        'sources': rng.sample(AUTHORS, rng.randint(1, 3)),
+        'fonctionalites': [sentence(rng, 5, 12) for _ in range(rng.randint(3, 7))],
+        'analyse': paragraph(rng, (3, 6)),
+        'critique': paragraph(rng, (2, 4)),
+        'avis': paragraph(rng, (1, 2)),
+        'tags': rng.sample(TAGS, rng.randint(3, 6)),
+        'maceachren': {k: rng.randint(0, 100) for k in ('communication', 'task', 'interaction')},
+    }
+
+
+def generate_catalog(size, seed=0):
+    rng = random.Random(seed)
+    return {'maps': [make_map(rng, i) for i in range(1, size + 1)]}
+
+
+def write_catalog(path, size, seed=0):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(generate_catalog(size, seed), f, ensure_ascii=False, indent=2)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère un maps.json synthétique")
+    parser.add_argument('size', type=int, help="Nombre de cartes")
+    parser.add_argument('output', help="Fichier de sortie")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_catalog(args.output, args.size, args.seed)
+    print(f"✅ {args.size} cartes écrites dans {args.output}")
+
+if __name__ == "__main__":
+    main()
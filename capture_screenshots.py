@@ -1,137 +1,459 @@
 #!/usr/bin/env python3
 """
 Script pour capturer automatiquement les screenshots des cartes interactives
+
+Les captures tournent en parallèle dans un pool de contextes navigateur
+isolés (un seul Chromium). Au lieu de pauses fixes, chaque page est capturée
+dès qu'elle est prête (réseau au repos, images chargées, canvas dessinés).
+La bannière cookies est fermée en une seule passe, et les échecs sont
+retentés avec un délai croissant. maps.json est mis à jour atomiquement à
+la fin.
+
+En mode --incremental, un fichier d'état (instance/capture_state.json)
+conserve pour chaque carte la date de capture, les validateurs HTTP
+(ETag/Last-Modified, ou à défaut l'empreinte du HTML) et un hash perceptuel
+du dernier screenshot. Seules les pages modifiées ou trop anciennes sont
+recapturées, seuls les thumbnails dont le hash perceptuel a bougé sont
+réécrits, et seuls ceux-là repassent par optimize_thumbnails.py.
+
+Usage:
+    python capture_screenshots.py                     # toutes les cartes
+    python capture_screenshots.py --only 3 10         # certaines cartes
+    python capture_screenshots.py --concurrency 6
+    python capture_screenshots.py --incremental       # rafraîchissement nocturne
+    python capture_screenshots.py --maps-json fixtures/maps.json --output-dir /tmp/shots
+
+Vérification hors ligne du moteur (pages de fixtures/screenshots) :
+    python fixtures/screenshots/check.py
 """
-import json
-import os
+import argparse
 import asyncio
+import hashlib
+import io
+import json
+import time
+import urllib.error
+import urllib.request
 from pathlib import Path
+from PIL import Image
 from playwright.async_api import async_playwright
 
+from optimize_thumbnails import apply_to_catalog, optimize_files, write_atomic
+from view_counter import atomic_write_json, catalog_lock_path, update_catalog_json
+
 # Configuration
 SCRIPT_DIR = Path(__file__).parent
 MAPS_JSON = SCRIPT_DIR / 'static' / 'data' / 'maps.json'
 THUMBNAILS_DIR = SCRIPT_DIR / 'static' / 'images' / 'thumbnails'
+# Même verrou que l'application et optimize_gallery.py (dossier instance,
+# INSTANCE_PATH) : maps.json n'est jamais réécrit en parallèle
+CATALOG_LOCK = Path(catalog_lock_path())
+STATE_PATH = SCRIPT_DIR / 'instance' / 'capture_state.json'
 SCREENSHOT_WIDTH = 1200
 SCREENSHOT_HEIGHT = 800
 
+CONCURRENCY = 4  # Contextes navigateur en parallèle
+NAVIGATION_TIMEOUT = 30000  # ms
+NETWORK_IDLE_TIMEOUT = 8000  # ms : certaines cartes ne sont jamais « idle » (websockets)
+PAINT_TIMEOUT = 8000  # ms
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 1.5  # s, doublé à chaque nouvel essai
+
+# Mode incrémental
+MAX_AGE_DAYS = 7  # Recapture forcée au-delà de cet âge, même sans changement détecté
+CHECK_TIMEOUT = 15  # s, requête de vérification des validateurs HTTP
+PHASH_THRESHOLD = 4  # Bits différents (sur 64) en dessous desquels l'image est « identique »
+
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+COOKIE_BUTTON_TEXTS = [
+    'accept', 'accept all', 'accepter', 'tout accepter', "j'accepte",
+    'ok', 'i agree', 'agree', 'allow', 'allow all',
+]
+COOKIE_SELECTORS = [
+    '[id*="accept"]',
+    '[class*="accept"]',
+    '[class*="cookie"] button',
+    '.cookie-consent button',
+    '#cookie-consent button',
+    'button[aria-label*="Accept"]',
+    'button[aria-label*="Accepter"]',
+]
+
+# Une seule passe dans la page : premier bouton visible dont le texte ou le
+# sélecteur correspond à une bannière cookies
+DISMISS_COOKIES_JS = """
+([texts, selectors]) => {
+    const visible = (el) => {
+        const rect = el.getBoundingClientRect();
+        return rect.width > 0 && rect.height > 0;
+    };
+    const buttons = Array.from(document.querySelectorAll('button, [role="button"], a'));
+    let target = buttons.find(el => visible(el) &&
+        texts.includes((el.innerText || '').trim().toLowerCase()));
+    if (!target) {
+        target = selectors
+            .flatMap(sel => Array.from(document.querySelectorAll(sel)))
+            .find(visible);
+    }
+    if (target) {
+        target.click();
+        return true;
+    }
+    return false;
+}
+"""
+
+# La page est « peinte » quand ses images visibles sont chargées et qu'au
+# moins un grand canvas (carte WebGL/2D) contient autre chose que du vide
+PAINTED_JS = """
+() => {
+    const images = Array.from(document.images).filter(img => img.offsetWidth > 0);
+    if (images.some(img => !img.complete)) return false;
+    const canvases = Array.from(document.querySelectorAll('canvas'))
+        .filter(c => c.width >= 100 && c.height >= 100);
+    if (canvases.length === 0) return true;
+    return canvases.some(c => {
+        try {
+            return c.toDataURL('image/png').length > 5000;
+        } catch (e) {
+            return true;  // canvas « tainted » : il a donc été dessiné
+        }
+    });
+}
+"""
+
+
 async def accept_cookies(page):
-    """Tente d'accepter les cookies sur la page"""
-    cookie_selectors = [
-        'button:has-text("Accept")',
-        'button:has-text("Accept all")',
-        'button:has-text("Accepter")',
-        'button:has-text("Tout accepter")',
-        'button:has-text("J\'accepte")',
-        'button:has-text("OK")',
-        'button:has-text("I agree")',
-        'button:has-text("Agree")',
-        'button:has-text("Allow")',
-        'button:has-text("Allow all")',
-        '[id*="accept"]',
-        '[class*="accept"]',
-        '[class*="cookie"] button',
-        '.cookie-consent button',
-        '#cookie-consent button',
-        'button[aria-label*="Accept"]',
-        'button[aria-label*="Accepter"]',
-    ]
-    
-    for selector in cookie_selectors:
+    """Tente d'accepter les cookies sur la page (toutes les frames, une passe)"""
+    for frame in page.frames:
         try:
-            await page.click(selector, timeout=2000)
-            print("  ✓ Cookies acceptés")
-            await asyncio.sleep(1)
-            return True
-        except:
+            if await frame.evaluate(DISMISS_COOKIES_JS, [COOKIE_BUTTON_TEXTS, COOKIE_SELECTORS]):
+                print("  ✓ Cookies acceptés")
+                return True
+        except Exception:
             continue
     return False
 
-async def capture_screenshot(page, url, output_path, map_id):
-    """Capture un screenshot d'une URL donnée"""
+
+async def wait_until_ready(page):
+    """Attend que la page soit prête plutôt qu'un délai fixe"""
+    try:
+        await page.wait_for_load_state('networkidle', timeout=NETWORK_IDLE_TIMEOUT)
+    except Exception:
+        pass
+    try:
+        await page.wait_for_function(PAINTED_JS, timeout=PAINT_TIMEOUT, polling=250)
+    except Exception:
+        pass
+    # Laisser passer deux frames d'animation après la dernière modification
+    await page.evaluate("() => new Promise(r => requestAnimationFrame(() => requestAnimationFrame(r)))")
+
+
+async def capture_screenshot(page, url, map_id):
+    """Capture un screenshot d'une URL donnée (retourne le PNG)"""
+    print(f"📸 Capture de la carte {map_id}: {url}")
+
+    # Naviguer vers l'URL ; une erreur HTTP est retentée, pas capturée
+    response = await page.goto(url, wait_until='domcontentloaded', timeout=NAVIGATION_TIMEOUT)
+    if response is not None and response.status >= 400:
+        raise RuntimeError(f"HTTP {response.status}")
+    await wait_until_ready(page)
+
+    # Tenter d'accepter les cookies, puis attendre que la bannière disparaisse
+    if await accept_cookies(page):
+        await wait_until_ready(page)
+
+    # Prendre le screenshot
+    return await page.screenshot(full_page=False)
+
+
+class ContextPool:
+    """Pool borné de contextes navigateur isolés"""
+
+    def __init__(self, browser, size):
+        self.browser = browser
+        self.size = size
+        self._queue = asyncio.Queue()
+
+    async def __aenter__(self):
+        for _ in range(self.size):
+            context = await self.browser.new_context(
+                viewport={'width': SCREENSHOT_WIDTH, 'height': SCREENSHOT_HEIGHT},
+                locale='fr-FR',
+                timezone_id='Europe/Paris',
+                user_agent=USER_AGENT
+            )
+            self._queue.put_nowait(context)
+        return self
+
+    async def __aexit__(self, *exc):
+        while not self._queue.empty():
+            await self._queue.get_nowait().close()
+
+    async def run(self, job):
+        """Exécute `job(page)` dans un contexte libre, sur une page neuve"""
+        context = await self._queue.get()
+        page = await context.new_page()
+        # Bloquer les dialogues et popups
+        page.on("dialog", lambda dialog: asyncio.ensure_future(dialog.dismiss()))
+        try:
+            return await job(page)
+        finally:
+            await page.close()
+            self._queue.put_nowait(context)
+
+
+async def capture_with_retry(pool, map_item):
+    """Capture une carte avec retentatives et délai exponentiel"""
+    map_id = map_item['id']
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            data = await pool.run(
+                lambda page: capture_screenshot(page, map_item['url'], map_id))
+            return {'id': map_id, 'success': True, 'data': data}
+        except Exception as e:
+            print(f"❌ Erreur lors de la capture de {map_item['url']} (essai {attempt}/{MAX_ATTEMPTS}): {e}")
+            if attempt < MAX_ATTEMPTS:
+                await asyncio.sleep(BACKOFF_BASE * 2 ** (attempt - 1))
+    return {'id': map_id, 'success': False}
+
+
+async def capture_maps(maps, concurrency=CONCURRENCY):
+    """Capture toutes les cartes de `maps` ; retourne un résultat par carte"""
+    if not maps:
+        return []
+    async with async_playwright() as p:
+        # Lancer le navigateur
+        browser = await p.chromium.launch(headless=True)
+        try:
+            async with ContextPool(browser, min(concurrency, len(maps))) as pool:
+                return await asyncio.gather(*(capture_with_retry(pool, m) for m in maps))
+        finally:
+            await browser.close()
+
+
+def perceptual_hash(data):
+    """dHash 64 bits d'un PNG : stable face au bruit de compression/antialiasing"""
+    with Image.open(io.BytesIO(data)) as img:
+        small = img.convert('L').resize((9, 8), Image.Resampling.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            bits = (bits << 1) | (left > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def hash_distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def load_state(path=STATE_PATH):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'maps': {}}
+
+
+def save_state(state, path=STATE_PATH):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_json(str(path), state)
+
+
+def check_page(url, entry):
+    """Requête conditionnelle : retourne (modifiée, validateurs)
+
+    Utilise ETag/Last-Modified quand le serveur en fournit, sinon une
+    empreinte SHA-256 du HTML. Une erreur réseau compte comme « modifiée » :
+    c'est la capture qui tranchera.
+    """
+    entry = entry or {}
+    request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+    if entry.get('etag'):
+        request.add_header('If-None-Match', entry['etag'])
+    if entry.get('last_modified'):
+        request.add_header('If-Modified-Since', entry['last_modified'])
+    try:
+        with urllib.request.urlopen(request, timeout=CHECK_TIMEOUT) as response:
+            validators = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'body_sha256': hashlib.sha256(response.read()).hexdigest(),
+            }
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return False, {k: entry.get(k) for k in ('etag', 'last_modified', 'body_sha256')}
+        return True, {}
+    except Exception:
+        return True, {}
+
+    if validators['etag'] and validators['etag'] == entry.get('etag'):
+        changed = False
+    elif validators['last_modified'] and validators['last_modified'] == entry.get('last_modified'):
+        changed = False
+    else:
+        changed = validators['body_sha256'] != entry.get('body_sha256')
+    return changed, validators
+
+
+async def select_changed(maps, state, max_age_days=MAX_AGE_DAYS, concurrency=CONCURRENCY):
+    """Cartes à recapturer : jamais capturées, trop anciennes ou modifiées
+
+    Met à jour les validateurs dans `state` au passage.
+    """
+    now = time.time()
+    semaphore = asyncio.Semaphore(concurrency * 2)
+
+    async def check(map_item):
+        entry = state['maps'].get(str(map_item['id']))
+        if not entry or entry.get('url') != map_item['url']:
+            reason = 'nouvelle'
+        elif now - entry.get('captured_at', 0) > max_age_days * 86400:
+            reason = 'ancienne'
+        else:
+            reason = None
+        async with semaphore:
+            changed, validators = await asyncio.to_thread(check_page, map_item['url'], entry)
+        if reason is None and changed:
+            reason = 'modifiée'
+        if reason is None and validators:
+            # Les validateurs d'une carte à recapturer ne sont enregistrés
+            # qu'après une capture réussie
+            entry.update(validators)
+        return map_item, reason, validators
+
+    stale = []
+    for map_item, reason, validators in await asyncio.gather(*(check(m) for m in maps)):
+        if reason:
+            print(f"🔄 Carte {map_item['id']}: {reason}")
+            stale.append((map_item, validators))
+        else:
+            print(f"⏭️  Carte {map_item['id']}: inchangée")
+    return stale
+
+
+def update_catalog(maps_json, thumbnails, lock_path=CATALOG_LOCK):
+    """Écrit les nouveaux chemins de thumbnails dans maps.json
+
+    `thumbnails` associe un id de carte à son URL de thumbnail. Le fichier
+    n'est réécrit que si un chemin change réellement.
+    """
+    def apply(data):
+        changed = 0
+        for map_item in data['maps']:
+            url = thumbnails.get(map_item['id'])
+            if url and map_item.get('thumbnail') != url:
+                map_item['thumbnail'] = url
+                changed += 1
+        return changed
+
+    return bool(update_catalog_json(str(maps_json), apply, str(lock_path)))
+
+
+def thumbnail_url(output_dir, map_id):
     try:
-        print(f"📸 Capture de la carte {map_id}: {url}")
-        
-        # Naviguer vers l'URL
-        await page.goto(url, wait_until='domcontentloaded', timeout=30000)
-        
-        # Attendre un peu que le contenu se charge
-        await asyncio.sleep(2)
-        
-        # Tenter d'accepter les cookies
-        await accept_cookies(page)
-        
-        # Attendre que la page se charge complètement
-        await asyncio.sleep(3)
-        
-        # Prendre le screenshot
-        await page.screenshot(path=output_path, full_page=False)
-        print(f"✅ Screenshot sauvegardé: {output_path}")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Erreur lors de la capture de {url}: {str(e)}")
-        return False
+        relative = (output_dir / f"map-{map_id}.png").resolve().relative_to((SCRIPT_DIR / 'static').resolve())
+    except ValueError:
+        return None  # Dossier de sortie hors de /static : rien à référencer
+    return f"/static/{relative.as_posix()}"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Capture les screenshots des cartes")
+    parser.add_argument('--only', nargs='*', type=int, help="Identifiants des cartes à capturer")
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help="Contextes navigateur en parallèle")
+    parser.add_argument('--maps-json', type=Path, default=MAPS_JSON, help="Catalogue à utiliser")
+    parser.add_argument('--output-dir', type=Path, default=THUMBNAILS_DIR, help="Dossier de sortie")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Ne recapturer que les pages modifiées ou trop anciennes")
+    parser.add_argument('--max-age', type=float, default=MAX_AGE_DAYS,
+                        help="Âge (jours) au-delà duquel une capture est refaite")
+    parser.add_argument('--threshold', type=int, default=PHASH_THRESHOLD,
+                        help="Distance de hash perceptuel sous laquelle le thumbnail est conservé")
+    parser.add_argument('--state', type=Path, default=STATE_PATH, help="Fichier d'état du mode incrémental")
+    parser.add_argument('--no-optimize', dest='optimize', action='store_false',
+                        help="Ne pas relancer l'optimisation des thumbnails réécrits")
+    return parser.parse_args()
+
 
 async def main():
     """Fonction principale"""
-    # Créer le dossier thumbnails s'il n'existe pas
-    THUMBNAILS_DIR.mkdir(parents=True, exist_ok=True)
-    
+    args = parse_args()
+
     # Charger les données des cartes
-    with open(MAPS_JSON, 'r', encoding='utf-8') as f:
+    with open(args.maps_json, 'r', encoding='utf-8') as f:
         data = json.load(f)
-    
+
     maps = data['maps']
+    if args.only:
+        maps = [m for m in maps if m['id'] in args.only]
     print(f"🗺️  {len(maps)} cartes trouvées")
-    print(f"📁 Dossier de sortie: {THUMBNAILS_DIR}")
+    print(f"📁 Dossier de sortie: {args.output_dir}")
     print("=" * 60)
-    
-    async with async_playwright() as p:
-        # Lancer le navigateur
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(
-            viewport={'width': SCREENSHOT_WIDTH, 'height': SCREENSHOT_HEIGHT},
-            locale='fr-FR',
-            timezone_id='Europe/Paris',
-            user_agent='Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        )
-        page = await context.new_page()
-        
-        # Bloquer les dialogues et popups
-        page.on("dialog", lambda dialog: dialog.dismiss())
-        
-        success_count = 0
-        fail_count = 0
-        
-        # Parcourir toutes les cartes
-        for map_item in maps:
-            map_id = map_item['id']
-            url = map_item['url']
-            output_path = THUMBNAILS_DIR / f"map-{map_id}.png"
-            
-            # Capturer le screenshot
-            if await capture_screenshot(page, url, output_path, map_id):
-                success_count += 1
-                
-                # Mettre à jour le chemin de la thumbnail dans le JSON
-                map_item['thumbnail'] = f"/static/images/thumbnails/map-{map_id}.png"
-            else:
-                fail_count += 1
-            
-            # Petit délai entre chaque capture
-            await asyncio.sleep(2)
-        
-        await browser.close()
-    
-    # Sauvegarder le JSON mis à jour
-    with open(MAPS_JSON, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    
+
+    start = time.monotonic()
+    state = load_state(args.state) if args.incremental else {'maps': {}}
+    if args.incremental:
+        stale = await select_changed(maps, state, args.max_age, args.concurrency)
+        print(f"📊 {len(stale)}/{len(maps)} cartes à recapturer")
+    else:
+        stale = [(m, {}) for m in maps]
+    validators = {m['id']: v for m, v in stale}
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    results = await capture_maps([m for m, _ in stale], args.concurrency)
+
+    # Écrire uniquement les screenshots dont le rendu a réellement changé
+    rewritten = []
+    thumbnails = {}
+    for result in results:
+        if not result['success']:
+            continue
+        map_id = result['id']
+        map_item = next(m for m in maps if m['id'] == map_id)
+        output_path = args.output_dir / f"map-{map_id}.png"
+        phash = perceptual_hash(result['data'])
+        entry = state['maps'].get(str(map_id), {})
+        unchanged = (args.incremental and entry.get('phash') and output_path.exists() and
+                     hash_distance(entry['phash'], phash) <= args.threshold)
+        if unchanged:
+            print(f"🟰 Carte {map_id}: rendu identique, thumbnail conservé")
+        else:
+            # Écriture atomique : jamais de PNG tronqué
+            write_atomic(output_path, result['data'])
+            rewritten.append(output_path.name)
+            entry['phash'] = phash
+            print(f"✅ Screenshot sauvegardé: {output_path}")
+        entry.update(validators.get(map_id, {}))
+        entry.update({'url': map_item['url'], 'captured_at': time.time()})
+        state['maps'][str(map_id)] = entry
+        url = thumbnail_url(args.output_dir, map_id)
+        if url:
+            thumbnails[map_id] = url
+
+    # Mettre à jour le chemin des thumbnails dans le JSON
+    if thumbnails:
+        update_catalog(args.maps_json, thumbnails)
+    if args.incremental:
+        save_state(state, args.state)
+
+    # Ré-optimiser seulement les thumbnails réécrits
+    if rewritten and args.optimize and args.output_dir.resolve() == THUMBNAILS_DIR.resolve():
+        print("\n🖼️  Optimisation des thumbnails modifiés...")
+        optimize_files(rewritten)
+        apply_to_catalog(maps_json=args.maps_json)
+
+    elapsed = time.monotonic() - start
+    success_count = sum(1 for r in results if r['success'])
     print("=" * 60)
     print(f"✅ Captures réussies: {success_count}")
-    print(f"❌ Captures échouées: {fail_count}")
-    print(f"📝 Fichier JSON mis à jour: {MAPS_JSON}")
+    print(f"❌ Captures échouées: {len(results) - success_count}")
+    print(f"🖼️  Thumbnails réécrits: {len(rewritten)}")
+    print(f"⏱️  Durée totale: {elapsed:.1f} s")
+    print(f"📝 Fichier JSON: {args.maps_json}")
     print("\n🎉 Terminé!")
 
 if __name__ == "__main__":
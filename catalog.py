@@ -0,0 +1,464 @@
+"""
+In-process catalog store for static/data/maps.json.
+
+The file is parsed once per worker into an immutable, indexed snapshot and
+only re-parsed when its mtime or size changes. Records are compact
+`MapRecord`s (see catalog_records.py); with a `compiled_path`, each version
+is compiled once into a file that every worker maps into memory instead of
+parsing maps.json.
+"""
+import base64
+import bisect
+import hashlib
+import json
+import os
+import threading
+from types import MappingProxyType
+
+from catalog_records import compact_records, freeze, read_compiled, write_compiled
+from search_index import SearchIndex, fold
+from view_counter import file_lock
+
+DEFAULT_PREVIEW = '/static/images/default-map.svg'
+THUMBNAILS_URL = '/static/images/thumbnails/'
+OPTIMIZED_THUMBNAILS_URL = '/static/images/thumbnails-optimized/'
+
+# Default projection for list endpoints: just what a gallery card needs
+CARD_FIELDS = ('id', 'title', 'mode', 'category', 'tags', 'preview', 'preview_small',
+               'preview_sources', 'difficulty')
+
+# Names accepted in `fields=` that expand to several fields
+FIELD_GROUPS = {
+    'card': CARD_FIELDS,
+}
+
+# Accepted in `sort=`; prefix with '-' for descending order
+SORT_FIELDS = ('id', 'title', 'difficulty', 'views')
+
+# Difficulty levels from easiest to hardest; unknown levels sort last
+DIFFICULTY_ORDER = ('Grand Public', 'Facile', 'Débutant', 'Intermédiaire', 'Avancé', 'Expert')
+
+
+def parse_fields(value):
+    """Parse a `fields=` query parameter.
+
+    Returns a tuple of field names, or None when full records were asked
+    for with `fields=all`. An empty value selects the card projection.
+    """
+    if not value:
+        return CARD_FIELDS
+    names = []
+    for name in value.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name == 'all':
+            return None
+        names.extend(FIELD_GROUPS.get(name, (name,)))
+    return tuple(dict.fromkeys(names)) or CARD_FIELDS
+
+
+def parse_sort(value):
+    """Parse a `sort=` query parameter into (field, descending), or None."""
+    if not value:
+        return None
+    descending = value.startswith('-')
+    field = value.lstrip('-')
+    if field not in SORT_FIELDS:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_FIELDS)}")
+    return field, descending
+
+
+def difficulty_rank(difficulty):
+    try:
+        return DIFFICULTY_ORDER.index(difficulty)
+    except ValueError:
+        return len(DIFFICULTY_ORDER)
+
+
+def sort_key(record, field, views=None):
+    """Key of `record` in the `field` order; ties are broken by id.
+
+    `views` maps ids to live view counts; without it the record's own
+    `views` value is used.
+    """
+    if field == 'title':
+        key = fold(record.get('title', ''))
+    elif field == 'difficulty':
+        key = difficulty_rank(record.get('difficulty'))
+    elif field == 'views':
+        key = record.get('views', 0) if views is None else views.get(str(record['id']), 0)
+    else:
+        key = record['id']
+    return (key, record['id'])
+
+
+def encode_cursor(sort, position):
+    """Opaque pagination token.
+
+    `position` is the last record's sort key for sorted listings (keyset
+    pagination, stable while the order shifts) or an offset otherwise.
+    """
+    spec = '' if sort is None else ('-' if sort[1] else '') + sort[0]
+    raw = json.dumps([spec, position], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, sort):
+    """Decode a cursor issued for the same `sort`; raise ValueError if invalid.
+
+    Returns the sort key to resume after, or an offset for unsorted listings.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        spec, position = json.loads(raw.decode('utf-8'))
+    except (ValueError, TypeError):
+        raise ValueError('invalid cursor')
+    if spec != ('' if sort is None else ('-' if sort[1] else '') + sort[0]):
+        raise ValueError('cursor does not match the requested sort')
+    if sort is None:
+        if not isinstance(position, int) or position < 0:
+            raise ValueError('invalid cursor')
+        return position
+    key_type = str if sort[0] == 'title' else int
+    if (not isinstance(position, list) or len(position) != 2 or
+            not isinstance(position[0], key_type) or not isinstance(position[1], int)):
+        raise ValueError('invalid cursor')
+    return tuple(position)
+
+
+def seek(keys, records, descending, after=None, offset=0, limit=None):
+    """Slice a page out of `records`, presorted ascending by `keys`."""
+    if descending:
+        end = bisect.bisect_left(keys, after) if after is not None else len(keys) - offset
+        start = 0 if limit is None else max(0, end - limit)
+        return records[start:max(end, 0)][::-1]
+    start = bisect.bisect_right(keys, after) if after is not None else offset
+    return records[start:None if limit is None else start + limit]
+
+
+def versioned(version, assets=None):
+    """Combine a catalog version with the asset manifest it was resolved with."""
+    if assets is None or assets.version is None:
+        return version
+    return f"{version}.{assets.version[:8]}"
+
+
+def _resolve_media(item, assets):
+    """Resolve a gallery entry's URL, poster and responsive/video variants."""
+    if isinstance(item, str):
+        return assets.url(item)
+    item = dict(item, url=assets.url(item.get('url')))
+    if 'poster' in item:
+        item['poster'] = assets.url(item['poster'])
+    for key in ('variants', 'sources'):
+        if key in item:
+            item[key] = [dict(v, url=assets.url(v.get('url'))) for v in item[key]]
+    return item
+
+
+# `<source>` order for `preview_sources`: the browser takes the first it supports
+PREVIEW_SOURCE_TYPES = ('image/avif', 'image/webp', 'image/jpeg', 'image/png')
+
+
+def _preview_sources(variants, assets=None):
+    """Group `thumbnail_variants` into [{'type', 'srcset'}] for a <picture>."""
+    srcsets = {}
+    for variant in variants:
+        url = variant['url']
+        if assets is not None and assets.version is not None:
+            url = assets.url(url)
+        srcsets.setdefault(variant.get('type'), []).append(f"{url} {variant['width']}w")
+    order = {t: i for i, t in enumerate(PREVIEW_SOURCE_TYPES)}
+    return [{'type': t, 'srcset': ', '.join(srcsets[t])}
+            for t in sorted(srcsets, key=lambda t: order.get(t, len(order)))]
+
+
+def resolve_asset_urls(record, assets=None):
+    """Derive `preview_small`/`preview_sources` and point static URLs at
+    fingerprinted copies.
+
+    `record` is a mutable dict with `preview` set; `assets` is an
+    `assets.AssetManifest` (URLs are left as they are without one).
+    """
+    preview = record.get('preview') or DEFAULT_PREVIEW
+    small = preview.replace(THUMBNAILS_URL, OPTIMIZED_THUMBNAILS_URL, 1)
+    if assets is not None and assets.version is not None:
+        # The manifest only lists optimized thumbnails that actually exist
+        small = assets.url(small) if assets.has(small) else assets.url(preview)
+        record['preview'] = assets.url(preview)
+        if 'thumbnail' in record:
+            record['thumbnail'] = assets.url(record['thumbnail'])
+        if 'images' in record:
+            record['images'] = [_resolve_media(img, assets) for img in record['images']]
+    record['preview_small'] = small
+    # Width variants from optimize_thumbnails.py, when it has run
+    if record.get('thumbnail_variants'):
+        record['preview_sources'] = _preview_sources(record['thumbnail_variants'], assets)
+    return record
+
+
+def _prepare_record(raw, assets=None):
+    """Normalize a raw map entry into a record dict."""
+    record = dict(raw)
+    # The frontend expects `preview`; maps.json stores it as `thumbnail`
+    record['preview'] = record.get('thumbnail', DEFAULT_PREVIEW)
+    # First description paragraph, so cards don't need the full text
+    description = record.get('description') or ''
+    if isinstance(description, list):
+        description = description[0] if description else ''
+    record['excerpt'] = description
+    return resolve_asset_urls(record, assets)
+
+
+def _distribution(values):
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return MappingProxyType(counts)
+
+
+class CatalogStats:
+    """Gallery aggregates, computed once per catalog snapshot.
+
+    View counts change between reloads, so they are passed in by the caller
+    (see `ViewCounter.total`) instead of being recomputed here.
+    """
+
+    def __init__(self, maps, categories):
+        self.total_maps = len(maps)
+        self.total_categories = len(categories)
+        self.base_views = sum(m.get('views', 0) for m in maps)
+        self.rating_sum = sum(m.get('rating', 0) for m in maps)
+        self.technology_distribution = _distribution(
+            tech for m in maps for tech in m.get('technologies', ()))
+        self.category_distribution = _distribution(
+            m.get('category', 'Uncategorized') for m in maps)
+        self.mode_distribution = _distribution(m.get('mode') for m in maps)
+        self.difficulty_distribution = _distribution(
+            m.get('difficulty', 'Non précisé') for m in maps)
+
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.total_maps if self.total_maps > 0 else 0
+
+    def as_dict(self, total_views=None):
+        return {
+            'total_maps': self.total_maps,
+            'total_categories': self.total_categories,
+            'total_views': self.base_views if total_views is None else total_views,
+            'average_rating': round(self.average_rating, 1),
+            'technology_distribution': dict(self.technology_distribution),
+            'category_distribution': dict(self.category_distribution),
+            'mode_distribution': dict(self.mode_distribution),
+            'difficulty_distribution': dict(self.difficulty_distribution),
+        }
+
+
+class Catalog:
+    """Immutable snapshot of maps.json indexed by id, mode and tag."""
+
+    def __init__(self, data, version, last_modified=None, assets=None, records=None):
+        """Index `data` (parsed maps.json), or prebuilt `MapRecord`s if given."""
+        self.version = version
+        self.last_modified = last_modified
+        if records is None:
+            records = compact_records([_prepare_record(m, assets) for m in data.get('maps', [])])
+        self.maps = tuple(records)
+
+        by_id = {}
+        by_mode = {}
+        by_tag = {}
+        for record in self.maps:
+            by_id[str(record['id'])] = record
+            by_mode.setdefault(record.get('mode'), []).append(record)
+            for tag in record.get('tags', ()):
+                by_tag.setdefault(tag, []).append(record)
+
+        self.by_id = MappingProxyType(by_id)
+        self.by_mode = MappingProxyType({k: tuple(v) for k, v in by_mode.items()})
+        self.by_tag = MappingProxyType({k: tuple(v) for k, v in by_tag.items()})
+
+        categories = data.get('categories')
+        if not categories:
+            categories = sorted({m.get('category', '') for m in self.maps})
+        self.categories = freeze(categories)
+
+        self.stats = CatalogStats(self.maps, self.categories)
+        self.search_index = SearchIndex(self.maps)
+        self._cards = {}
+        self._orders = {}
+
+    def __len__(self):
+        return len(self.maps)
+
+    def get(self, map_id):
+        """Return the record for `map_id` (int or str), or None."""
+        return self.by_id.get(str(map_id))
+
+    def project(self, records, fields, views=None):
+        """Return `records` reduced to `fields` (None keeps every field).
+
+        `views` ({str id: live count}, see `ViewCounter.counts`) replaces the
+        `views` stored in maps.json when the projection includes them.
+        """
+        if fields is None:
+            rows = [record.to_dict() for record in records]
+        elif fields == CARD_FIELDS:
+            # Card projections are requested on every page load: build each
+            # one once per snapshot
+            cards = self._cards
+            out = []
+            for record in records:
+                key = str(record['id'])
+                card = cards.get(key)
+                if card is None:
+                    card = cards[key] = {f: record[f] for f in fields if f in record}
+                out.append(card)
+            return out
+        else:
+            rows = [{f: record[f] for f in fields if f in record} for record in records]
+        if views is not None and (fields is None or 'views' in fields):
+            for record, row in zip(records, rows):
+                row['views'] = views.get(str(record['id']), 0)
+        return rows
+
+    def search(self, query):
+        """Return maps matching `query`, most relevant first."""
+        return self.search_index.search(query)
+
+    def query(self, mode=None, search='', offset=0, limit=None, sort=None, after=None, views=None):
+        """Filter by mode and/or search; return (total, page of records).
+
+        `sort` is a (field, descending) pair from `parse_sort`; without it
+        records come in catalog (or relevance) order. `after` resumes a
+        sorted listing after that sort key. `views` maps ids to live view
+        counts for `sort=views`.
+        """
+        if search:
+            records = self.search(search)
+            if mode:
+                records = [m for m in records if m.get('mode') == mode]
+        elif mode:
+            records = self.by_mode.get(mode, ())
+        else:
+            records = self.maps
+        if sort is None:
+            end = None if limit is None else offset + limit
+            return len(records), records[offset:end]
+
+        field, descending = sort
+        if search or field == 'views':
+            # Search hits and live view counts can't be presorted
+            keys, ordered = self._order(records, field, views)
+        else:
+            cached = self._orders.get((mode, field))
+            if cached is None:
+                cached = self._orders[(mode, field)] = self._order(records, field)
+            keys, ordered = cached
+        return len(records), seek(keys, ordered, descending, after, offset, limit)
+
+    @staticmethod
+    def _order(records, field, views=None):
+        pairs = sorted(((sort_key(r, field, views), r) for r in records), key=lambda p: p[0])
+        return [k for k, _ in pairs], [r for _, r in pairs]
+
+    @classmethod
+    def from_bytes(cls, raw, last_modified=None, assets=None, compiled_path=None):
+        """Build a catalog from maps.json bytes.
+
+        With `compiled_path`, records are mapped from the compiled file for
+        this version, which is (re)written first if it is missing or stale.
+        """
+        version = versioned(hashlib.sha1(raw).hexdigest()[:16], assets)
+        if compiled_path is None:
+            return cls(json.loads(raw.decode('utf-8')), version, last_modified, assets)
+        compiled = read_compiled(compiled_path, version)
+        if compiled is None:
+            data = json.loads(raw.decode('utf-8'))
+            try:
+                os.makedirs(os.path.dirname(compiled_path) or '.', exist_ok=True)
+                # Workers reloading together compile each version once
+                with file_lock(compiled_path + '.lock'):
+                    compiled = read_compiled(compiled_path, version)
+                    if compiled is None:
+                        records = [_prepare_record(m, assets) for m in data.get('maps', [])]
+                        write_compiled(compiled_path, version, records, data.get('categories'))
+                        compiled = read_compiled(compiled_path, version)
+            except OSError as e:
+                print(f"Error compiling catalog {compiled_path}: {e}")
+            if compiled is None:
+                return cls(data, version, last_modified, assets)
+        records, categories = compiled
+        return cls({'categories': categories}, version, last_modified, records=records)
+
+
+class CatalogStore:
+    """Loads maps.json lazily and hot-reloads it when the file changes.
+
+    With an `assets` manifest, image URLs are resolved to fingerprinted
+    copies and a rebuilt manifest also triggers a reload. With a
+    `compiled_path`, records are memory-mapped from a compiled catalog file
+    shared by all workers.
+    """
+
+    def __init__(self, path, assets=None, compiled_path=None):
+        self.path = path
+        self.assets = assets
+        self.compiled_path = compiled_path
+        self._lock = threading.Lock()
+        self._catalog = None
+        self._stamp = None
+        self._listeners = []
+        # Lookups served from the parsed snapshot vs. ones that re-parsed
+        self.hits = 0
+        self.reloads = 0
+
+    def _current_stamp(self):
+        st = os.stat(self.path)
+        assets_stamp = self.assets.stamp() if self.assets is not None else None
+        return (st.st_mtime_ns, st.st_size, assets_stamp)
+
+    def get(self):
+        """Return the current catalog, reloading it if maps.json changed."""
+        stamp = self._current_stamp()
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    self._reload(stamp)
+                    self.reloads += 1
+                    return self._catalog
+        self.hits += 1
+        return self._catalog
+
+    def refresh(self):
+        """Force a reload on the next `get()`."""
+        with self._lock:
+            self._stamp = None
+
+    def on_reload(self, callback):
+        """Register `callback(catalog)` to run after each successful reload."""
+        self._listeners.append(callback)
+        return callback
+
+    def _reload(self, stamp):
+        with open(self.path, 'rb') as f:
+            raw = f.read()
+        try:
+            last_modified = stamp[0]
+            if stamp[2] is not None:
+                last_modified = max(last_modified, stamp[2][0])
+            catalog = Catalog.from_bytes(raw, last_modified=last_modified / 1e9, assets=self.assets,
+                                         compiled_path=self.compiled_path)
+        except (ValueError, KeyError, TypeError) as e:
+            # Keep serving the last good snapshot if a writer left the file
+            # half-written; we'll retry once the stamp changes again.
+            if self._catalog is None:
+                raise
+            print(f"Error reloading catalog {self.path}: {e}")
+            self._stamp = stamp
+            return
+        self._catalog = catalog
+        self._stamp = stamp
+        for callback in self._listeners:
+            callback(catalog)
@@ -0,0 +1,252 @@
+"""
+Compact map records and the compiled catalog file.
+
+A parsed maps.json entry is a dict of dicts, lists and strings, most of them
+long texts (description, analysis, reviews) that only the detail endpoint
+reads, plus short values repeated on every record (mode, category, tags).
+`MapRecord` keeps the fields used for filtering, sorting and cards in
+`__slots__`, with repeated values interned so all records share one string
+(and one tags tuple) per distinct value. Every other field is stored as its
+UTF-8 JSON encoding in a shared buffer and decoded on access.
+
+That buffer can be a compiled catalog file (`write_compiled`), which
+`read_compiled` maps into memory: the long texts then live in the page
+cache, shared by every worker, instead of in each worker's heap.
+
+    <MAGIC> <version length, index length> <version> <index JSON> <texts>
+
+Records behave as read-only mappings; nested values are `FrozenDict`s and
+tuples.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from collections.abc import Mapping
+
+MAGIC = b'GEOVISCAT\x01'
+HEADER = struct.Struct('<II')
+
+# Fields kept as Python objects: filters, sorting, stats and cards
+RECORD_FIELDS = (
+    'id', 'title', 'mode', 'category', 'difficulty', 'auteur', 'tags', 'sources',
+    'url', 'thumbnail', 'preview', 'preview_small', 'views', 'rating', 'maceachren',
+)
+_RECORD_FIELDS = frozenset(RECORD_FIELDS)
+
+# Enumerations shared across records: one object per distinct value
+INTERNED_FIELDS = ('mode', 'category', 'difficulty', 'auteur')
+INTERNED_LIST_FIELDS = ('tags', 'sources')
+
+
+class FrozenDict(dict):
+    """Read-only dict that still serializes like a plain dict."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('catalog records are read-only')
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return thaw(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+def freeze(value):
+    """Recursively convert JSON data into read-only containers."""
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """Recursively convert frozen containers and records into mutable JSON data."""
+    if isinstance(value, Mapping):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(v) for v in value]
+    return value
+
+
+class MapRecord(Mapping):
+    """Read-only catalog record with slotted fields and lazily decoded texts."""
+
+    __slots__ = RECORD_FIELDS + ('_texts', '_names', '_bounds')
+
+    def __init__(self, fields, texts, names, bounds):
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, '_texts', texts)
+        # Other fields are JSON-encoded back to back in `texts`: field i
+        # spans texts[bounds[i]:bounds[i + 1]]. `names` is shared by every
+        # record with the same layout, and an array of offsets costs far
+        # less than a tuple of int objects.
+        object.__setattr__(self, '_names', names)
+        object.__setattr__(self, '_bounds', bounds)
+
+    def __setattr__(self, name, value):
+        raise TypeError('catalog records are read-only')
+
+    __delattr__ = __setattr__
+
+    def __getitem__(self, key):
+        if key in _RECORD_FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        try:
+            i = self._names.index(key)
+        except ValueError:
+            raise KeyError(key) from None
+        return freeze(json.loads(self._texts[self._bounds[i]:self._bounds[i + 1]]))
+
+    def __contains__(self, key):
+        if key in _RECORD_FIELDS:
+            return hasattr(self, key)
+        return key in self._names
+
+    def __iter__(self):
+        for name in RECORD_FIELDS:
+            if hasattr(self, name):
+                yield name
+        yield from self._names
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"<MapRecord {getattr(self, 'id', None)!r}>"
+
+    def __copy__(self):
+        return thaw(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (thaw, (dict(self),))
+
+    def to_dict(self):
+        """Plain dict of every field (long texts decoded)."""
+        return {key: self[key] for key in self}
+
+
+def encode_records(records):
+    """Split record dicts into (index, texts).
+
+    `index` holds, per record, the slotted fields, the names of the other
+    fields and where their JSON encodings start and end in `texts`.
+    """
+    index = []
+    texts = bytearray()
+    for record in records:
+        fields = {}
+        names = []
+        bounds = [len(texts)]
+        for name, value in record.items():
+            if name in _RECORD_FIELDS:
+                fields[name] = value
+            else:
+                texts += json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+                names.append(name)
+                bounds.append(len(texts))
+        index.append((fields, names, bounds))
+    return index, texts
+
+
+def build_records(index, texts, base=0):
+    """Create `MapRecord`s over `texts` from an `encode_records` index."""
+    shared = {}
+    records = []
+    for fields, names, bounds in index:
+        fields = dict(fields)
+        for name in INTERNED_FIELDS:
+            if isinstance(fields.get(name), str):
+                fields[name] = sys.intern(fields[name])
+        for name in INTERNED_LIST_FIELDS:
+            if name in fields:
+                values = tuple(sys.intern(v) if isinstance(v, str) else v for v in fields[name])
+                fields[name] = shared.setdefault(values, values)
+        if 'maceachren' in fields:
+            fields['maceachren'] = freeze(fields['maceachren'])
+        names = tuple(sys.intern(name) for name in names)
+        names = shared.setdefault(names, names)
+        bounds = array('Q', (base + offset for offset in bounds))
+        records.append(MapRecord(fields, texts, names, bounds))
+    return tuple(records)
+
+
+def compact_records(records):
+    """Convert record dicts into `MapRecord`s over an in-memory buffer."""
+    index, texts = encode_records(records)
+    return build_records(index, bytes(texts))
+
+
+def write_compiled(path, version, records, categories=None):
+    """Write `records` to a compiled catalog file (atomic replace)."""
+    index, texts = encode_records(records)
+    version_bytes = version.encode('utf-8')
+    index_bytes = json.dumps({'records': index, 'categories': categories or []},
+                             ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.bin')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(HEADER.pack(len(version_bytes), len(index_bytes)))
+            f.write(version_bytes)
+            f.write(index_bytes)
+            f.write(texts)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def read_compiled(path, version):
+    """Map a compiled catalog file; return (records, categories).
+
+    Returns None when the file is missing, invalid or compiled for another
+    catalog version. The mapping stays valid after the file is replaced.
+    """
+    try:
+        with open(path, 'rb') as f:
+            texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return None
+    found = None
+    try:
+        start = len(MAGIC)
+        if texts[:start] != MAGIC:
+            return None
+        version_length, index_length = HEADER.unpack(texts[start:start + HEADER.size])
+        start += HEADER.size
+        if texts[start:start + version_length].decode('utf-8') != version:
+            return None
+        start += version_length
+        data = json.loads(texts[start:start + index_length])
+        categories = data['categories']
+        found = build_records(data['records'], texts, base=start + index_length), categories
+    except (ValueError, KeyError, TypeError, struct.error):
+        return None
+    finally:
+        # No record refers to the mapping unless it was read successfully
+        if found is None:
+            texts.close()
+    return found
@@ -0,0 +1,468 @@
+"""
+Optional SQLite storage backend for the map catalog.
+
+maps.json is imported into a WAL-mode database with indexed columns
+(`id`, `mode`, `category`, `difficulty`), normalized tag and image tables and
+an FTS5 index over the text fields. `SqliteCatalogStore` and
+`SqliteViewCounter` mirror the interfaces of `CatalogStore` and
+`ViewCounter`, so filtering, pagination, search and view increments become
+indexed queries instead of scans over the whole parsed file.
+
+Usage:
+    python catalog_sqlite.py import [--json maps.json] [--db catalog.sqlite3]
+    python catalog_sqlite.py export [--json maps.json] [--db catalog.sqlite3]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from catalog import CatalogStats, _prepare_record, difficulty_rank, resolve_asset_urls, versioned
+from catalog_records import freeze, thaw
+from search_index import FIELD_WEIGHTS, fold, tokenize
+from view_counter import atomic_write_json, catalog_lock_path, file_lock
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS maps (
+    id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    mode TEXT,
+    category TEXT,
+    difficulty TEXT,
+    views INTEGER NOT NULL DEFAULT 0,
+    rating REAL NOT NULL DEFAULT 0,
+    title_key TEXT NOT NULL DEFAULT '',
+    difficulty_rank INTEGER NOT NULL DEFAULT 0,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS maps_position ON maps (position);
+CREATE INDEX IF NOT EXISTS maps_mode ON maps (mode, position);
+CREATE INDEX IF NOT EXISTS maps_category ON maps (category);
+CREATE INDEX IF NOT EXISTS maps_difficulty ON maps (difficulty);
+CREATE TABLE IF NOT EXISTS tags (
+    map_id INTEGER NOT NULL REFERENCES maps (id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (map_id, tag)
+);
+CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag);
+CREATE TABLE IF NOT EXISTS images (
+    map_id INTEGER NOT NULL REFERENCES maps (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    type TEXT NOT NULL DEFAULT 'image',
+    PRIMARY KEY (map_id, position)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS maps_fts USING fts5 (
+    title, tags, auteur, fonctionalites, description,
+    tokenize = "unicode61 remove_diacritics 2"
+);
+"""
+
+# Columns added after the first schema: (name, definition)
+MIGRATIONS = (
+    ('title_key', "title_key TEXT NOT NULL DEFAULT ''"),
+    ('difficulty_rank', 'difficulty_rank INTEGER NOT NULL DEFAULT 0'),
+)
+
+# Created once migrations have run, as they may use migrated columns
+INDEXES = """
+CREATE INDEX IF NOT EXISTS maps_views ON maps (views, id);
+CREATE INDEX IF NOT EXISTS maps_title_key ON maps (title_key, id);
+CREATE INDEX IF NOT EXISTS maps_difficulty_rank ON maps (difficulty_rank, id);
+"""
+
+# `sort=` fields and the column each one orders by
+SORT_COLUMNS = {
+    'id': 'm.id',
+    'title': 'm.title_key',
+    'difficulty': 'm.difficulty_rank',
+    'views': 'm.views',
+}
+
+# FTS5 columns, in order, and the record fields that feed each one
+FTS_COLUMNS = (
+    ('title', ('title',)),
+    ('tags', ('tags',)),
+    ('auteur', ('auteur',)),
+    ('fonctionalites', ('fonctionalites', 'fonctionnalites')),
+    ('description', ('description',)),
+)
+_WEIGHTS = dict(FIELD_WEIGHTS)
+BM25_WEIGHTS = ', '.join(str(_WEIGHTS[column]) for column, _ in FTS_COLUMNS)
+
+# Stored documents never carry views: the `views` column is authoritative
+_DOC_SQL = "json_set(doc, '$.views', views)"
+
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA foreign_keys=ON')
+    conn.executescript(SCHEMA)
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(maps)')}
+    missing = [definition for name, definition in MIGRATIONS if name not in columns]
+    if missing:
+        with conn:
+            for definition in missing:
+                conn.execute(f'ALTER TABLE maps ADD COLUMN {definition}')
+            # New columns are filled in by the next import
+            conn.execute("DELETE FROM meta WHERE key = 'source_stamp'")
+    conn.executescript(INDEXES)
+    return conn
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        return '\n'.join(str(v) for v in value)
+    return str(value)
+
+
+def import_json(json_path, db_path, keep_views=True):
+    """Load maps.json into the database, replacing the previous catalog.
+
+    With `keep_views`, maps already in the database keep their view count
+    (increments recorded since the last export are not lost).
+    """
+    with open(json_path, 'rb') as f:
+        raw = f.read()
+    data = json.loads(raw.decode('utf-8'))
+    records = [_prepare_record(m) for m in data.get('maps', [])]
+
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            views = dict(conn.execute('SELECT id, views FROM maps')) if keep_views else {}
+            conn.execute('DELETE FROM maps_fts')
+            conn.execute('DELETE FROM tags')
+            conn.execute('DELETE FROM images')
+            conn.execute('DELETE FROM maps')
+            for position, record in enumerate(records):
+                map_id = int(record['id'])
+                doc = thaw(record)
+                map_views = views.get(map_id, doc.pop('views', 0))
+                doc.pop('views', None)
+                conn.execute(
+                    'INSERT INTO maps (id, position, title, mode, category, difficulty, views, rating, '
+                    'title_key, difficulty_rank, doc) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (map_id, position, record.get('title', ''), record.get('mode'),
+                     record.get('category'), record.get('difficulty'), map_views,
+                     record.get('rating', 0), fold(record.get('title', '')),
+                     difficulty_rank(record.get('difficulty')), json.dumps(doc, ensure_ascii=False)))
+                conn.executemany(
+                    'INSERT OR IGNORE INTO tags (map_id, tag) VALUES (?, ?)',
+                    [(map_id, tag) for tag in record.get('tags', ())])
+                conn.executemany(
+                    'INSERT INTO images (map_id, position, url, type) VALUES (?, ?, ?, ?)',
+                    [(map_id, i, img if isinstance(img, str) else img.get('url', ''),
+                      'image' if isinstance(img, str) else img.get('type', 'image'))
+                     for i, img in enumerate(record.get('images', ()))])
+                conn.execute(
+                    'INSERT INTO maps_fts (rowid, title, tags, auteur, fonctionalites, description) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (map_id, *(' '.join(_text(record.get(f)) for f in fields)
+                               for _, fields in FTS_COLUMNS)))
+            meta = {
+                'version': hashlib.sha1(raw).hexdigest()[:16],
+                'last_modified': repr(time.time()),
+                'categories': json.dumps(data.get('categories') or [], ensure_ascii=False),
+                'source_stamp': repr(os.stat(json_path).st_mtime_ns),
+            }
+            conn.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', meta.items())
+    finally:
+        conn.close()
+    return len(records)
+
+
+def export_json(db_path, json_path, lock_path=None):
+    """Write the database catalog (with current view counts) back to JSON.
+
+    maps.json is rewritten under the catalog lock (see `catalog_lock_path`).
+    """
+    conn = connect(db_path)
+    try:
+        maps = [json.loads(row[0]) for row in
+                conn.execute(f'SELECT {_DOC_SQL} FROM maps ORDER BY position')]
+        categories = json.loads(
+            (conn.execute("SELECT value FROM meta WHERE key = 'categories'").fetchone() or ['[]'])[0])
+    finally:
+        conn.close()
+    for record in maps:
+        # Derived at load time: never written back
+        record.pop('preview', None)
+        record.pop('preview_small', None)
+        record.pop('preview_sources', None)
+        record.pop('excerpt', None)
+        if not record.get('views'):
+            record.pop('views', None)
+    data = {'maps': maps}
+    if categories:
+        data['categories'] = categories
+    lock_path = lock_path or catalog_lock_path()
+    os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+    with file_lock(lock_path):
+        atomic_write_json(json_path, data)
+
+    # The database already matches the file we just wrote: no re-import
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute("UPDATE meta SET value = ? WHERE key = 'source_stamp'",
+                         (repr(os.stat(json_path).st_mtime_ns),))
+    finally:
+        conn.close()
+    return len(maps)
+
+
+def fts_query(query):
+    """Turn free text into an FTS5 query: every term, as a prefix, ANDed."""
+    return ' '.join(f'"{token}"*' for token in tokenize(query))
+
+
+class SqliteCatalog:
+    """One catalog version, read from the database on demand."""
+
+    def __init__(self, store, version, last_modified, categories):
+        self._store = store
+        self.version = version
+        self.last_modified = last_modified
+        self._categories = categories
+        self._stats = None
+
+    def _rows(self, sql, params=()):
+        return self._store.connection().execute(sql, params).fetchall()
+
+    def _records(self, rows):
+        # Stored docs keep maps.json's URLs; fingerprinted ones are resolved on read
+        assets = self._store.assets
+        return [freeze(resolve_asset_urls(json.loads(row[0]), assets)) for row in rows]
+
+    def __len__(self):
+        return self._rows('SELECT COUNT(*) FROM maps')[0][0]
+
+    @property
+    def maps(self):
+        return tuple(self._records(self._rows(f'SELECT {_DOC_SQL} FROM maps ORDER BY position')))
+
+    @property
+    def categories(self):
+        if self._categories:
+            return freeze(self._categories)
+        return tuple(r[0] for r in self._rows(
+            "SELECT DISTINCT COALESCE(category, '') FROM maps ORDER BY 1"))
+
+    @property
+    def stats(self):
+        if self._stats is None:
+            self._stats = CatalogStats(self.maps, self.categories)
+        return self._stats
+
+    def get(self, map_id):
+        try:
+            map_id = int(map_id)
+        except (TypeError, ValueError):
+            return None
+        rows = self._rows(f'SELECT {_DOC_SQL} FROM maps WHERE id = ?', (map_id,))
+        return self._records(rows)[0] if rows else None
+
+    def query(self, mode=None, search='', offset=0, limit=None, sort=None, after=None, views=None):
+        """Filter by mode and/or search; return (total, page of records).
+
+        Same contract as `Catalog.query`; `views` is ignored because the
+        `views` column is already live.
+        """
+        limit = -1 if limit is None else limit
+        conditions = []
+        params = []
+        if search:
+            match = fts_query(search)
+            if match:
+                conditions.append('maps_fts MATCH ?')
+                params.append(match)
+            else:
+                search = ''
+        source = 'maps_fts JOIN maps m ON m.id = maps_fts.rowid' if search else 'maps m'
+        if mode:
+            conditions.append('m.mode = ?')
+            params.append(mode)
+        where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+        total = self._rows(f'SELECT COUNT(*) FROM {source} {where}', params)[0][0]
+
+        if sort is not None:
+            column = SORT_COLUMNS[sort[0]]
+            direction = 'DESC' if sort[1] else 'ASC'
+            order = f'{column} {direction}, m.id {direction}'
+            if after is not None:
+                conditions.append(f"({column}, m.id) {'<' if sort[1] else '>'} (?, ?)")
+                params.extend(after)
+                where = 'WHERE ' + ' AND '.join(conditions)
+                offset = 0
+        elif search:
+            order = f'bm25(maps_fts, {BM25_WEIGHTS}), m.position'
+        else:
+            order = 'm.position'
+        rows = self._rows(
+            f"SELECT json_set(m.doc, '$.views', m.views) FROM {source} {where} "
+            f'ORDER BY {order} LIMIT ? OFFSET ?', params + [limit, offset])
+        return total, self._records(rows)
+
+    def search(self, query):
+        return self.query(search=query)[1]
+
+    @staticmethod
+    def project(records, fields, views=None):
+        # `views` is ignored: the `views` column already holds live counts
+        if fields is None:
+            return list(records)
+        return [{f: record[f] for f in fields if f in record} for record in records]
+
+
+class SqliteCatalogStore:
+    """Drop-in replacement for `CatalogStore` backed by SQLite.
+
+    The database is (re)imported from `json_path` when it is missing or when
+    maps.json changed since the last import, so build scripts that edit
+    maps.json keep working. With an `assets` manifest, image URLs are
+    resolved to fingerprinted copies on read.
+    """
+
+    def __init__(self, db_path, json_path=None, assets=None, lock_path=None):
+        self.db_path = db_path
+        self.path = json_path
+        self.assets = assets
+        self.lock_path = lock_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._catalog = None
+        self._seen_stamp = None
+        self._seen_assets = None
+        self._listeners = []
+        self.hits = 0
+        self.reloads = 0
+
+    def connection(self):
+        """One connection per thread and per (forked) process."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = connect(self.db_path)
+            self._local.pid = os.getpid()
+            self._local.data_version = None
+        return conn
+
+    def _meta(self):
+        return dict(self.connection().execute('SELECT key, value FROM meta'))
+
+    def _source_stamp(self):
+        return None if self.path is None else repr(os.stat(self.path).st_mtime_ns)
+
+    def get(self):
+        """Return the current catalog version, reloading after imports."""
+        conn = self.connection()
+        # data_version (per connection) moves whenever another connection commits
+        data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        stamp = self._source_stamp()
+        assets_stamp = self.assets.stamp() if self.assets is not None else None
+        if (self._catalog is None or data_version != self._local.data_version
+                or stamp != self._seen_stamp or assets_stamp != self._seen_assets):
+            with self._lock:
+                meta = self._meta()
+                if stamp is not None and meta.get('source_stamp') != stamp:
+                    import_json(self.path, self.db_path)
+                    meta = self._meta()
+                version = versioned(meta['version'], self.assets)
+                if self._catalog is None or version != self._catalog.version:
+                    last_modified = float(meta['last_modified'])
+                    if assets_stamp is not None:
+                        last_modified = max(last_modified, assets_stamp[0] / 1e9)
+                    self._catalog = SqliteCatalog(
+                        self, version, last_modified, json.loads(meta.get('categories', '[]')))
+                    self.reloads += 1
+                    for callback in self._listeners:
+                        callback(self._catalog)
+                else:
+                    self.hits += 1
+                self._seen_stamp = stamp
+                self._seen_assets = assets_stamp
+                self._local.data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+                return self._catalog
+        self.hits += 1
+        return self._catalog
+
+    def refresh(self):
+        with self._lock:
+            self._catalog = None
+
+    def on_reload(self, callback):
+        self._listeners.append(callback)
+        return callback
+
+
+class SqliteViewCounter:
+    """`ViewCounter` interface over the `views` column: one UPDATE per view."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def record(self, map_id):
+        with self.store.connection() as conn:
+            row = conn.execute(
+                'UPDATE maps SET views = views + 1 WHERE id = ? RETURNING views',
+                (int(map_id),)).fetchone()
+        return row[0] if row else 0
+
+    def count(self, map_id):
+        row = self.store.connection().execute(
+            'SELECT views FROM maps WHERE id = ?', (int(map_id),)).fetchone()
+        return row[0] if row else 0
+
+    def counts(self):
+        return {str(map_id): views for map_id, views in
+                self.store.connection().execute('SELECT id, views FROM maps')}
+
+    def total(self):
+        return self.store.connection().execute(
+            'SELECT COALESCE(SUM(views), 0) FROM maps').fetchone()[0]
+
+    def sync(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def compact(self):
+        """Write view counts back to maps.json."""
+        if self.store.path is not None:
+            export_json(self.store.db_path, self.store.path, self.store.lock_path)
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Import/export the map catalog to SQLite")
+    parser.add_argument('command', choices=('import', 'export'))
+    parser.add_argument('--json', default=os.path.join(script_dir, 'static', 'data', 'maps.json'))
+    parser.add_argument('--db', default=os.path.join(script_dir, 'instance', 'catalog.sqlite3'))
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        count = import_json(args.json, args.db)
+        print(f"{count} maps imported into {args.db}")
+    else:
+        count = export_json(args.db, args.json)
+        print(f"{count} maps exported to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+Durable queue for contact-form messages.
+
+Submissions are committed to a local SQLite database in WAL mode and the
+request returns straight away; a background worker drains pending rows in
+batches, hands them to a delivery callback and prunes old delivered rows.
+Rows are claimed inside an IMMEDIATE transaction with a random token and a
+lease, so any number of gunicorn workers can run the drain loop: a batch
+whose lease expires (crashed or stuck worker) is claimed again, and only
+the holder of the current token can mark it delivered or failed.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    received_at TEXT NOT NULL,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    message TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    delivered_at REAL,
+    last_error TEXT,
+    claim_token TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS messages_pending ON messages (status, next_attempt);
+"""
+
+# Added after the first release: created on existing databases at startup
+MIGRATIONS = {
+    'claim_token': 'ALTER TABLE messages ADD COLUMN claim_token TEXT',
+    'lease_until': 'ALTER TABLE messages ADD COLUMN lease_until REAL',
+}
+
+FIELDS = ('name', 'email', 'subject', 'message')
+
+
+class JsonlOutbox:
+    """Default delivery: append messages to a size-rotated JSON Lines file."""
+
+    def __init__(self, path, max_bytes=5 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def __call__(self, messages):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for message in messages:
+                f.write(json.dumps(message, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        for message in messages:
+            print(f"Nouveau message de contact reçu de {message['name']} ({message['email']})")
+        if os.path.getsize(self.path) >= self.max_bytes:
+            stem, ext = os.path.splitext(self.path)
+            os.replace(self.path, f"{stem}-{datetime.now():%Y%m%d-%H%M%S}{ext}")
+
+
+class ContactQueue:
+    """SQLite-backed contact queue with a per-process drain thread.
+
+    `lease` bounds how long a claimed batch stays reserved: it must exceed
+    the delivery callback's own timeout, or a slow delivery would be
+    claimed again and sent twice.
+    """
+
+    def __init__(self, db_path, deliver, batch_size=100, poll_interval=1.0,
+                 max_attempts=8, retry_delay=30.0, retention_days=90, lease=300.0):
+        self.db_path = db_path
+        self.deliver = deliver
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retention_days = retention_days
+        self.lease = lease
+
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._worker_pid = None
+        self._worker_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(messages)')}
+        for column, sql in MIGRATIONS.items():
+            if column not in columns:
+                conn.execute(sql)
+        conn.commit()
+
+    # -- public API -------------------------------------------------------
+
+    def start(self):
+        """Start the drain thread in this process (no-op once running)."""
+        self._ensure_worker()
+
+    def enqueue(self, data):
+        """Durably store one message and return its queue id."""
+        self._ensure_worker()
+        row = (datetime.now().isoformat(),) + tuple(data[f] for f in FIELDS)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT INTO messages (received_at, name, email, subject, message) '
+                'VALUES (?, ?, ?, ?, ?)', row)
+        self._wakeup.set()
+        return cursor.lastrowid
+
+    def drain(self):
+        """Deliver pending messages batch by batch; return how many were sent."""
+        sent = 0
+        while True:
+            token, batch = self._claim()
+            if not batch:
+                return sent
+            try:
+                self.deliver(batch)
+            except Exception as e:
+                print(f"Erreur lors de la livraison des messages de contact: {e}")
+                self._release(token, batch, str(e))
+                return sent
+            now = time.time()
+            with self._connect() as conn:
+                updated = sum(conn.execute(
+                    "UPDATE messages SET status = 'delivered', delivered_at = ?, "
+                    "claim_token = NULL, lease_until = NULL "
+                    "WHERE id = ? AND claim_token = ?", (now, m['id'], token)).rowcount
+                    for m in batch)
+            if updated < len(batch):
+                print(f"Contact queue: lease expired before delivery completed "
+                      f"({len(batch) - updated} message(s) may be sent again)")
+            sent += len(batch)
+
+    def prune(self):
+        """Delete delivered messages older than the retention period."""
+        cutoff = time.time() - self.retention_days * 86400
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM messages WHERE status = 'delivered' AND delivered_at < ?", (cutoff,))
+
+    def stats(self):
+        with self._connect() as conn:
+            return dict(conn.execute('SELECT status, COUNT(*) FROM messages GROUP BY status'))
+
+    # -- internals --------------------------------------------------------
+
+    def _connect(self):
+        """One connection per thread and per (forked) process."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            # FULL: each commit is on disk before the request returns
+            conn.execute('PRAGMA synchronous=FULL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _claim(self):
+        """Lease a batch of due messages; return (claim token, messages)."""
+        conn = self._connect()
+        now = time.time()
+        token = uuid.uuid4().hex
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # A crashed or stuck worker's lease expires and its batch is retried
+            # (claims made before leases existed have none)
+            conn.execute(
+                "UPDATE messages SET status = 'pending', claim_token = NULL, lease_until = NULL "
+                "WHERE status = 'sending' AND (lease_until IS NULL OR lease_until <= ?)", (now,))
+            rows = conn.execute(
+                "SELECT id, received_at, name, email, subject, message, attempts FROM messages "
+                "WHERE status = 'pending' AND next_attempt <= ? ORDER BY id LIMIT ?",
+                (now, self.batch_size)).fetchall()
+            conn.executemany(
+                "UPDATE messages SET status = 'sending', claim_token = ?, lease_until = ? "
+                "WHERE id = ?",
+                [(token, now + self.lease, r['id']) for r in rows])
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return token, [dict(r) for r in rows]
+
+    def _release(self, token, batch, error):
+        """Put a failed batch back with exponential backoff.
+
+        Rows whose lease was taken over by another worker are left alone.
+        """
+        now = time.time()
+        updates = []
+        for message in batch:
+            attempts = message['attempts'] + 1
+            status = 'failed' if attempts >= self.max_attempts else 'pending'
+            delay = self.retry_delay * 2 ** (attempts - 1)
+            updates.append((status, attempts, now + delay, error, message['id'], token))
+        with self._connect() as conn:
+            conn.executemany(
+                'UPDATE messages SET status = ?, attempts = ?, next_attempt = ?, last_error = ?, '
+                'claim_token = NULL, lease_until = NULL WHERE id = ? AND claim_token = ?', updates)
+
+    def _ensure_worker(self):
+        """Start the drain thread once per (forked) process."""
+        pid = os.getpid()
+        if self._worker_pid == pid:
+            return
+        with self._worker_lock:
+            if self._worker_pid == pid:
+                return
+            self._worker_pid = pid
+            self._wakeup = threading.Event()
+            thread = threading.Thread(target=self._drain_loop, name='contact-drain', daemon=True)
+            thread.start()
+
+    def _drain_loop(self):
+        last_prune = 0.0
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                self.drain()
+                if time.monotonic() - last_prune >= 3600:
+                    self.prune()
+                    last_prune = time.monotonic()
+            except Exception as e:
+                print(f"Error draining contact queue: {e}")
@@ -20,7 +20,7 @@ APP_NAME="geovis_website"
 APP_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 SERVICE_USER="$USER"
 VENV_DIR="$APP_DIR/venv"
-GUNICORN_WORKERS=4
+GUNICORN_WORKERS=""  # empty = sized from CPU count (see gunicorn_config.py)
 GUNICORN_PORT=8000
 
 echo -e "${YELLOW}Configuration:${NC}"
@@ -28,7 +28,7 @@ echo "  App Name: $APP_NAME"
 echo "  App Directory: $APP_DIR"
 echo "  Service User: $SERVICE_USER"
 echo "  Virtual Environment: $VENV_DIR"
-echo "  Gunicorn Workers: $GUNICORN_WORKERS"
+echo "  Gunicorn Workers: ${GUNICORN_WORKERS:-auto}"
 echo "  Port: $GUNICORN_PORT"
 echo ""
 
@@ -59,45 +59,13 @@ echo -e "${GREEN}Step 3: Installing Python dependencies...${NC}"
 source "$VENV_DIR/bin/activate"
 pip install --upgrade pip
 pip install -r "$APP_DIR/requirements.txt"
-pip install gunicorn
-
-# Step 4: Create Gunicorn configuration file
-echo -e "${GREEN}Step 4: Creating Gunicorn configuration...${NC}"
-cat > "$APP_DIR/gunicorn_config.py" << EOF
-# Gunicorn configuration file
-import multiprocessing
-
-# Server socket
-bind = '0.0.0.0:$GUNICORN_PORT'
-backlog = 2048
-
-# Worker processes
-workers = $GUNICORN_WORKERS
-worker_class = 'sync'
-worker_connections = 1000
-timeout = 30
-keepalive = 2
-
-# Logging
-accesslog = '$APP_DIR/logs/gunicorn-access.log'
-errorlog = '$APP_DIR/logs/gunicorn-error.log'
-loglevel = 'info'
-
-# Process naming
-proc_name = '$APP_NAME'
-
-# Server mechanics
-daemon = False
-pidfile = '$APP_DIR/logs/gunicorn.pid'
-umask = 0
-user = None
-group = None
-tmp_upload_dir = None
-
-# SSL (uncomment if using HTTPS)
-# keyfile = '/path/to/keyfile'
-# certfile = '/path/to/certfile'
-EOF
+# Content-hashed copies of static files, served as immutable by Nginx
+python "$APP_DIR/assets.py"
+
+# Step 4: Gunicorn configuration
+# gunicorn_config.py is versioned with the app; deployment-specific values
+# are passed as GUNICORN_* environment variables in the systemd unit below
+echo -e "${GREEN}Step 4: Using Gunicorn configuration from gunicorn_config.py...${NC}"
 
 # Step 5: Create logs directory
 echo -e "${GREEN}Step 5: Creating logs directory...${NC}"
@@ -115,7 +83,16 @@ User=$SERVICE_USER
 Group=www-data
 WorkingDirectory=$APP_DIR
 Environment="PATH=$VENV_DIR/bin"
+Environment="GUNICORN_BIND=0.0.0.0:$GUNICORN_PORT"
+Environment="GUNICORN_WORKERS=$GUNICORN_WORKERS"
+Environment="GUNICORN_ACCESSLOG=$APP_DIR/logs/gunicorn-access.log"
+Environment="GUNICORN_ERRORLOG=$APP_DIR/logs/gunicorn-error.log"
+Environment="GUNICORN_PIDFILE=$APP_DIR/logs/gunicorn.pid"
+Environment="GUNICORN_PROC_NAME=$APP_NAME"
 ExecStart=$VENV_DIR/bin/gunicorn --config $APP_DIR/gunicorn_config.py app:app
+ExecReload=/bin/kill -s HUP \$MAINPID
+KillMode=mixed
+TimeoutStopSec=40
 
 [Install]
 WantedBy=multi-user.target
@@ -124,6 +101,25 @@ EOF
 # Step 7: Create Nginx configuration
 echo -e "${GREEN}Step 7: Creating Nginx configuration...${NC}"
 $USE_SUDO tee /etc/nginx/sites-available/${APP_NAME} > /dev/null << EOF
+# Pre-rendered snapshots (prerender.py) for the exact read-only URLs
+map \$request_uri \$prerendered {
+    default                             /-;
+    /                                   /index.html;
+    /api/maps                           /api/maps.json;
+    "/api/maps?category=2d"             /api/maps-2d.json;
+    "/api/maps?category=interactive"    /api/maps-interactive.json;
+    /api/stats                          /api/stats.json;
+    /api/categories                     /api/categories.json;
+}
+
+map \$prerendered \$prerendered_expires {
+    default                 off;
+    /index.html             epoch;
+    /api/stats.json         10s;
+    /api/categories.json    1h;
+    ~^/api/maps             60s;
+}
+
 server {
     listen 80;
     server_name localhost;  # Change this to your domain name
@@ -137,6 +133,12 @@ server {
     access_log /var/log/nginx/${APP_NAME}_access.log;
     error_log /var/log/nginx/${APP_NAME}_error.log;
 
+    # Fingerprinted static files (assets.py): content never changes
+    location /static/dist/ {
+        alias $APP_DIR/static/dist/;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+
     # Static files
     location /static {
         alias $APP_DIR/static;
@@ -144,8 +146,16 @@ server {
         add_header Cache-Control "public, immutable";
     }
 
-    # Proxy to Gunicorn
+    # Pre-rendered pages and API responses, Gunicorn as fallback
     location / {
+        root $APP_DIR/instance/prerendered/current;
+        try_files \$prerendered @gunicorn;
+        expires \$prerendered_expires;
+        gzip_static on;
+    }
+
+    # Proxy to Gunicorn
+    location @gunicorn {
         proxy_pass http://127.0.0.1:$GUNICORN_PORT;
         proxy_set_header Host \$host;
         proxy_set_header X-Real-IP \$remote_addr;
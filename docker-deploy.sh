@@ -45,6 +45,10 @@ $DOCKER_COMPOSE down 2>/dev/null || true
 # echo -e "${GREEN}Removing old images...${NC}"
 # docker images | grep geovis_website_m2 | awk '{print $3}' | xargs -r docker rmi -f 2>/dev/null || true
 
+# Fingerprint static assets on the host: nginx serves ./static directly
+echo -e "${GREEN}Fingerprinting static assets...${NC}"
+python3 assets.py
+
 # Build and start containers
 echo -e "${GREEN}Building Docker images (no cache)...${NC}"
 $DOCKER_COMPOSE build --no-cache
@@ -23,7 +23,8 @@ fi
 echo -e "${GREEN}Step 1: Stopping containers...${NC}"
 $DOCKER_COMPOSE down
 
-echo -e "${GREEN}Step 2: Rebuilding images...${NC}"
+echo -e "${GREEN}Step 2: Fingerprinting static assets and rebuilding images...${NC}"
+python3 assets.py
 $DOCKER_COMPOSE build --no-cache
 
 echo -e "${GREEN}Step 3: Starting containers...${NC}"
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Vérification hors ligne du moteur de capture (capture_screenshots.py).
+
+Sert les pages de ce dossier avec http.server sur un port libre, lance
+`capture_maps` dessus, puis contrôle les pixels des screenshots :
+- canvas.html : carte dessinée dans un canvas après quelques frames ;
+- slow-paint.html : canvas dessiné bien après que le réseau est au repos ;
+- cookie-banner.html : bannière plein écran fermée par « Tout accepter » ;
+- flaky.html : 503 au premier essai, puis la carte (retentatives).
+
+Nécessite Playwright et Chromium (python -m playwright install chromium).
+
+Usage:
+    python fixtures/screenshots/check.py
+"""
+import asyncio
+import io
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from PIL import Image
+
+FIXTURES_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(FIXTURES_DIR)))
+
+import capture_screenshots  # noqa: E402
+
+SLOW_ASSET_DELAY = 1.0  # s
+SLOW_SVG = (b'<svg xmlns="http://www.w3.org/2000/svg" width="200" height="100">'
+            b'<rect width="200" height="100" fill="#1565c0"/></svg>')
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    """Sert les fixtures, plus une image lente et une page instable"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=FIXTURES_DIR, **kwargs)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        with self.server.lock:
+            self.server.hits[path] += 1
+            hits = self.server.hits[path]
+        if path == '/slow.svg':
+            time.sleep(SLOW_ASSET_DELAY)
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/svg+xml')
+            self.send_header('Content-Length', str(len(SLOW_SVG)))
+            self.end_headers()
+            self.wfile.write(SLOW_SVG)
+            return
+        if path == '/flaky.html':
+            if hits == 1:
+                self.send_error(503)
+                return
+            self.path = '/canvas.html'
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    """Démarre le serveur de fixtures dans un thread ; retourne (serveur, URL)"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    server.hits = Counter()
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def share(image, predicate):
+    """Part des pixels (image réduite) qui satisfont `predicate`"""
+    pixels = list(image.convert('RGB').resize((120, 80)).getdata())
+    return sum(1 for p in pixels if predicate(p)) / len(pixels)
+
+
+def is_map(pixel):
+    r, g, b = pixel
+    return b > 120 and r < 80
+
+
+def is_banner(pixel):
+    r, g, b = pixel
+    return r > 180 and g < 80 and b < 80
+
+
+# Le canvas 800×500 couvre ~40 % de la fenêtre 1200×800
+CHECKS = [
+    ('carte canvas dessinée', 'canvas.html',
+     lambda image, hits: share(image, is_map) > 0.3),
+    ('rendu lent attendu', 'slow-paint.html',
+     lambda image, hits: share(image, is_map) > 0.3),
+    ('bannière cookies fermée', 'cookie-banner.html',
+     lambda image, hits: share(image, is_banner) < 0.01 and share(image, is_map) > 0.3),
+    ('erreur HTTP retentée', 'flaky.html',
+     lambda image, hits: hits['/flaky.html'] == 2 and share(image, is_map) > 0.3),
+]
+
+
+def main():
+    server, base_url = start_server()
+    capture_screenshots.BACKOFF_BASE = 0.2
+    maps = [{'id': i, 'url': f'{base_url}/{page}'}
+            for i, (_, page, _) in enumerate(CHECKS, 1)]
+
+    start = time.monotonic()
+    try:
+        results = asyncio.run(capture_screenshots.capture_maps(maps, concurrency=2))
+    finally:
+        server.shutdown()
+    print(f"\n⏱  {time.monotonic() - start:.1f}s pour {len(maps)} captures\n")
+
+    failures = 0
+    for (name, _, check), result in zip(CHECKS, results):
+        ok = result['success'] and check(Image.open(io.BytesIO(result['data'])), server.hits)
+        print(f"{'✓' if ok else '✗'} {name}")
+        failures += not ok
+
+    if failures:
+        print(f"\n❌ {failures}/{len(CHECKS)} vérification(s) en échec")
+        sys.exit(1)
+    print(f"\n✅ {len(CHECKS)} vérifications réussies")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+// Dessine une « carte » (tuiles bleues bruitées) dans un canvas : assez de
+// détail pour que son PNG dépasse le seuil de PAINTED_JS
+function paintMap(canvas) {
+    const ctx = canvas.getContext('2d');
+    let seed = 42;
+    const random = () => (seed = (seed * 16807) % 2147483647) / 2147483647;
+    ctx.fillStyle = '#1565c0';
+    ctx.fillRect(0, 0, canvas.width, canvas.height);
+    for (let i = 0; i < 3000; i++) {
+        const shade = 100 + Math.floor(random() * 120);
+        ctx.fillStyle = `rgb(${Math.floor(shade / 5)}, ${Math.floor(shade / 1.6)}, ${shade + 30})`;
+        ctx.fillRect(random() * canvas.width, random() * canvas.height, 4 + random() * 12, 4 + random() * 12);
+    }
+}
@@ -0,0 +1,93 @@
+"""
+Gunicorn configuration for production.
+
+    gunicorn --config gunicorn_config.py app:app
+
+Every setting can be overridden from the environment (GUNICORN_*), so the
+Dockerfile, deploy.sh and start.sh share this file instead of repeating
+command-line flags. Defaults target small VPS hosts:
+
+- gthread workers: a few processes (CPU-bound JSON encoding and search) each
+  running a pool of threads for the I/O-bound routes (view counts, contact
+  queue, cache revalidation). GUNICORN_WORKER_CLASS=gevent switches to
+  cooperative async workers when gevent is installed; 'sync' is still
+  accepted.
+- preload_app: the app and the JSON catalog are loaded once in the master
+  and shared copy-on-write with forked workers, so each worker only pays for
+  the pages it dirties. The GC is frozen after warm-up to keep collections
+  from touching (and copying) the shared objects.
+- Graceful recycling: workers restart after max_requests (with jitter so
+  they do not all restart together) and get graceful_timeout to finish
+  in-flight requests and flush pending view counts.
+"""
+import gc
+import multiprocessing
+import os
+
+
+def _env_int(name, default):
+    value = os.environ.get(name, '')
+    return int(value) if value.strip() else default
+
+
+cpus = multiprocessing.cpu_count()
+
+# Server socket
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+backlog = _env_int('GUNICORN_BACKLOG', 2048)
+
+# Worker processes
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+max_workers = _env_int('GUNICORN_MAX_WORKERS', 8)
+if worker_class == 'sync':
+    # One request per process: the classic (2 x CPU) + 1
+    workers = _env_int('GUNICORN_WORKERS', min(cpus * 2 + 1, max_workers))
+else:
+    # Threads or greenlets provide the concurrency, processes the parallelism
+    workers = _env_int('GUNICORN_WORKERS', min(cpus + 1, max_workers))
+threads = _env_int('GUNICORN_THREADS', min(max(4, cpus * 2), 16))
+worker_connections = _env_int('GUNICORN_WORKER_CONNECTIONS', 1000)
+
+# gevent patches the stdlib in each worker after fork; locks created in a
+# preloaded master would stay unpatched, so preloading is off by default there
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0' if worker_class == 'gevent' else '1') == '1'
+
+# Recycling and timeouts
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 2000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10)
+timeout = _env_int('GUNICORN_TIMEOUT', 60)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+
+# Worker heartbeat files on tmpfs: a disk-backed /tmp (common in containers)
+# can stall the heartbeat and get healthy workers killed
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+# Logging ('-' is stdout/stderr, for Docker and journald)
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-')
+errorlog = os.environ.get('GUNICORN_ERRORLOG', '-')
+loglevel = os.environ.get('GUNICORN_LOGLEVEL', 'info')
+
+# Process naming
+proc_name = os.environ.get('GUNICORN_PROC_NAME', 'geovis_website')
+pidfile = os.environ.get('GUNICORN_PIDFILE') or None
+
+
+def when_ready(server):
+    """Warm the catalog in the master so workers inherit it already parsed."""
+    if not preload_app:
+        return
+    import app as application
+    # The SQLite backend keeps its data in the database (and its connections
+    # must not cross a fork), so only the in-memory JSON catalog is warmed
+    if application.app.config['CATALOG_BACKEND'] == 'json':
+        catalog = application.catalog_store.get()
+        server.log.info("Catalog preloaded: %d maps", len(catalog))
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    server.log.info("Worker spawned (pid: %s, class: %s, threads: %s)",
+                    worker.pid, worker_class, threads if worker_class == 'gthread' else 1)
@@ -0,0 +1,109 @@
+"""
+HTTP validators and conditional GET handling for the JSON API.
+
+Each response gets a strong ETag derived from the data versions it depends
+on. When the client already holds that version we answer 304 before the body
+is built or serialized. Otherwise the encoded body is served from the app's
+`ResponseCache` (if one is registered) in the best accepted encoding.
+"""
+import hashlib
+from datetime import datetime, timezone
+
+from flask import current_app, jsonify, request
+
+from metrics import phase
+
+
+def make_etag(*parts):
+    """Hash version parts (catalog version, view total, ...) into an ETag."""
+    key = '\x1f'.join(str(p) for p in parts)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]
+
+
+def cache_control_for(endpoint):
+    """Cache-Control value configured for `endpoint`, with optional SWR."""
+    config = current_app.config
+    value = config['API_CACHE_CONTROL'].get(endpoint, config['API_CACHE_CONTROL_DEFAULT'])
+    swr = config.get('API_STALE_WHILE_REVALIDATE')
+    if swr and 'no-store' not in value:
+        value = f"{value}, stale-while-revalidate={int(swr)}"
+    return value
+
+
+# Compressed representations get their own strong ETag
+ENCODING_ETAG_SUFFIXES = {'gzip': '-gz', 'br': '-br'}
+
+
+def _not_modified(etag, last_modified):
+    """Return the ETag the client already holds, or None if it must refetch."""
+    if request.if_none_match:
+        for suffix in ('', *ENCODING_ETAG_SUFFIXES.values()):
+            if request.if_none_match.contains_weak(etag + suffix):
+                return etag + suffix
+        return None
+    if last_modified is not None and request.if_modified_since is not None:
+        if last_modified.replace(microsecond=0) <= request.if_modified_since:
+            return etag
+    return None
+
+
+def _apply_validators(response, etag, last_modified):
+    encoding = response.headers.get('Content-Encoding')
+    if encoding in ENCODING_ETAG_SUFFIXES:
+        etag += ENCODING_ETAG_SUFFIXES[encoding]
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = cache_control_for(request.endpoint)
+    return response
+
+
+def _default_cache_key():
+    """Normalize the query string and URL arguments into a hashable key."""
+    return (tuple(sorted(request.args.items(multi=True))),
+            tuple(sorted((request.view_args or {}).items())))
+
+
+def _cached_response(build, cache, key):
+    payload = cache.get(key)
+    if payload is None:
+        data = build()
+        with phase('serialize'):
+            body = current_app.json.dumps(data, separators=(',', ':')) + '\n'
+            payload = cache.put(key, body.encode('utf-8'))
+    body, encoding = payload.select(request.accept_encodings)
+    response = current_app.response_class(body, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def conditional_json(build, *version_parts, last_modified=None, cache_key=None):
+    """Return `jsonify(build())`, or a bare 304 if the client is up to date.
+
+    `build` is only called when the body is actually needed. `last_modified`
+    may be a POSIX timestamp or an aware datetime. `cache_key` identifies the
+    request among others to the same endpoint; it defaults to the sorted
+    query string.
+    """
+    if isinstance(last_modified, (int, float)):
+        last_modified = datetime.fromtimestamp(last_modified, tz=timezone.utc)
+    etag = make_etag(request.endpoint, *version_parts)
+
+    cache = current_app.extensions.get('response_cache')
+    held_etag = _not_modified(etag, last_modified)
+    if held_etag:
+        response = current_app.response_class(status=304)
+        if cache is not None:
+            response.vary.add('Accept-Encoding')
+        return _apply_validators(response, held_etag, last_modified)
+    if cache is None:
+        data = build()
+        with phase('serialize'):
+            response = jsonify(data)
+    else:
+        if cache_key is None:
+            cache_key = _default_cache_key()
+        response = _cached_response(build, cache, (request.endpoint, cache_key, etag))
+    return _apply_validators(response, etag, last_modified)
@@ -0,0 +1,447 @@
+"""
+Request timing, hot-path phase timers and a Prometheus `/metrics` endpoint.
+
+Each worker keeps its own counters and latency histograms in memory and a
+background thread periodically writes them to `<metrics_dir>/<pid>.json`.
+A scrape of `/metrics` (served by any worker) sums every worker's snapshot,
+so totals are correct across gunicorn processes. Snapshots of workers that
+have exited are folded into an archive file, keeping counters monotonic
+across worker recycling.
+
+Requests also get a `Server-Timing` header with the phases timed through
+`phase()` (catalog load, filtering, serialization, ...). Setting
+`PROFILE_SLOW_REQUESTS` to a number of seconds turns on a sampling profiler
+that dumps the aggregated stacks of requests slower than that.
+
+Requests the app makes to itself (pre-rendering) set `INTERNAL_REQUEST` in
+their WSGI environ and are left out of every request metric.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import Response, current_app, g, has_request_context, request
+
+from view_counter import atomic_write_json, file_lock
+
+# WSGI environ key marking the app's own requests (see prerender.py)
+INTERNAL_REQUEST = 'geovis.internal_request'
+
+# Latency buckets in seconds (Prometheus `le` bounds, +Inf implied)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+HELP = {
+    'geovis_http_requests_total': ('counter', 'HTTP requests by endpoint, method and status'),
+    'geovis_http_request_duration_seconds': ('histogram', 'Request latency by endpoint'),
+    'geovis_phase_duration_seconds': ('histogram', 'Time spent in hot-path phases'),
+    'geovis_catalog_lookups_total': ('counter', 'Catalog store lookups by result (hit or reload)'),
+    'geovis_response_cache_lookups_total': ('counter', 'Response cache lookups by result'),
+    'geovis_response_cache_evictions_total': ('counter', 'Response cache evictions'),
+    'geovis_response_cache_bytes': ('gauge', 'Bytes held by response caches'),
+    'geovis_response_cache_entries': ('gauge', 'Entries held by response caches'),
+    'geovis_slow_requests_total': ('counter', 'Requests that exceeded the profiling threshold'),
+    'geovis_view_dedup_total': ('counter', 'View increments by dedup result (accepted or duplicate)'),
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Histogram:
+    __slots__ = ('buckets', 'sum', 'count')
+
+    def __init__(self, n_buckets, buckets=None, total=0.0, count=0):
+        self.buckets = list(buckets) if buckets else [0] * n_buckets
+        self.sum = total
+        self.count = count
+
+    def observe(self, value, bounds):
+        for i, bound in enumerate(bounds):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.sum += other.sum
+        self.count += other.count
+
+
+class Metrics:
+    """Per-worker metric registry, registered as `app.extensions['metrics']`."""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        # Collector counters inherited at fork, subtracted from snapshots
+        self._collector_base = {}
+        self._pid = os.getpid()
+        self._dirty = False
+        self._writer_pid = None
+        self.profiler = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_DIR', os.path.join(app.instance_path, 'metrics'))
+        app.config.setdefault('METRICS_WRITE_INTERVAL', 5.0)
+        app.config.setdefault('PROFILE_SLOW_REQUESTS', 0)
+        app.config.setdefault('PROFILE_INTERVAL', 0.005)
+        app.config.setdefault('PROFILE_DIR', os.path.join(app.instance_path, 'slow_requests'))
+        self.directory = app.config['METRICS_DIR']
+        self.write_interval = app.config['METRICS_WRITE_INTERVAL']
+        os.makedirs(self.directory, exist_ok=True)
+        if app.config['PROFILE_SLOW_REQUESTS']:
+            self.profiler = SlowRequestProfiler(
+                self, app.config['PROFILE_SLOW_REQUESTS'], app.config['PROFILE_INTERVAL'],
+                app.config['PROFILE_DIR'])
+
+        app.extensions['metrics'] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    # -- recording --------------------------------------------------------
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._check_fork()
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._dirty = True
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._check_fork()
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(len(LATENCY_BUCKETS))
+            histogram.observe(value, LATENCY_BUCKETS)
+            self._dirty = True
+
+    def register_collector(self, collect):
+        """Register `collect()` -> iterable of (kind, name, labels, value).
+
+        `kind` is 'counter' for cumulative per-worker values (summed across
+        workers, archived when a worker exits) or 'gauge' for live values
+        (summed across running workers only).
+        """
+        self._collectors.append(collect)
+        return collect
+
+    def _collect(self):
+        """Collector rows, with counters relative to their value at fork."""
+        counters, gauges = [], []
+        for collect in self._collectors:
+            for kind, name, labels, value in collect():
+                if kind == 'counter':
+                    value -= self._collector_base.get(_key(name, labels), 0)
+                    counters.append([name, labels, value])
+                else:
+                    gauges.append([name, labels, value])
+        return counters, gauges
+
+    def _check_fork(self):
+        """A forked worker starts from zero: its parent's counts are its own.
+
+        Collector counters (catalog lookups, response cache hits, ...) live
+        in objects the worker inherited, so their values at fork become a
+        baseline instead. Caller holds the lock.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._counters = {}
+            self._histograms = {}
+            # Raw values first, then remember them as the baseline
+            self._collector_base = {}
+            self._collector_base = {_key(name, labels): value
+                                    for name, labels, value in self._collect()[0]}
+
+    # -- request hooks ----------------------------------------------------
+
+    def _before_request(self):
+        self._ensure_writer()
+        if request.environ.get(INTERNAL_REQUEST):
+            return
+        g.metrics_start = time.perf_counter()
+        g.metrics_phases = []
+        if self.profiler is not None:
+            self.profiler.start_request()
+
+    def _after_request(self, response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        duration = time.perf_counter() - start
+        endpoint = request.endpoint or 'unmatched'
+        self.observe('geovis_http_request_duration_seconds', duration, endpoint=endpoint)
+        self.inc('geovis_http_requests_total', endpoint=endpoint, method=request.method,
+                 status=str(response.status_code))
+
+        timings = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in g.pop('metrics_phases', [])]
+        timings.append(f"total;dur={duration * 1000:.2f}")
+        response.headers['Server-Timing'] = ', '.join(timings)
+
+        if self.profiler is not None:
+            self.profiler.finish_request(endpoint, duration)
+        return response
+
+    # -- cross-worker aggregation ----------------------------------------
+
+    def snapshot(self):
+        with self._lock:
+            self._check_fork()
+            counters = [[n, dict(l), v] for (n, l), v in self._counters.items()]
+            histograms = [[n, dict(l), h.buckets, h.sum, h.count]
+                          for (n, l), h in self._histograms.items()]
+        collected, gauges = self._collect()
+        counters += collected
+        return {'pid': os.getpid(), 'counters': counters, 'histograms': histograms,
+                'gauges': gauges}
+
+    def write_snapshot(self):
+        self._dirty = False
+        try:
+            atomic_write_json(os.path.join(self.directory, f'{os.getpid()}.json'), self.snapshot())
+        except OSError as e:
+            print(f"Error writing metrics snapshot: {e}")
+
+    def _ensure_writer(self):
+        """Start the snapshot writer thread once per (forked) process.
+
+        Snapshots are written off the request path; a worker that served
+        nothing since its last snapshot does not rewrite it.
+        """
+        if self._writer_pid == os.getpid():
+            return
+        with self._lock:
+            self._check_fork()
+            if self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+        threading.Thread(target=self._write_loop, name='metrics-writer', daemon=True).start()
+
+    def _write_loop(self):
+        while True:
+            time.sleep(self.write_interval)
+            try:
+                if self._dirty:
+                    self.write_snapshot()
+            except Exception as e:
+                print(f"Error writing metrics snapshot: {e}")
+
+    def _archive_dead_workers(self):
+        """Fold snapshots of exited workers into archive.json. Caller holds the lock."""
+        archive_path = os.path.join(self.directory, 'archive.json')
+        archive = _load(archive_path) or {'counters': [], 'histograms': []}
+        dead = []
+        for name in os.listdir(self.directory):
+            stem, ext = os.path.splitext(name)
+            if ext != '.json' or not stem.isdigit() or _alive(int(stem)):
+                continue
+            snapshot = _load(os.path.join(self.directory, name))
+            if snapshot:
+                archive = _merge([archive, {'counters': snapshot['counters'],
+                                            'histograms': snapshot['histograms']}])
+            dead.append(name)
+        if dead:
+            atomic_write_json(archive_path, archive)
+            for name in dead:
+                os.unlink(os.path.join(self.directory, name))
+
+    def aggregate(self):
+        """Sum the snapshots of every worker (plus exited ones)."""
+        self.write_snapshot()
+        with file_lock(os.path.join(self.directory, '.lock')):
+            self._archive_dead_workers()
+            snapshots = [_load(os.path.join(self.directory, name))
+                         for name in sorted(os.listdir(self.directory)) if name.endswith('.json')]
+        return _merge([s for s in snapshots if s])
+
+    def metrics_view(self):
+        return Response(render_prometheus(self.aggregate()),
+                        mimetype='text/plain; version=0.0.4')
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _load(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _merge(snapshots):
+    counters = {}
+    gauges = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for table, rows in ((counters, snapshot.get('counters', ())),
+                            (gauges, snapshot.get('gauges', ()))):
+            for name, labels, value in rows:
+                key = _key(name, labels)
+                table[key] = table.get(key, 0) + value
+        for name, labels, buckets, total, count in snapshot.get('histograms', ()):
+            key = _key(name, labels)
+            histogram = Histogram(len(buckets), buckets, total, count)
+            if key in histograms:
+                histograms[key].merge(histogram)
+            else:
+                histograms[key] = histogram
+    return {
+        'counters': [[n, dict(l), v] for (n, l), v in counters.items()],
+        'gauges': [[n, dict(l), v] for (n, l), v in gauges.items()],
+        'histograms': [[n, dict(l), h.buckets, h.sum, h.count] for (n, l), h in histograms.items()],
+    }
+
+
+def _labels(labels, **extra):
+    items = sorted(labels.items()) + list(extra.items())
+    if not items:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in items)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + '}'
+
+
+def render_prometheus(aggregate):
+    """Render aggregated metrics in the Prometheus text exposition format."""
+    def by_series(row):
+        return row[0], sorted(row[1].items())
+
+    families = {}
+    for name, labels, value in sorted(aggregate['counters'] + aggregate.get('gauges', []), key=by_series):
+        families.setdefault(name, []).append(f'{name}{_labels(labels)} {value}')
+    for name, labels, buckets, total, count in sorted(aggregate['histograms'], key=by_series):
+        lines = families.setdefault(name, [])
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS, buckets):
+            cumulative += n
+            lines.append(f'{name}_bucket{_labels(labels, le=repr(bound))} {cumulative}')
+        lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {count}')
+        lines.append(f'{name}_sum{_labels(labels)} {total}')
+        lines.append(f'{name}_count{_labels(labels)} {count}')
+
+    out = []
+    for name in sorted(families):
+        kind, description = HELP.get(name, ('untyped', name))
+        out.append(f'# HELP {name} {description}')
+        out.append(f'# TYPE {name} {kind}')
+        out.extend(families[name])
+    return '\n'.join(out) + '\n'
+
+
+@contextmanager
+def phase(name):
+    """Time a block as `name` in Server-Timing and the phase histogram.
+
+    A no-op outside of a request, in internal requests or when metrics are
+    not installed.
+    """
+    if (not has_request_context() or 'metrics' not in current_app.extensions or
+            request.environ.get(INTERNAL_REQUEST)):
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        g.setdefault('metrics_phases', []).append((name, seconds))
+        current_app.extensions['metrics'].observe('geovis_phase_duration_seconds', seconds, phase=name)
+
+
+class SlowRequestProfiler:
+    """Samples the stacks of in-flight requests and dumps the slow ones.
+
+    A daemon thread polls `sys._current_frames()` every `interval` seconds
+    for threads serving a request that has run longer than half the
+    threshold. Once a request finishes above `threshold`, its aggregated
+    samples are written to `directory` as a collapsed-stack text file.
+    """
+
+    def __init__(self, metrics, threshold, interval, directory):
+        self.metrics = metrics
+        self.threshold = float(threshold)
+        self.interval = float(interval)
+        self.directory = directory
+        self._active = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        os.makedirs(directory, exist_ok=True)
+
+    def start_request(self):
+        self._ensure_sampler()
+        with self._lock:
+            self._active[threading.get_ident()] = (time.perf_counter(), Counter())
+
+    def finish_request(self, endpoint, duration):
+        with self._lock:
+            _, samples = self._active.pop(threading.get_ident(), (None, None))
+        if duration < self.threshold or samples is None:
+            return
+        self.metrics.inc('geovis_slow_requests_total', endpoint=endpoint)
+        path = os.path.join(self.directory,
+                            f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{endpoint}.txt")
+        lines = [f"# {request.method} {request.full_path} {duration * 1000:.1f} ms, "
+                 f"{sum(samples.values())} samples every {self.interval * 1000:.0f} ms"]
+        lines += [f"{stack} {n}" for stack, n in samples.most_common()]
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+        except OSError as e:
+            print(f"Error writing slow request profile: {e}")
+
+    def _ensure_sampler(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._active = {}
+            threading.Thread(target=self._sample_loop, name='slow-request-sampler', daemon=True).start()
+
+    def _sample_loop(self):
+        warmup = self.threshold / 2
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            with self._lock:
+                watched = [tid for tid, (start, _) in self._active.items() if now - start >= warmup]
+            if not watched:
+                continue
+            frames = sys._current_frames()
+            stacks = []
+            for tid in watched:
+                frame = frames.get(tid)
+                if frame is not None:
+                    stacks.append((tid, ';'.join(
+                        f"{os.path.basename(f.filename)}:{f.name}:{f.lineno}"
+                        for f in traceback.extract_stack(frame))))
+            with self._lock:
+                # Requests that finished meanwhile are no longer in _active
+                for tid, stack in stacks:
+                    entry = self._active.get(tid)
+                    if entry is not None:
+                        entry[1][stack] += 1
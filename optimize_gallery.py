@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Script pour générer les dérivés responsive des images de galerie.
+
+Parcourt chaque `images[].url` de maps.json et produit, pour chaque image :
+- des variantes WebP à plusieurs largeurs (srcset) ;
+- un placeholder flou très basse résolution (data URI) ;
+puis réécrit dans maps.json les URL des variantes, les dimensions
+intrinsèques et le placeholder, pour que le frontend charge les images en
+différé avec le bon ratio.
+
+Comme optimize_thumbnails.py, le traitement est parallèle et incrémental
+(manifeste d'empreintes SHA-256).
+
+Usage:
+    python optimize_gallery.py            # images modifiées uniquement
+    python optimize_gallery.py --force    # tout retraiter
+"""
+import argparse
+import base64
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from PIL import Image
+
+from optimize_thumbnails import (
+    IMAGE_EXTENSIONS, encode_within_budget, file_sha256, resize_to_width, write_atomic,
+)
+from view_counter import catalog_lock_path, update_catalog_json
+
+# Configuration
+SCRIPT_DIR = Path(__file__).parent
+STATIC_DIR = SCRIPT_DIR / 'static'
+MAPS_JSON = STATIC_DIR / 'data' / 'maps.json'
+DERIVATIVES_DIR = STATIC_DIR / 'images' / 'derivatives'
+MANIFEST_PATH = DERIVATIVES_DIR / 'manifest.json'
+# Même verrou que l'application (dossier instance, INSTANCE_PATH) : maps.json
+# n'est jamais réécrit en parallèle
+CATALOG_LOCK = Path(catalog_lock_path())
+
+GALLERY_WIDTHS = (480, 960, 1600)
+GALLERY_QUALITY = 80
+GALLERY_MAX_FILE_SIZE = 300 * 1024  # 300 KB max par variante
+PLACEHOLDER_WIDTH = 24
+PLACEHOLDER_QUALITY = 30
+
+# Incrémenter pour forcer un retraitement complet après un changement de logique
+PIPELINE_VERSION = 1
+
+
+def url_to_path(url):
+    """/static/images/x.png -> <repo>/static/images/x.png (None hors de /static/)"""
+    if not url.startswith('/static/'):
+        return None
+    return STATIC_DIR / url[len('/static/'):]
+
+
+def path_to_url(path):
+    return '/static/' + path.relative_to(STATIC_DIR).as_posix()
+
+
+def derivative_stem(source):
+    """Chemin de sortie (sans largeur ni extension) miroir de l'arborescence source"""
+    relative = source.relative_to(STATIC_DIR / 'images')
+    return DERIVATIVES_DIR / relative.parent / relative.stem
+
+
+def make_placeholder(img):
+    small = resize_to_width(img, PLACEHOLDER_WIDTH)
+    data, _ = encode_within_budget(small, 'WEBP', PLACEHOLDER_QUALITY)
+    return 'data:image/webp;base64,' + base64.b64encode(data).decode('ascii')
+
+
+def process_image(source):
+    """Génère variantes + placeholder pour une image (exécuté dans le pool)"""
+    source = Path(source)
+    try:
+        with Image.open(source) as img:
+            img.load()
+            width, height = img.size
+            img = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+        stem = derivative_stem(source)
+        stem.parent.mkdir(parents=True, exist_ok=True)
+        variants = []
+        for target in sorted({min(w, width) for w in GALLERY_WIDTHS}):
+            resized = resize_to_width(img, target)
+            data, _ = encode_within_budget(resized, 'WEBP', GALLERY_QUALITY, GALLERY_MAX_FILE_SIZE)
+            output = stem.with_name(f"{stem.name}-{target}w.webp")
+            write_atomic(output, data)
+            variants.append({
+                'url': path_to_url(output),
+                'width': resized.width,
+                'height': resized.height,
+                'bytes': len(data),
+            })
+
+        return {
+            'success': True,
+            'width': width,
+            'height': height,
+            'placeholder': make_placeholder(img),
+            'variants': variants,
+        }
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+    if manifest.get('version') != PIPELINE_VERSION:
+        manifest = {'version': PIPELINE_VERSION, 'images': {}}
+    return manifest
+
+
+def gallery_sources(data):
+    """URL des images de galerie référencées dans maps.json (sans les vidéos)"""
+    urls = []
+    for map_item in data.get('maps', []):
+        for img in map_item.get('images', []):
+            url = img if isinstance(img, str) else img.get('url', '')
+            is_video = isinstance(img, dict) and img.get('type') == 'video'
+            if not is_video and url.lower().endswith(IMAGE_EXTENSIONS) and url not in urls:
+                urls.append(url)
+    return urls
+
+
+def apply_to_catalog(entries):
+    """Écrit dimensions, variantes et placeholders dans maps.json
+
+    Le fichier n'est réécrit que si une image change réellement : un passage
+    sans nouveauté ne change ni la version du catalogue ni les ETag.
+    """
+    def apply(data):
+        updated = 0
+        for map_item in data.get('maps', []):
+            images = map_item.get('images', [])
+            for index, img in enumerate(images):
+                entry = entries.get(img if isinstance(img, str) else img.get('url'))
+                if entry is None:
+                    continue
+                new = dict({'url': img} if isinstance(img, str) else img,
+                           width=entry['width'], height=entry['height'],
+                           placeholder=entry['placeholder'],
+                           variants=[{k: v[k] for k in ('url', 'width', 'height')}
+                                     for v in entry['variants']])
+                if new != img:
+                    images[index] = new
+                    updated += 1
+        return updated
+
+    return update_catalog_json(str(MAPS_JSON), apply, str(CATALOG_LOCK))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère les dérivés responsive des images de galerie")
+    parser.add_argument('--force', action='store_true', help="Retraiter même les images inchangées")
+    parser.add_argument('--workers', type=int, default=None, help="Nombre de processus (défaut : nombre de cœurs)")
+    args = parser.parse_args()
+
+    print("🖼️  Génération des dérivés des images de galerie...")
+    print("=" * 60)
+
+    with open(MAPS_JSON, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    manifest = load_manifest()
+    entries = manifest['images']
+    todo = {}
+    missing = 0
+    for url in gallery_sources(data):
+        source = url_to_path(url)
+        if source is None or not source.exists():
+            print(f"⚠️  Introuvable: {url}")
+            missing += 1
+            continue
+        sha256 = file_sha256(source)
+        entry = entries.get(url)
+        up_to_date = (entry is not None and entry.get('sha256') == sha256 and
+                      all(url_to_path(v['url']).exists() for v in entry['variants']))
+        if args.force or not up_to_date:
+            todo[url] = (source, sha256)
+
+    print(f"📊 {len(todo)} images à traiter ({len(entries)} déjà dans le manifeste)\n")
+
+    failures = 0
+    if todo:
+        with ProcessPoolExecutor(max_workers=args.workers or os.cpu_count()) as pool:
+            futures = {pool.submit(process_image, source): url for url, (source, _) in todo.items()}
+            for future in as_completed(futures):
+                url = futures[future]
+                result = future.result()
+                if not result['success']:
+                    failures += 1
+                    print(f"❌ {url}: {result['error']}")
+                    continue
+                result.pop('success')
+                result['sha256'] = todo[url][1]
+                entries[url] = result
+                original = url_to_path(url).stat().st_size
+                largest = result['variants'][-1]['bytes']
+                print(f"✅ {url}")
+                print(f"   {original / 1024:.1f} KB → {largest / 1024:.1f} KB ({len(result['variants'])} variantes)")
+
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(MANIFEST_PATH, json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+    updated = apply_to_catalog(entries)
+
+    print("\n" + "=" * 60)
+    print(f"📈 Résultats:")
+    print(f"   Images traitées: {len(todo) - failures}/{len(todo)} ({failures} échecs, {missing} introuvables)")
+    print(f"   Entrées mises à jour dans maps.json: {updated}")
+    print(f"   Dossier de sortie: {DERIVATIVES_DIR}")
+
+if __name__ == "__main__":
+    main()
@@ -2,108 +2,360 @@
 """
 Script pour optimiser les thumbnails pour l'affichage rapide sur la page d'accueil.
 Crée des versions compressées dans un dossier séparé.
+
+Le traitement est parallèle (un processus par cœur) et incrémental : un
+manifeste d'empreintes SHA-256 permet de sauter les images inchangées.
+Chaque thumbnail est décliné en WebP/AVIF + JPEG (ou PNG si transparence)
+à plusieurs largeurs (srcset), et la qualité est ajustée jusqu'à respecter
+MAX_FILE_SIZE. Les variantes de chaque thumbnail sont ensuite inscrites dans
+maps.json (`thumbnail_variants`) pour que MapCard.js les serve en
+<picture>/srcset.
+
+Usage:
+    python optimize_thumbnails.py                 # images modifiées uniquement
+    python optimize_thumbnails.py --force         # tout retraiter
+    python optimize_thumbnails.py map-3.png       # certaines images seulement
 """
+import argparse
+import hashlib
+import io
+import json
 import os
-from PIL import Image
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
+from PIL import Image, features
+
+from view_counter import catalog_lock_path, update_catalog_json
+
 # Configuration
 SCRIPT_DIR = Path(__file__).parent
 THUMBNAILS_DIR = SCRIPT_DIR / 'static' / 'images' / 'thumbnails'
 THUMBNAILS_OPTIMIZED_DIR = SCRIPT_DIR / 'static' / 'images' / 'thumbnails-optimized'
+MANIFEST_NAME = 'manifest.json'
+MAPS_JSON = SCRIPT_DIR / 'static' / 'data' / 'maps.json'
+# Même verrou que l'application : maps.json n'est jamais réécrit en parallèle
+CATALOG_LOCK = Path(catalog_lock_path())
+THUMBNAILS_URL = '/static/images/thumbnails/'
+THUMBNAILS_OPTIMIZED_URL = '/static/images/thumbnails-optimized/'
 
-# Créer le dossier de sortie s'il n'existe pas
-THUMBNAILS_OPTIMIZED_DIR.mkdir(parents=True, exist_ok=True)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
 
 # Configuration de compression
 TARGET_SIZE = (400, 300)  # Taille pour les cartes
 QUALITY = 75  # Qualité JPEG (0-100)
+MIN_QUALITY = 35  # Qualité plancher de la recherche
 MAX_FILE_SIZE = 100 * 1024  # 100 KB max par thumbnail
 
-def optimize_image(input_path, output_path):
-    """Optimise une image pour le web"""
+# Largeurs générées pour srcset, et formats modernes (si Pillow les supporte)
+SRCSET_WIDTHS = (320, 640, 960)
+MODERN_FORMATS = tuple(f for f in ('WEBP', 'AVIF') if features.check(f.lower()))
+
+# Qualité maximale par format (l'échelle AVIF est plus « compressive »)
+FORMAT_QUALITY = {'JPEG': QUALITY, 'WEBP': QUALITY, 'AVIF': 50}
+
+SAVE_OPTIONS = {
+    'JPEG': {'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'method': 6},
+    'AVIF': {'speed': 6},
+}
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'AVIF': 'avif'}
+MIME_TYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp', 'avif': 'image/avif'}
+
+# Incrémenter pour forcer un retraitement complet après un changement de logique
+PIPELINE_VERSION = 2
+
+
+def settings_signature():
+    """Empreinte des réglages : si elle change, tout est retraité."""
+    settings = [PIPELINE_VERSION, TARGET_SIZE, FORMAT_QUALITY, MIN_QUALITY, MAX_FILE_SIZE,
+                SRCSET_WIDTHS, MODERN_FORMATS]
+    return hashlib.sha256(json.dumps(settings).encode()).hexdigest()[:16]
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def has_alpha(img):
+    return img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+
+
+def encode(img, output_format, quality=None):
+    buffer = io.BytesIO()
+    options = dict(SAVE_OPTIONS.get(output_format, {}))
+    if quality is not None:
+        options['quality'] = quality
+    img.save(buffer, format=output_format, **options)
+    return buffer.getvalue()
+
+
+def encode_within_budget(img, output_format, max_quality=QUALITY, max_bytes=MAX_FILE_SIZE):
+    """Encode avec la meilleure qualité qui tient dans `max_bytes`.
+
+    Recherche dichotomique sur la qualité pour les formats avec perte ;
+    réduction à 256 couleurs pour le PNG s'il dépasse le budget.
+    Retourne (données, qualité).
+    """
+    if output_format == 'PNG':
+        data = encode(img, 'PNG')
+        if len(data) > max_bytes:
+            quantized = img.quantize(256, method=Image.Quantize.FASTOCTREE)
+            data = min(data, encode(quantized, 'PNG'), key=len)
+        return data, None
+
+    best = encode(img, output_format, max_quality)
+    if len(best) <= max_bytes:
+        return best, max_quality
+
+    low, high = MIN_QUALITY, max_quality - 1
+    best_quality = MIN_QUALITY
+    best = None
+    while low <= high:
+        quality = (low + high) // 2
+        data = encode(img, output_format, quality)
+        if len(data) <= max_bytes:
+            best, best_quality = data, quality
+            low = quality + 1
+        else:
+            high = quality - 1
+    if best is None:
+        # Même la qualité plancher dépasse le budget : on la garde quand même
+        best = encode(img, output_format, MIN_QUALITY)
+    return best, best_quality
+
+
+def write_atomic(path, data):
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def resize_to_width(img, width):
+    if img.width <= width:
+        return img
+    height = max(1, round(img.height * width / img.width))
+    return img.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def optimize_image(input_path, output_dir):
+    """Optimise une image pour le web (exécuté dans un processus du pool)"""
+    input_path = Path(input_path)
+    output_dir = Path(output_dir)
     try:
         with Image.open(input_path) as img:
-            # Convertir RGBA en RGB pour PNG->JPEG
-            if img.mode in ('RGBA', 'LA', 'P'):
-                # Garder PNG pour les images avec transparence
-                output_format = 'PNG'
-                quality = 85
-            else:
-                output_format = 'JPEG'
-                quality = QUALITY
-            
-            # Redimensionner avec aspect ratio
-            img.thumbnail(TARGET_SIZE, Image.Resampling.LANCZOS)
-            
-            # Sauvegarder en optimisant
-            img.save(
-                output_path,
-                format=output_format,
-                quality=quality,
-                optimize=True
-            )
-            
-            original_size = os.path.getsize(input_path)
-            optimized_size = os.path.getsize(output_path)
-            reduction = ((original_size - optimized_size) / original_size) * 100
-            
-            return {
-                'success': True,
-                'original': original_size,
-                'optimized': optimized_size,
-                'reduction': reduction
-            }
+            # Décodage JPEG réduit : inutile de décoder 8000 px pour produire 960 px
+            img.draft('RGB', (max(SRCSET_WIDTHS), max(SRCSET_WIDTHS)))
+            img.load()
+            transparent = has_alpha(img)
+            img = img.convert('RGBA' if transparent else 'RGB')
+
+        outputs = []
+
+        def save(path, image, output_format, max_quality=QUALITY):
+            data, quality = encode_within_budget(image, output_format, max_quality)
+            write_atomic(path, data)
+            outputs.append({
+                'file': path.name,
+                'format': EXTENSIONS[output_format],
+                'width': image.width,
+                'height': image.height,
+                'bytes': len(data),
+                'quality': quality,
+            })
+
+        # Version historique (même nom que l'original) utilisée par MapCard.js
+        # Garder PNG pour les images avec transparence
+        legacy = img.copy()
+        legacy.thumbnail(TARGET_SIZE, Image.Resampling.LANCZOS)
+        save(output_dir / input_path.name, legacy, 'PNG' if transparent else 'JPEG',
+             85 if transparent else QUALITY)
+
+        # Variantes srcset : formats modernes + format de repli
+        fallback_format = 'PNG' if transparent else 'JPEG'
+        widths = sorted({min(w, img.width) for w in SRCSET_WIDTHS})
+        for width in widths:
+            resized = resize_to_width(img, width)
+            for output_format in MODERN_FORMATS + (fallback_format,):
+                name = f"{input_path.stem}-{width}w.{EXTENSIONS[output_format]}"
+                save(output_dir / name, resized, output_format, FORMAT_QUALITY.get(output_format))
+
+        original_size = os.path.getsize(input_path)
+        legacy_size = outputs[0]['bytes']
+        return {
+            'success': True,
+            'original': original_size,
+            'optimized': legacy_size,
+            'reduction': ((original_size - legacy_size) / original_size) * 100,
+            'outputs': outputs,
+        }
     except Exception as e:
         return {
             'success': False,
             'error': str(e)
         }
 
+
+def load_manifest(output_dir):
+    try:
+        with open(output_dir / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'settings': None, 'images': {}}
+
+
+def save_manifest(output_dir, manifest):
+    data = json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True)
+    write_atomic(output_dir / MANIFEST_NAME, data.encode('utf-8'))
+
+
+def is_up_to_date(entry, sha256, output_dir):
+    return (entry is not None and entry.get('sha256') == sha256 and
+            all((output_dir / o['file']).exists() for o in entry.get('outputs', [])))
+
+
+def list_images(input_dir):
+    return sorted(f for f in input_dir.glob('*.*') if f.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def optimize_files(files=None, input_dir=THUMBNAILS_DIR, output_dir=THUMBNAILS_OPTIMIZED_DIR,
+                   force=False, workers=None, verbose=True):
+    """Optimise `files` (tout `input_dir` par défaut) et met à jour le manifeste.
+
+    Retourne un dictionnaire de résultats par nom de fichier ; les images
+    inchangées depuis le dernier passage sont marquées `skipped`.
+    """
+    input_dir = Path(input_dir)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = load_manifest(output_dir)
+    signature = settings_signature()
+    if manifest.get('settings') != signature:
+        force = True
+        manifest = {'settings': signature, 'images': {}}
+    entries = manifest['images']
+
+    all_files = list_images(input_dir)
+    if files is None:
+        selected = all_files
+        # Oublier les images supprimées et leurs dérivés
+        present = {f.name for f in all_files}
+        for name in [n for n in entries if n not in present]:
+            for output in entries.pop(name).get('outputs', []):
+                (output_dir / output['file']).unlink(missing_ok=True)
+    else:
+        selected = [input_dir / Path(f).name for f in files]
+
+    results = {}
+    todo = {}
+    for path in selected:
+        sha256 = file_sha256(path)
+        if not force and is_up_to_date(entries.get(path.name), sha256, output_dir):
+            results[path.name] = {'success': True, 'skipped': True}
+        else:
+            todo[path] = sha256
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futures = {pool.submit(optimize_image, path, output_dir): path for path in todo}
+            for future in as_completed(futures):
+                path = futures[future]
+                result = future.result()
+                results[path.name] = result
+                if result['success']:
+                    entries[path.name] = {'sha256': todo[path], 'outputs': result['outputs']}
+                if verbose:
+                    if result['success']:
+                        print(f"✅ {path.name}")
+                        print(f"   {result['original'] / 1024:.1f} KB → {result['optimized'] / 1024:.1f} KB ({result['reduction']:.1f}% réduit)"
+                              f", {len(result['outputs'])} fichiers")
+                    else:
+                        print(f"❌ {path.name}: {result['error']}")
+
+    save_manifest(output_dir, manifest)
+    return results
+
+
+def thumbnail_variants(entry):
+    """Variantes srcset d'une entrée du manifeste, au format de maps.json"""
+    return [{
+        'url': THUMBNAILS_OPTIMIZED_URL + output['file'],
+        'width': output['width'],
+        'height': output['height'],
+        'type': MIME_TYPES[output['format']],
+    } for output in entry.get('outputs', [])[1:]]  # [0] : version historique
+
+
+def apply_to_catalog(output_dir=THUMBNAILS_OPTIMIZED_DIR, maps_json=MAPS_JSON, lock_path=CATALOG_LOCK):
+    """Inscrit les variantes de chaque thumbnail dans maps.json
+
+    Le fichier n'est réécrit que si une carte change réellement ; retourne
+    le nombre de cartes mises à jour.
+    """
+    entries = load_manifest(Path(output_dir))['images']
+
+    def apply(data):
+        updated = 0
+        for map_item in data.get('maps', []):
+            thumbnail = map_item.get('thumbnail') or ''
+            entry = None
+            if thumbnail.startswith(THUMBNAILS_URL):
+                entry = entries.get(thumbnail[len(THUMBNAILS_URL):])
+            variants = thumbnail_variants(entry) if entry else []
+            if variants == map_item.get('thumbnail_variants', []):
+                continue
+            if variants:
+                map_item['thumbnail_variants'] = variants
+            else:
+                map_item.pop('thumbnail_variants', None)
+            updated += 1
+        return updated
+
+    return update_catalog_json(str(maps_json), apply, str(lock_path))
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Optimise les thumbnails de la galerie")
+    parser.add_argument('files', nargs='*', help="Images à traiter (par défaut : tout le dossier)")
+    parser.add_argument('--force', action='store_true', help="Retraiter même les images inchangées")
+    parser.add_argument('--workers', type=int, default=None, help="Nombre de processus (défaut : nombre de cœurs)")
+    args = parser.parse_args()
+
     print("🖼️  Optimisation des thumbnails pour l'accueil...")
     print("=" * 60)
-    
+
     if not THUMBNAILS_DIR.exists():
         print(f"❌ Dossier introuvable: {THUMBNAILS_DIR}")
         return
-    
-    # Lister tous les fichiers images
-    image_files = list(THUMBNAILS_DIR.glob('*.*'))
-    image_files = [f for f in image_files if f.suffix.lower() in ['.jpg', '.jpeg', '.png', '.gif', '.webp']]
-    
-    if not image_files:
+
+    if not list_images(THUMBNAILS_DIR):
         print("❌ Aucun fichier image trouvé")
         return
-    
-    print(f"📊 {len(image_files)} images trouvées\n")
-    
-    total_original = 0
-    total_optimized = 0
-    success_count = 0
-    
-    for input_file in sorted(image_files):
-        output_file = THUMBNAILS_OPTIMIZED_DIR / input_file.name
-        
-        result = optimize_image(input_file, output_file)
-        
-        if result['success']:
-            total_original += result['original']
-            total_optimized += result['optimized']
-            success_count += 1
-            
-            print(f"✅ {input_file.name}")
-            print(f"   {result['original'] / 1024:.1f} KB → {result['optimized'] / 1024:.1f} KB ({result['reduction']:.1f}% réduit)")
-        else:
-            print(f"❌ {input_file.name}: {result['error']}")
-    
+
+    results = optimize_files(args.files or None, force=args.force, workers=args.workers)
+    updated = apply_to_catalog()
+
+    processed = [r for r in results.values() if r['success'] and not r.get('skipped')]
+    skipped = sum(1 for r in results.values() if r.get('skipped'))
+    total_original = sum(r['original'] for r in processed)
+    total_optimized = sum(r['optimized'] for r in processed)
+
     print("\n" + "=" * 60)
     print(f"📈 Résultats:")
-    print(f"   Fichiers traités: {success_count}/{len(image_files)}")
-    print(f"   Taille totale: {total_original / (1024*1024):.2f} MB → {total_optimized / (1024*1024):.2f} MB")
-    reduction_total = ((total_original - total_optimized) / total_original) * 100
-    print(f"   Réduction totale: {reduction_total:.1f}%")
+    print(f"   Fichiers traités: {len(processed)}/{len(results)} ({skipped} inchangés ignorés)")
+    if total_original:
+        print(f"   Taille totale: {total_original / (1024*1024):.2f} MB → {total_optimized / (1024*1024):.2f} MB")
+        reduction_total = ((total_original - total_optimized) / total_original) * 100
+        print(f"   Réduction totale: {reduction_total:.1f}%")
     print(f"   Dossier de sortie: {THUMBNAILS_OPTIMIZED_DIR}")
+    print(f"   Cartes mises à jour dans maps.json: {updated}")
 
 if __name__ == "__main__":
     main()
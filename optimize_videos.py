@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Script pour transcoder les vidéos de galerie et extraire leurs posters.
+
+Parcourt les entrées `images[]` de type vidéo de maps.json et produit, pour
+chaque vidéo (avec ffmpeg) :
+- des variantes à débit plafonné : MP4 H.264 « faststart » (l'index moov en
+  tête, la lecture démarre avant la fin du téléchargement) et WebM VP9
+  (index Cues en tête), plus une variante 480p réservée aux petits écrans
+  (attribut `media` de <source>) ;
+- un poster WebP optimisé (une image prise au début de la vidéo) ;
+puis réécrit dans maps.json le poster, les dimensions, la durée et la liste
+des sources, pour que le frontend affiche des lecteurs `preload="none"` qui
+ne téléchargent rien avant le clic.
+
+Comme optimize_gallery.py, le traitement est parallèle et incrémental
+(manifeste d'empreintes SHA-256).
+
+Prérequis: ffmpeg et ffprobe dans le PATH.
+
+Usage:
+    python optimize_videos.py            # vidéos modifiées uniquement
+    python optimize_videos.py --force    # tout retraiter
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from PIL import Image
+
+from optimize_gallery import CATALOG_LOCK, MAPS_JSON, STATIC_DIR, path_to_url, url_to_path
+from optimize_thumbnails import encode_within_budget, file_sha256, resize_to_width, write_atomic
+from view_counter import update_catalog_json
+
+# Configuration
+VIDEOS_DIR = STATIC_DIR / 'videos'
+DERIVATIVES_DIR = VIDEOS_DIR / 'optimized'
+# Les posters sont des images : assets.py leur donne une URL immuable
+POSTERS_DIR = STATIC_DIR / 'images' / 'posters'
+MANIFEST_PATH = DERIVATIVES_DIR / 'manifest.json'
+
+VIDEO_EXTENSIONS = ('.mp4', '.webm', '.mov', '.ogv', '.m4v')
+
+# (conteneur, hauteur max, débit vidéo max, media) ; aucune variante n'agrandit
+# la source. Le navigateur lit la première <source> compatible : celles qui ont
+# une media query passent en tête et ne sont retenues que si elle correspond
+VARIANTS = (
+    ('webm', 720, '1000k', None),
+    ('mp4', 720, '1500k', None),
+    ('mp4', 480, '700k', '(max-width: 640px)'),
+)
+# Codecs (vidéo, audio) annoncés dans <source type="...">
+SOURCE_CODECS = {
+    'mp4': ('avc1.640028', 'mp4a.40.2'),
+    'webm': ('vp9', 'opus'),
+}
+AUDIO_BITRATE = {'mp4': '96k', 'webm': '64k'}
+
+POSTER_WIDTH = 1280
+POSTER_QUALITY = 80
+POSTER_MAX_FILE_SIZE = 150 * 1024  # 150 KB max par poster
+POSTER_TIME = 1.0  # secondes (ou 10 % de la durée pour les vidéos courtes)
+
+# Incrémenter pour forcer un retraitement complet après un changement de logique
+PIPELINE_VERSION = 2
+
+
+def probe(source):
+    """Durée, dimensions et présence d'audio (ffprobe)"""
+    output = subprocess.run(
+        ['ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', str(source)],
+        check=True, capture_output=True).stdout
+    info = json.loads(output)
+    video = next(s for s in info['streams'] if s.get('codec_type') == 'video')
+    duration = float(info.get('format', {}).get('duration') or video.get('duration') or 0)
+    width, height = int(video['width']), int(video['height'])
+    # Vidéos tournées (smartphones) : l'affichage inverse largeur et hauteur
+    rotation = abs(int(video.get('tags', {}).get('rotate', 0) or 0))
+    if rotation in (90, 270):
+        width, height = height, width
+    has_audio = any(s.get('codec_type') == 'audio' for s in info['streams'])
+    return {'duration': round(duration, 2), 'width': width, 'height': height, 'audio': has_audio}
+
+
+def source_type(container, has_audio):
+    video_codec, audio_codec = SOURCE_CODECS[container]
+    codecs = f"{video_codec}, {audio_codec}" if has_audio else video_codec
+    return f'video/{container}; codecs="{codecs}"'
+
+
+def encoder_args(container, max_bitrate, threads):
+    """Options ffmpeg d'une variante : qualité constante plafonnée en débit"""
+    bufsize = f"{int(max_bitrate[:-1]) * 2}k"
+    if container == 'mp4':
+        return ['-c:v', 'libx264', '-preset', 'slow', '-crf', '26', '-profile:v', 'high',
+                '-pix_fmt', 'yuv420p', '-maxrate', max_bitrate, '-bufsize', bufsize,
+                '-c:a', 'aac', '-b:a', AUDIO_BITRATE['mp4'],
+                # Index moov en tête : lecture progressive sans attendre la fin
+                '-movflags', '+faststart', '-threads', str(threads)]
+    return ['-c:v', 'libvpx-vp9', '-crf', '34', '-b:v', max_bitrate, '-maxrate', max_bitrate,
+            '-bufsize', bufsize, '-row-mt', '1', '-deadline', 'good', '-cpu-used', '2',
+            '-pix_fmt', 'yuv420p', '-c:a', 'libopus', '-b:a', AUDIO_BITRATE['webm'],
+            # Index Cues en tête : équivalent WebM du faststart
+            '-cues_to_front', '1', '-threads', str(threads)]
+
+
+def transcode(source, output, container, height, max_bitrate, has_audio, threads):
+    tmp_path = output.with_name(f'.{output.name}.tmp{output.suffix}')
+    command = ['ffmpeg', '-y', '-v', 'error', '-i', str(source), '-map', '0:v:0']
+    if has_audio:
+        command += ['-map', '0:a:0']
+    else:
+        command += ['-an']
+    # Largeur paire (exigée par yuv420p), hauteur plafonnée sans agrandir
+    command += ['-vf', f"scale=-2:'min({height},ih)'", '-map_metadata', '-1']
+    command += encoder_args(container, max_bitrate, threads) + [str(tmp_path)]
+    try:
+        subprocess.run(command, check=True, capture_output=True)
+        os.replace(tmp_path, output)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def extract_poster(source, duration):
+    """Image du début de la vidéo, encodée en WebP sous le budget"""
+    timestamp = min(POSTER_TIME, duration / 10) if duration else 0
+    frame = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-ss', f'{timestamp:.2f}', '-i', str(source),
+         '-frames:v', '1', '-f', 'image2pipe', '-vcodec', 'png', '-'],
+        check=True, capture_output=True).stdout
+    with Image.open(io.BytesIO(frame)) as img:
+        img = resize_to_width(img.convert('RGB'), POSTER_WIDTH)
+    data, _ = encode_within_budget(img, 'WEBP', POSTER_QUALITY, POSTER_MAX_FILE_SIZE)
+    return data
+
+
+def output_stem(source, output_dir):
+    """Chemin de sortie (sans suffixe ni extension) miroir de l'arborescence
+    source : deux vidéos de même nom dans des dossiers différents ne
+    s'écrasent pas"""
+    relative = source.relative_to(STATIC_DIR)
+    return output_dir / relative.parent / relative.stem
+
+
+def process_video(source, threads=1):
+    """Variantes + poster pour une vidéo (exécuté dans le pool)"""
+    source = Path(source)
+    try:
+        info = probe(source)
+        stem = output_stem(source, DERIVATIVES_DIR)
+        stem.parent.mkdir(parents=True, exist_ok=True)
+
+        poster_data = extract_poster(source, info['duration'])
+        poster_stem = output_stem(source, POSTERS_DIR)
+        poster_path = poster_stem.with_name(f"{poster_stem.name}.webp")
+        poster_path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(poster_path, poster_data)
+
+        sources = []
+        for container, height, max_bitrate, media in VARIANTS:
+            height = min(height, info['height'])
+            output = stem.with_name(f"{stem.name}-{height}p.{container}")
+            if any(s['url'] == path_to_url(output) for s in sources):
+                continue  # Source plus petite que plusieurs variantes : une seule suffit
+            transcode(source, output, container, height, max_bitrate, info['audio'], threads)
+            width = round(info['width'] * height / info['height'] / 2) * 2
+            sources.append({
+                'url': path_to_url(output),
+                'type': source_type(container, info['audio']),
+                'width': width,
+                'height': height,
+                'bytes': output.stat().st_size,
+            })
+            if media:
+                sources[-1]['media'] = media
+        # Sources conditionnelles en tête (tri stable : l'ordre de VARIANTS est conservé)
+        sources.sort(key=lambda s: 'media' not in s)
+
+        return {
+            'success': True,
+            'duration': info['duration'],
+            'width': info['width'],
+            'height': info['height'],
+            'poster': path_to_url(poster_path),
+            'poster_bytes': len(poster_data),
+            'sources': sources,
+        }
+    except subprocess.CalledProcessError as e:
+        message = (e.stderr or b'').decode('utf-8', 'replace').strip().splitlines()
+        return {'success': False, 'error': message[-1] if message else str(e)}
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+    if manifest.get('version') != PIPELINE_VERSION:
+        manifest = {'version': PIPELINE_VERSION, 'videos': {}}
+    return manifest
+
+
+def is_video(img):
+    url = img if isinstance(img, str) else img.get('url', '')
+    return (isinstance(img, dict) and img.get('type') == 'video') or url.lower().endswith(VIDEO_EXTENSIONS)
+
+
+def video_sources(data):
+    """URL des vidéos de galerie référencées dans maps.json"""
+    urls = []
+    for map_item in data.get('maps', []):
+        for img in map_item.get('images', []):
+            url = img if isinstance(img, str) else img.get('url', '')
+            if is_video(img) and url not in urls:
+                urls.append(url)
+    return urls
+
+
+def apply_to_catalog(entries):
+    """Écrit poster, dimensions, durée et sources dans maps.json
+
+    Comme pour optimize_gallery.py, le fichier n'est réécrit que si une
+    vidéo change réellement.
+    """
+    def apply(data):
+        updated = 0
+        for map_item in data.get('maps', []):
+            images = map_item.get('images', [])
+            for index, img in enumerate(images):
+                if not is_video(img):
+                    continue
+                entry = entries.get(img if isinstance(img, str) else img.get('url'))
+                if entry is None:
+                    continue
+                new = dict({'url': img} if isinstance(img, str) else img,
+                           type='video', poster=entry['poster'],
+                           width=entry['width'], height=entry['height'],
+                           duration=entry['duration'],
+                           sources=[{k: s[k] for k in ('url', 'type', 'width', 'height', 'media') if k in s}
+                                    for s in entry['sources']])
+                if new != img:
+                    images[index] = new
+                    updated += 1
+        return updated
+
+    return update_catalog_json(str(MAPS_JSON), apply, str(CATALOG_LOCK))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcode les vidéos de galerie et extrait leurs posters")
+    parser.add_argument('--force', action='store_true', help="Retraiter même les vidéos inchangées")
+    parser.add_argument('--workers', type=int, default=None, help="Nombre de processus (défaut : nombre de cœurs)")
+    args = parser.parse_args()
+
+    print("🎬 Transcodage des vidéos de galerie...")
+    print("=" * 60)
+
+    if not (shutil.which('ffmpeg') and shutil.which('ffprobe')):
+        print("❌ ffmpeg et ffprobe sont requis (apt-get install ffmpeg)")
+        return 1
+
+    with open(MAPS_JSON, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    manifest = load_manifest()
+    entries = manifest['videos']
+    todo = {}
+    missing = 0
+    for url in video_sources(data):
+        source = url_to_path(url)
+        if source is None or not source.exists():
+            print(f"⚠️  Introuvable: {url}")
+            missing += 1
+            continue
+        sha256 = file_sha256(source)
+        entry = entries.get(url)
+        up_to_date = (entry is not None and entry.get('sha256') == sha256 and
+                      url_to_path(entry['poster']).exists() and
+                      all(url_to_path(s['url']).exists() for s in entry['sources']))
+        if args.force or not up_to_date:
+            todo[url] = (source, sha256)
+
+    print(f"📊 {len(todo)} vidéos à traiter ({len(entries)} déjà dans le manifeste)\n")
+
+    failures = 0
+    if todo:
+        workers = args.workers or min(len(todo), os.cpu_count())
+        # ffmpeg est lui-même multi-thread : répartir les cœurs entre les processus
+        threads = max(1, os.cpu_count() // workers)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(process_video, source, threads): url
+                       for url, (source, _) in todo.items()}
+            for future in as_completed(futures):
+                url = futures[future]
+                result = future.result()
+                if not result['success']:
+                    failures += 1
+                    print(f"❌ {url}: {result['error']}")
+                    continue
+                result.pop('success')
+                result['sha256'] = todo[url][1]
+                entries[url] = result
+                original = url_to_path(url).stat().st_size
+                smallest = min(s['bytes'] for s in result['sources'])
+                print(f"✅ {url} ({result['width']}x{result['height']}, {result['duration']:.1f} s)")
+                print(f"   {original / 1024:.1f} KB → {smallest / 1024:.1f} KB ({len(result['sources'])} variantes)"
+                      f", poster {result['poster_bytes'] / 1024:.1f} KB")
+
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(MANIFEST_PATH, json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+    updated = apply_to_catalog(entries)
+
+    print("\n" + "=" * 60)
+    print(f"📈 Résultats:")
+    print(f"   Vidéos traitées: {len(todo) - failures}/{len(todo)} ({failures} échecs, {missing} introuvables)")
+    print(f"   Entrées mises à jour dans maps.json: {updated}")
+    print(f"   Dossier de sortie: {DERIVATIVES_DIR}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+Static pre-rendering of the home page and read-only API responses.
+
+The home page and the list/stats/categories endpoints only change with the
+catalog (and, for stats, the view total), so they can be served by nginx as
+plain files. `StaticExporter` renders them through the app itself (so the
+files are byte-identical to the live responses) into a versioned directory:
+
+    <directory>/<version>/index.html
+    <directory>/<version>/api/maps.json            GET /api/maps
+    <directory>/<version>/api/maps-2d.json         GET /api/maps?category=2d
+    <directory>/<version>/api/maps-interactive.json
+    <directory>/<version>/api/stats.json
+    <directory>/<version>/api/categories.json
+    <directory>/current -> <version>
+
+Each file gets precompressed `.gz` and `.br` siblings for nginx's
+`gzip_static` / `brotli_static`. `current` is swapped atomically, and the
+previous version is kept so in-flight reads never see a missing file.
+
+A background thread per worker re-exports when the catalog reloads and, at
+most every `interval` seconds, when the view total moved. Workers coordinate
+through a file lock and the manifest, so each version is written once.
+
+    python prerender.py             # export now (deploys, cron)
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:  # brotli is optional: .gz siblings only
+    brotli = None
+
+from metrics import INTERNAL_REQUEST
+from view_counter import atomic_write_json, file_lock
+
+# (path in the snapshot, URL rendered through the app)
+SNAPSHOTS = (
+    ('index.html', '/'),
+    ('api/maps.json', '/api/maps'),
+    ('api/maps-2d.json', '/api/maps?category=2d'),
+    ('api/maps-interactive.json', '/api/maps?category=interactive'),
+    ('api/stats.json', '/api/stats'),
+    ('api/categories.json', '/api/categories'),
+)
+MANIFEST = 'manifest.json'
+CURRENT = 'current'
+
+
+def write_compressed(path, body, min_compress_size=256):
+    """Write `body` to `path` plus `.gz`/`.br` siblings sharing its mtime."""
+    variants = [(path, body)]
+    if len(body) >= min_compress_size:
+        variants.append((path + '.gz', gzip.compress(body, compresslevel=9, mtime=0)))
+        if brotli is not None:
+            variants.append((path + '.br', brotli.compress(body, quality=11)))
+    now = time.time()
+    for target, data in variants:
+        with open(target, 'wb') as f:
+            f.write(data)
+        # gzip_static serves the sibling only if it is not older than the original
+        os.utime(target, (now, now))
+
+
+class StaticExporter:
+    """Renders `SNAPSHOTS` into `directory` whenever their inputs change."""
+
+    def __init__(self, app, catalog_store, view_counter, directory, interval=60.0, keep=2):
+        self.app = app
+        self.catalog_store = catalog_store
+        self.view_counter = view_counter
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self.exports = 0
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+        # Inputs of the last export this worker checked: (catalog version, views)
+        self._inputs = None
+        catalog_store.on_reload(lambda catalog: self.schedule())
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, MANIFEST)
+
+    def schedule(self):
+        """Ask the background thread to check for changes now."""
+        self._wake.set()
+
+    def start(self):
+        """Start this worker's export thread (once per process)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._wake.set()
+            threading.Thread(target=self._run, name='static-exporter', daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.export()
+            except Exception as e:
+                print(f"Error exporting static snapshots: {e}")
+
+    def export(self, force=False):
+        """Render and publish a new version if the inputs changed.
+
+        Returns the published version, or None if nothing changed.
+        """
+        catalog = self.catalog_store.get()
+        inputs = (catalog.version, self.view_counter.total())
+        if inputs == self._inputs and not force:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        with file_lock(os.path.join(self.directory, '.lock')):
+            manifest = self._read_manifest()
+            if not force and manifest.get('inputs') == list(inputs):
+                self._inputs = inputs
+                return None
+            bodies = self.render()
+            digest = hashlib.sha1()
+            for name, _ in SNAPSHOTS:
+                digest.update(name.encode('utf-8') + b'\0' + bodies[name])
+            version = digest.hexdigest()[:16]
+            if version != manifest.get('version') or not os.path.isdir(self._version_dir(version)):
+                self._publish(version, bodies)
+            atomic_write_json(self.manifest_path, {
+                'version': version,
+                'inputs': list(inputs),
+                'catalog_version': catalog.version,
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'files': [name for name, _ in SNAPSHOTS],
+            })
+            self._inputs = inputs
+            self.exports += 1
+            return version
+
+    def render(self):
+        """Return {snapshot path: body} rendered through the app."""
+        bodies = {}
+        client = self.app.test_client()
+        for name, url in SNAPSHOTS:
+            # Not a visitor request: kept out of the request metrics
+            response = client.get(url, headers={'Accept-Encoding': 'identity'},
+                                  environ_base={INTERNAL_REQUEST: True})
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} returned {response.status_code}")
+            bodies[name] = response.get_data()
+        return bodies
+
+    def _version_dir(self, version):
+        return os.path.join(self.directory, version)
+
+    def _publish(self, version, bodies):
+        final_dir = self._version_dir(version)
+        tmp_dir = os.path.join(self.directory, f'.tmp-{version}-{os.getpid()}')
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        for name, body in bodies.items():
+            path = os.path.join(tmp_dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_compressed(path, body)
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.rename(tmp_dir, final_dir)
+
+        # Relative link, so the directory can be mounted anywhere (nginx container)
+        link_tmp = os.path.join(self.directory, f'.{CURRENT}-{os.getpid()}')
+        if os.path.lexists(link_tmp):
+            os.unlink(link_tmp)
+        os.symlink(version, link_tmp)
+        os.replace(link_tmp, os.path.join(self.directory, CURRENT))
+        self._prune(version)
+
+    def _prune(self, current):
+        """Delete old versions, keeping the `keep` most recent ones."""
+        versions = []
+        for entry in os.scandir(self.directory):
+            if entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.'):
+                versions.append((entry.stat().st_mtime, entry.name))
+        versions.sort(reverse=True)
+        for _, name in versions[self.keep:]:
+            if name != current:
+                shutil.rmtree(self._version_dir(name), ignore_errors=True)
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+
+if __name__ == '__main__':
+    from app import app
+
+    exporter = app.extensions['static_exporter']
+    version = exporter.export(force=True)
+    print(f"✅ Snapshots {version} écrits dans {exporter.directory}")
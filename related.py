@@ -0,0 +1,199 @@
+"""
+"Similar maps" recommendations from a TF-IDF model of the catalog.
+
+Each map becomes a weighted bag of terms: accent-folded words from its tags,
+features and description, plus whole-value terms for its tags, category and
+mode. Terms are weighted by TF-IDF, rows are L2-normalized and the cosine
+similarity matrix is computed with NumPy, a block of rows at a time so memory
+stays bounded on large catalogs. Only the top-k neighbours of each map are
+kept, so a lookup is a dict access plus k record fetches, whatever the
+catalog size.
+
+The index is rebuilt when the catalog reloads. Term counts are cached per
+record content, so only new or edited maps are re-tokenized, and a reload
+that does not touch any of the fields above (view counts folded back into
+maps.json, a new asset manifest) reuses the previous neighbour table as is.
+"""
+import hashlib
+import json
+import math
+import threading
+
+import numpy as np
+
+from search_index import _field_text, fold, tokenize
+
+# How much each field counts in a map's term vector
+RELATED_FIELD_WEIGHTS = (
+    ('tags', 3.0),
+    ('fonctionalites', 1.5),
+    ('fonctionnalites', 1.5),  # alternate spelling used by some entries
+    ('description', 1.0),
+)
+
+# Fields matched as whole values ('Climatologie', 'interactive'), not words
+RELATED_VALUE_WEIGHTS = (
+    ('tags', 3.0),
+    ('category', 4.0),
+    ('mode', 2.0),
+)
+
+# Short words are mostly articles and prepositions ('de', 'la', 'et')
+MIN_TOKEN_LENGTH = 3
+
+# Rows of the similarity matrix computed per matrix product
+BLOCK_SIZE = 1024
+
+_FIELDS = tuple(dict.fromkeys(f for f, _ in RELATED_FIELD_WEIGHTS + RELATED_VALUE_WEIGHTS))
+
+
+def _values(value):
+    if value is None:
+        return ()
+    if isinstance(value, str):
+        return (value,)
+    return tuple(str(v) for v in value)
+
+
+def record_digest(record):
+    """Hash of the fields that feed the model (views and URLs excluded)."""
+    content = {f: record.get(f) for f in _FIELDS}
+    raw = json.dumps(content, sort_keys=True, ensure_ascii=False, default=list)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def term_counts(record):
+    """Weighted term frequencies of one record: {term: weight}."""
+    counts = {}
+    for field, weight in RELATED_FIELD_WEIGHTS:
+        for token in tokenize(_field_text(record.get(field))):
+            if len(token) >= MIN_TOKEN_LENGTH and not token.isdigit():
+                counts[token] = counts.get(token, 0.0) + weight
+    for field, weight in RELATED_VALUE_WEIGHTS:
+        for value in _values(record.get(field)):
+            # The '=' keeps value terms apart from words of the same spelling
+            term = f"{field}={fold(value).strip()}"
+            counts[term] = counts.get(term, 0.0) + weight
+    return counts
+
+
+def tfidf_matrix(documents):
+    """L2-normalized TF-IDF rows (float32) for a list of term-count dicts.
+
+    Terms found in a single document are left out of the matrix: they cannot
+    make two maps similar, but they still count in each row's norm.
+    """
+    document_frequency = {}
+    for counts in documents:
+        for term in counts:
+            document_frequency[term] = document_frequency.get(term, 0) + 1
+    n = len(documents)
+    shared = sorted(t for t, df in document_frequency.items() if df > 1)
+    columns = {term: i for i, term in enumerate(shared)}
+    idf = {t: math.log((1 + n) / (1 + df)) + 1.0 for t, df in document_frequency.items()}
+
+    matrix = np.zeros((n, len(shared)), dtype=np.float32)
+    norms = np.zeros(n, dtype=np.float64)
+    for row, counts in enumerate(documents):
+        squares = 0.0
+        for term, tf in counts.items():
+            # Sublinear tf: a word repeated ten times is not ten times as relevant
+            weight = (1.0 + math.log(tf)) * idf[term]
+            squares += weight * weight
+            column = columns.get(term)
+            if column is not None:
+                matrix[row, column] = weight
+        norms[row] = math.sqrt(squares)
+    norms[norms == 0] = 1.0
+    matrix /= norms[:, np.newaxis].astype(np.float32)
+    return matrix
+
+
+def top_neighbors(matrix, k, block_size=BLOCK_SIZE):
+    """(indices, scores) of the `k` most similar rows of each row, best first.
+
+    Rows are compared by dot product (cosine similarity for normalized rows);
+    a row is never its own neighbour. Missing neighbours have index -1.
+    """
+    n = matrix.shape[0]
+    k = max(0, min(k, n - 1))
+    indices = np.full((n, k), -1, dtype=np.int64)
+    scores = np.zeros((n, k), dtype=np.float32)
+    if k == 0:
+        return indices, scores
+    transposed = np.ascontiguousarray(matrix.T)
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        similarity = matrix[start:end] @ transposed
+        rows = np.arange(end - start)
+        similarity[rows, rows + start] = -1.0
+        # Unordered top k in O(n) per row, then sort just those k
+        candidates = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        candidate_scores = np.take_along_axis(similarity, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind='stable')
+        block_indices = np.take_along_axis(candidates, order, axis=1)
+        block_scores = np.take_along_axis(candidate_scores, order, axis=1)
+        block_indices[block_scores <= 0] = -1
+        indices[start:end] = block_indices
+        scores[start:end] = np.maximum(block_scores, 0)
+    return indices, scores
+
+
+class RelatedIndex:
+    """Top-k similar maps per map id, kept in sync with the catalog store."""
+
+    def __init__(self, catalog_store=None, k=12):
+        self.k = k
+        self.version = None
+        self.builds = 0
+        self._lock = threading.Lock()
+        # map id -> ((neighbour id, score), ...), best first
+        self._neighbors = {}
+        # (id, digest) of each record the table was computed from
+        self._signature = None
+        # record digest -> term counts, reused across rebuilds
+        self._terms = {}
+        if catalog_store is not None:
+            catalog_store.on_reload(self.update)
+
+    def update(self, catalog):
+        """Recompute the neighbour table for `catalog` if its content changed."""
+        with self._lock:
+            if catalog.version == self.version:
+                return
+            records = catalog.maps
+            digests = [record_digest(r) for r in records]
+            signature = tuple((str(r['id']), d) for r, d in zip(records, digests))
+            if signature != self._signature:
+                terms = {}
+                for record, digest in zip(records, digests):
+                    counts = self._terms.get(digest)
+                    terms[digest] = counts if counts is not None else term_counts(record)
+                indices, scores = top_neighbors(
+                    tfidf_matrix([terms[d] for d in digests]), self.k)
+                ids = [map_id for map_id, _ in signature]
+                self._neighbors = {
+                    ids[row]: tuple((ids[i], round(float(s), 4))
+                                    for i, s in zip(indices[row], scores[row]) if i >= 0)
+                    for row in range(len(ids))
+                }
+                self._terms = terms
+                self._signature = signature
+                self.builds += 1
+            self.version = catalog.version
+
+    def neighbors(self, catalog, map_id, limit=None):
+        """((id, score), ...) of the maps most similar to `map_id`."""
+        if catalog.version != self.version:
+            self.update(catalog)
+        found = self._neighbors.get(str(map_id), ())
+        return found if limit is None else found[:limit]
+
+    def related(self, catalog, map_id, limit=None):
+        """[(record, score), ...] of the maps most similar to `map_id`."""
+        out = []
+        for neighbor_id, score in self.neighbors(catalog, map_id, limit):
+            record = catalog.get(neighbor_id)
+            if record is not None:
+                out.append((record, score))
+        return out
@@ -0,0 +1,102 @@
+"""
+LRU cache of pre-serialized, pre-compressed API responses.
+
+Entries are keyed by (endpoint, normalized query, data version) and hold the
+JSON body plus its gzip and brotli encodings, so a hit costs neither JSON
+encoding nor compression.
+"""
+import gzip
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # brotli is optional: fall back to gzip only
+    brotli = None
+
+
+class CachedPayload:
+    """One encoded response body and its compressed variants."""
+
+    __slots__ = ('identity', 'gzip', 'br')
+
+    def __init__(self, body, min_compress_size=1000, gzip_level=9, brotli_quality=9):
+        self.identity = body
+        self.gzip = None
+        self.br = None
+        if len(body) >= min_compress_size:
+            self.gzip = gzip.compress(body, compresslevel=gzip_level, mtime=0)
+            if brotli is not None:
+                self.br = brotli.compress(body, quality=brotli_quality)
+
+    @property
+    def size(self):
+        return len(self.identity) + len(self.gzip or b'') + len(self.br or b'')
+
+    def select(self, accept_encodings):
+        """Return (body, content_encoding) for an `Accept-Encoding` header.
+
+        `accept_encodings` is Werkzeug's parsed `request.accept_encodings`.
+        """
+        if self.br is not None and accept_encodings['br']:
+            return self.br, 'br'
+        if self.gzip is not None and accept_encodings['gzip']:
+            return self.gzip, 'gzip'
+        return self.identity, None
+
+
+class ResponseCache:
+    """Size-bounded LRU of `CachedPayload` objects with hit/miss counters."""
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, min_compress_size=1000):
+        self.max_bytes = max_bytes
+        self.min_compress_size = min_compress_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, key, body):
+        """Encode `body` (bytes), store it and return the `CachedPayload`."""
+        payload = CachedPayload(body, self.min_compress_size)
+        if payload.size > self.max_bytes:
+            return payload
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old.size
+            self._entries[key] = payload
+            self.current_bytes += payload.size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.size
+                self.evictions += 1
+        return payload
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
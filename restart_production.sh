@@ -2,6 +2,10 @@
 # Restart the production server
 
 APP_NAME="geovis_website"
+APP_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
+echo "Fingerprinting static assets..."
+"$APP_DIR/venv/bin/python" "$APP_DIR/assets.py"
 
 echo "Restarting $APP_NAME service..."
 sudo systemctl restart ${APP_NAME}
@@ -0,0 +1,120 @@
+"""
+Inverted full-text index over the map catalog.
+
+Text is accent-folded and tokenized once when the catalog loads, each distinct
+word being folded only once. Queries do prefix matching on every term and
+return records ranked by a weighted score.
+"""
+import bisect
+import re
+import unicodedata
+
+TOKEN_RE = re.compile(r'\w+')
+
+# How much a hit in each field counts towards a record's score
+FIELD_WEIGHTS = (
+    ('title', 5.0),
+    ('tags', 4.0),
+    ('auteur', 3.0),
+    ('fonctionalites', 2.0),
+    ('fonctionnalites', 2.0),  # alternate spelling used by some entries
+    ('description', 1.0),
+)
+
+# Bonus when a query term matches a whole token rather than a prefix of it
+EXACT_MATCH_BONUS = 1.5
+
+
+class _StripCombining(dict):
+    """`str.translate` table deleting combining marks, filled per code point."""
+
+    def __missing__(self, codepoint):
+        value = None if unicodedata.combining(chr(codepoint)) else codepoint
+        self[codepoint] = value
+        return value
+
+
+_STRIP_COMBINING = _StripCombining()
+
+
+def fold(text):
+    """Lowercase `text` and strip accents (é/è/à -> e/e/a)."""
+    if text.isascii():
+        return text.lower()
+    return unicodedata.normalize('NFKD', text).translate(_STRIP_COMBINING).casefold()
+
+
+def tokenize(text, cache=None):
+    """Split accent-folded text into word tokens.
+
+    Words never span whitespace, so each whitespace-separated chunk is folded
+    on its own; with a `cache` dict, every distinct chunk is folded only once.
+    """
+    if cache is None:
+        return TOKEN_RE.findall(fold(text))
+    tokens = []
+    for chunk in text.split():
+        folded = cache.get(chunk)
+        if folded is None:
+            folded = cache[chunk] = TOKEN_RE.findall(fold(chunk))
+        tokens.extend(folded)
+    return tokens
+
+
+def _field_text(value):
+    """Flatten a string or a list of strings into one string."""
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    return ' '.join(str(v) for v in value)
+
+
+class SearchIndex:
+    """Maps each token to the records containing it and their field score."""
+
+    def __init__(self, records):
+        self.records = tuple(records)
+        postings = {}
+        # Folded tokens per word, shared by every field of every record
+        folded = {}
+        for pos, record in enumerate(self.records):
+            for field, weight in FIELD_WEIGHTS:
+                for token in tokenize(_field_text(record.get(field)), folded):
+                    scores = postings.setdefault(token, {})
+                    scores[pos] = scores.get(pos, 0.0) + weight
+        self._postings = postings
+        self._vocabulary = sorted(postings)
+
+    def _prefix_tokens(self, prefix):
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + '\uffff', start)
+        return self._vocabulary[start:end]
+
+    def _term_scores(self, term):
+        """Score every record containing a token that starts with `term`."""
+        scores = {}
+        for token in self._prefix_tokens(term):
+            boost = EXACT_MATCH_BONUS if token == term else 1.0
+            for pos, score in self._postings[token].items():
+                scores[pos] = scores.get(pos, 0.0) + score * boost
+        return scores
+
+    def search(self, query):
+        """Return records matching every term of `query`, best first."""
+        terms = tokenize(query)
+        if not terms:
+            return self.records
+
+        total = None
+        for term in dict.fromkeys(terms):
+            scores = self._term_scores(term)
+            if total is None:
+                total = scores
+            else:
+                total = {pos: total[pos] + s for pos, s in scores.items() if pos in total}
+            if not total:
+                return ()
+
+        ranked = sorted(total, key=lambda pos: (-total[pos], pos))
+        return tuple(self.records[pos] for pos in ranked)
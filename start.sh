@@ -48,5 +48,10 @@ echo "🌐 The application will be available at: http://localhost:5000"
 echo "🔥 Press Ctrl+C to stop the server"
 echo ""
 
-# Start the Flask application
-python app.py
\ No newline at end of file
+# ./start.sh --dev runs the Flask debug server (auto-reload); otherwise
+# Gunicorn with the production profile from gunicorn_config.py
+if [ "$1" = "--dev" ]; then
+    FLASK_APP=app.py flask run --debug --host 0.0.0.0 --port 5000
+else
+    GUNICORN_BIND="${GUNICORN_BIND:-0.0.0.0:5000}" exec gunicorn --config gunicorn_config.py app:app
+fi
@@ -15,6 +15,9 @@ const ImageViewer = ({ images, map, onClose, initialIndex = 0 }) => {
     // Fonction helper pour extraire l'URL et le titre
     const getMediaUrl = (img) => typeof img === 'string' ? img : img.url;
     const getMediaTitle = (img, index) => typeof img === 'string' ? null : img.title;
+    const getSrcSet = (img) => (typeof img === 'object' && img.variants
+        ? img.variants.map(variant => `${variant.url} ${variant.width}w`).join(', ')
+        : undefined);
     const getMediaType = (img) => {
         const url = getMediaUrl(img);
         if (typeof img === 'object' && img.type) return img.type;
@@ -85,11 +88,12 @@ const ImageViewer = ({ images, map, onClose, initialIndex = 0 }) => {
         }, 500);
     }, [videoThumbnails]);
 
-    // Extract all video thumbnails on mount
+    // Extract video thumbnails on mount (only for videos without a poster:
+    // extraction downloads the start of each video)
     React.useEffect(() => {
         images.forEach((img) => {
             const type = getMediaType(img);
-            if (type === 'video') {
+            if (type === 'video' && !img.poster) {
                 const url = getMediaUrl(img);
                 extractVideoThumbnail(url);
             }
@@ -177,13 +181,23 @@ const ImageViewer = ({ images, map, onClose, initialIndex = 0 }) => {
     // Render media element (image or video)
     const renderMedia = () => {
         if (isVideo) {
+            const sources = typeof currentMedia === 'object' && currentMedia.sources;
             return React.createElement('video', {
-                src: currentUrl,
+                src: sources ? undefined : currentUrl,
+                poster: currentMedia.poster,
+                width: currentMedia.width,
+                height: currentMedia.height,
                 controls: true,
                 className: `viewer-video ${isInteractiveMode ? 'mode-interactive' : 'mode-2d'}`,
-                key: 'current-video',
+                key: `current-video-${currentIndex}`,
+                preload: 'none',
                 autoPlay: true
-            });
+            }, sources ? sources.map((source, index) => React.createElement('source', {
+                src: source.url,
+                type: source.type,
+                media: source.media,
+                key: `source-${index}`
+            })) : undefined);
         } else {
             const mediaStyle = {
                 transform: `scale(${zoomLevel}) translate(${position.x / zoomLevel}px, ${position.y / zoomLevel}px)`,
@@ -193,6 +207,8 @@ const ImageViewer = ({ images, map, onClose, initialIndex = 0 }) => {
             
             return React.createElement('img', {
                 src: currentUrl,
+                srcSet: getSrcSet(currentMedia),
+                sizes: '100vw',
                 alt: currentTitle || `Média ${currentIndex + 1}`,
                 className: `viewer-image ${isInteractiveMode ? 'mode-interactive' : 'mode-2d'}`,
                 key: 'current-image',
@@ -210,7 +226,7 @@ const ImageViewer = ({ images, map, onClose, initialIndex = 0 }) => {
         const title = getMediaTitle(img, index);
         
         if (type === 'video') {
-            const thumbnailUrl = videoThumbnails[url];
+            const thumbnailUrl = img.poster || videoThumbnails[url];
 
             return React.createElement('div', {
                 className: `viewer-thumbnail-video ${index === currentIndex ? 'viewer-thumbnail-active' : ''}`,
@@ -232,6 +248,9 @@ const ImageViewer = ({ images, map, onClose, initialIndex = 0 }) => {
         } else {
             return React.createElement('img', {
                 src: url,
+                srcSet: getSrcSet(img),
+                sizes: '70px',
+                loading: 'lazy',
                 alt: title || `Thumbnail ${index + 1}`,
                 className: `viewer-thumbnail ${index === currentIndex ? 'viewer-thumbnail-active' : ''}`,
                 onClick: () => setCurrentIndex(index),
@@ -1,9 +1,14 @@
 // Map Card Component
+
+// Largeur affichée d'une vignette : pleine largeur sur mobile, sinon une
+// colonne de la grille (minmax(350px, 1fr))
+const CARD_IMAGE_SIZES = '(max-width: 768px) 100vw, (max-width: 1200px) 50vw, 400px';
+
 const MapCard = ({ map, onOpenModal }) => {
     // Fonction pour tronquer la description
     const truncateDescription = (desc, maxLength = 80) => {
         // Si c'est un array, prendre le premier élément
-        const text = Array.isArray(desc) ? desc[0] : desc;
+        const text = (Array.isArray(desc) ? desc[0] : desc) || '';
         if (text.length <= maxLength) return text;
         return text.substring(0, maxLength).trim() + '...';
     };
@@ -22,12 +27,23 @@ const MapCard = ({ map, onOpenModal }) => {
             className: 'map-image',
             key: 'image'
         }, [
-            React.createElement('img', {
-                src: getOptimizedThumbnail(map.preview) || '/static/images/default-map.svg',
-                alt: map.title,
-                loading: 'lazy',
-                key: 'img'
-            }),
+            // Variantes AVIF/WebP/JPEG par largeur (optimize_thumbnails.py)
+            React.createElement('picture', { key: 'picture' }, [
+                ...(map.preview_sources || []).map(source =>
+                    React.createElement('source', {
+                        type: source.type,
+                        srcSet: source.srcset,
+                        sizes: CARD_IMAGE_SIZES,
+                        key: source.type
+                    })
+                ),
+                React.createElement('img', {
+                    src: map.preview_small || getOptimizedThumbnail(map.preview),
+                    alt: map.title,
+                    loading: 'lazy',
+                    key: 'img'
+                })
+            ]),
             React.createElement('div', {
                 className: 'map-overlay',
                 key: 'overlay'
@@ -46,11 +62,11 @@ const MapCard = ({ map, onOpenModal }) => {
             React.createElement('p', { 
                 key: 'description',
                 className: 'map-card-description'
-            }, truncateDescription(map.description)),
+            }, truncateDescription(map.excerpt || map.description)),
             React.createElement('div', {
                 className: 'map-tags',
                 key: 'tags'
-            }, map.tags.map((tag, index) => 
+            }, (map.tags || []).map((tag, index) => 
                 React.createElement('span', {
                     className: 'tag',
                     key: index
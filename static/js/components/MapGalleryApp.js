@@ -1,19 +1,97 @@
+// Fields needed to render cards and the global cube (details are fetched on demand)
+const CARD_FIELDS = 'card,url,excerpt,maceachren';
+
+// `sort=` values of /api/maps offered in the gallery ('' keeps the catalog order)
+const SORT_OPTIONS = [
+    ['', 'Ordre du catalogue'],
+    ['title', 'Titre (A-Z)'],
+    ['difficulty', 'Difficulté'],
+    ['-views', 'Les plus vues']
+];
+
+// One page of the gallery: mode, search and sort are applied server-side and
+// further pages are addressed by the `next_cursor` of the previous one
+const mapsUrl = ({ category, search, sort }, cursor) => {
+    const params = new URLSearchParams();
+    if (category !== 'Toutes') {
+        params.set('category', category);
+    }
+    if (search) {
+        params.set('search', search);
+    }
+    if (sort) {
+        params.set('sort', sort);
+    }
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+    const extra = params.toString();
+    return `/api/maps?fields=${CARD_FIELDS}${extra ? `&${extra}` : ''}`;
+};
+
+const fetchJson = async (url) => {
+    const response = await fetch(url);
+    if (!response.ok) {
+        throw new Error(`${url}: HTTP ${response.status}`);
+    }
+    return response.json();
+};
+
+// First page of maps (unfiltered, catalog order), modes and stats embedded by
+// the server in home.html, so the first render needs no fetch
+const readBootstrap = () => {
+    const element = document.getElementById('gallery-bootstrap');
+    if (!element) {
+        return null;
+    }
+    try {
+        return JSON.parse(element.textContent);
+    } catch (err) {
+        console.error('Invalid bootstrap data:', err);
+        return null;
+    }
+};
+
 // Main App Component
 const MapGalleryApp = () => {
-    const [maps, setMaps] = React.useState([]);
-    const [categories, setCategories] = React.useState([]);
-    const [stats, setStats] = React.useState({});
+    const [bootstrap] = React.useState(readBootstrap);
+    // Pages loaded so far for the current mode, search and sort
+    const [maps, setMaps] = React.useState(() => bootstrap ? bootstrap.maps.maps : []);
+    const [total, setTotal] = React.useState(() => bootstrap ? bootstrap.maps.total : 0);
+    const [nextCursor, setNextCursor] = React.useState(() => bootstrap ? bootstrap.maps.next_cursor : null);
+    const [loadingMore, setLoadingMore] = React.useState(false);
+    const [categories, setCategories] = React.useState(() => bootstrap ? bootstrap.categories : []);
+    const [stats, setStats] = React.useState(() => bootstrap ? bootstrap.stats : {});
     const [selectedCategory, setSelectedCategory] = React.useState('Toutes');
+    const [selectedSort, setSelectedSort] = React.useState('');
     const [searchTerm, setSearchTerm] = React.useState('');
-    const [loading, setLoading] = React.useState(true);
+    // Search term sent to the server, once typing pauses
+    const [search, setSearch] = React.useState('');
+    const [loading, setLoading] = React.useState(!bootstrap);
     const [error, setError] = React.useState(null);
     const [selectedMap, setSelectedMap] = React.useState(null);
     const [isModalOpen, setIsModalOpen] = React.useState(false);
+    // Responses to a superseded query are dropped
+    const queryId = React.useRef(0);
+    // The embedded first page already answers the initial query
+    const skipInitialQuery = React.useRef(Boolean(bootstrap));
+    const sentinelRef = React.useRef(null);
+    const query = { category: selectedCategory, search, sort: selectedSort };
 
     const openModal = (map) => {
         setSelectedMap(map);
         setIsModalOpen(true);
         document.body.style.overflow = 'hidden';
+
+        // The list only carries card fields: load the full record for the modal
+        fetch(`/api/maps/${map.id}`)
+            .then(response => response.ok ? response.json() : null)
+            .then(detail => {
+                if (detail) {
+                    setSelectedMap(current => (current && current.id === map.id ? detail : current));
+                }
+            })
+            .catch(err => console.error('Error fetching map details:', err));
     };
 
     const closeModal = () => {
@@ -22,59 +100,103 @@ const MapGalleryApp = () => {
         document.body.style.overflow = 'auto';
     };
 
-    // Fetch data on component mount
+    // Modes and stats on mount, unless the page embedded them
     React.useEffect(() => {
-        const fetchData = async () => {
-            try {
-                setLoading(true);
-                
-                const [mapsResponse, categoriesResponse, statsResponse] = await Promise.all([
-                    fetch('/api/maps'),
-                    fetch('/api/categories'),
-                    fetch('/api/stats')
-                ]);
-
-                const mapsData = await mapsResponse.json();
-                const categoriesData = await categoriesResponse.json();
-                const statsData = await statsResponse.json();
-
-                setMaps(mapsData.maps);
+        if (bootstrap) {
+            return;
+        }
+
+        Promise.all([fetchJson('/api/categories'), fetchJson('/api/stats')])
+            .then(([categoriesData, statsData]) => {
                 setCategories(categoriesData);
                 setStats(statsData);
+            })
+            .catch(err => console.error('Error fetching modes and stats:', err));
+    }, []);
+
+    // Search runs server-side (accent-insensitive, ranked): wait for typing to pause
+    React.useEffect(() => {
+        const timer = setTimeout(() => setSearch(searchTerm.trim()), 200);
+        return () => clearTimeout(timer);
+    }, [searchTerm]);
+
+    // First page of the current mode, search and sort
+    React.useEffect(() => {
+        if (skipInitialQuery.current) {
+            skipInitialQuery.current = false;
+            return;
+        }
+
+        const id = ++queryId.current;
+        // Cursors of the previous query do not apply to this one
+        setNextCursor(null);
+        fetchJson(mapsUrl(query))
+            .then(page => {
+                if (id !== queryId.current) {
+                    return;
+                }
+                setMaps(page.maps);
+                setTotal(page.total);
+                setNextCursor(page.next_cursor);
                 setLoading(false);
-            } catch (err) {
-                setError('Failed to load data');
-                setLoading(false);
-            }
-        };
+            })
+            .catch(err => {
+                if (id !== queryId.current) {
+                    return;
+                }
+                console.error('Error fetching maps:', err);
+                if (loading) {
+                    setError('Failed to load data');
+                    setLoading(false);
+                }
+            });
+    }, [selectedCategory, search, selectedSort]);
 
-        fetchData();
-    }, []);
+    // Next page, appended to the loaded ones
+    const loadMore = React.useCallback(() => {
+        if (!nextCursor || loadingMore) {
+            return;
+        }
 
-    // Filter maps based on mode and search
-    const filteredMaps = React.useMemo(() => {
-        return maps.filter(map => {
-            const matchesCategory = selectedCategory === 'Toutes' || map.mode === selectedCategory;
+        const id = queryId.current;
+        setLoadingMore(true);
+        fetchJson(mapsUrl(query, nextCursor))
+            .then(page => {
+                if (id !== queryId.current) {
+                    return;
+                }
+                setMaps(current => current.concat(page.maps));
+                setTotal(page.total);
+                setNextCursor(page.next_cursor);
+            })
+            .catch(err => console.error('Error fetching more maps:', err))
+            .finally(() => setLoadingMore(false));
+    }, [nextCursor, loadingMore, selectedCategory, search, selectedSort]);
 
-            const descriptionText = Array.isArray(map.description)
-                ? map.description.join(' ').toLowerCase()
-                : (map.description || '').toLowerCase();
+    // Infinite scroll: load the next page as the end of the grid comes into view
+    React.useEffect(() => {
+        const sentinel = sentinelRef.current;
+        if (!sentinel || !nextCursor || typeof IntersectionObserver === 'undefined') {
+            return;
+        }
 
-            const matchesSearch = (map.title || '').toLowerCase().includes(searchTerm.toLowerCase()) ||
-                                descriptionText.includes(searchTerm.toLowerCase()) ||
-                                (map.tags || []).some(tag => tag.toLowerCase().includes(searchTerm.toLowerCase()));
-            return matchesCategory && matchesSearch;
-        });
-    }, [maps, selectedCategory, searchTerm]);
+        const observer = new IntersectionObserver(entries => {
+            if (entries[0].isIntersecting) {
+                loadMore();
+            }
+        }, { rootMargin: '600px 0px' });
+        observer.observe(sentinel);
+        return () => observer.disconnect();
+    }, [loadMore, nextCursor, loading]);
 
-    // Calculate global averages for Maceachren cube
+    // Calculate global averages for Maceachren cube (over the loaded pages)
     const globalMaceachren = React.useMemo(() => {
-        if (filteredMaps.length === 0) {
+        if (maps.length === 0) {
             return { communication: 50, task: 50, interaction: 50 };
         }
         
         // Only use maps that have actual maceachren data (don't use default 50 for missing data)
-        const mapsWithData = filteredMaps.filter(map => map.maceachren && 
+        const mapsWithData = maps.filter(map => map.maceachren && 
             (map.maceachren.communication !== undefined || 
              map.maceachren.task !== undefined || 
              map.maceachren.interaction !== undefined));
@@ -98,7 +220,7 @@ const MapGalleryApp = () => {
             task: Math.round(sum.task / mapsWithData.length),
             interaction: Math.round(sum.interaction / mapsWithData.length)
         };
-    }, [filteredMaps]);
+    }, [maps]);
 
     if (loading) {
         return React.createElement('div', {
@@ -136,7 +258,21 @@ const MapGalleryApp = () => {
                     selectedCategory: selectedCategory,
                     onCategoryChange: setSelectedCategory,
                     key: 'filter'
-                })
+                }),
+                React.createElement('div', {
+                    className: 'sort-filter',
+                    key: 'sort'
+                }, [
+                    React.createElement('h3', { key: 'title' }, 'Trier par'),
+                    React.createElement('select', {
+                        className: 'sort-select',
+                        value: selectedSort,
+                        onChange: event => setSelectedSort(event.target.value),
+                        key: 'select'
+                    }, SORT_OPTIONS.map(([value, label]) =>
+                        React.createElement('option', { value: value, key: value || 'default' }, label)
+                    ))
+                ])
             ])
         ]),
         React.createElement('section', {
@@ -144,16 +280,25 @@ const MapGalleryApp = () => {
             key: 'maps'
         }, [
             React.createElement('h2', { key: 'title' }, 
-                `${filteredMaps.length} Carte${filteredMaps.length !== 1 ? 's' : ''} Trouvée${filteredMaps.length !== 1 ? 's' : ''}`
+                `${total} Carte${total !== 1 ? 's' : ''} Trouvée${total !== 1 ? 's' : ''}`
             ),
             React.createElement('div', {
                 className: 'grid-container',
                 key: 'container'
-            }, filteredMaps.map(map => React.createElement(MapCard, { 
+            }, maps.map(map => React.createElement(MapCard, { 
                 map: map, 
                 onOpenModal: openModal,
                 key: map.id 
-            })))
+            }))),
+            nextCursor ? React.createElement('div', {
+                className: 'load-more',
+                ref: sentinelRef,
+                key: 'more'
+            }, React.createElement('button', {
+                className: 'filter-btn',
+                onClick: loadMore,
+                disabled: loadingMore
+            }, loadingMore ? 'Chargement...' : 'Afficher plus de cartes')) : null
         ]),
         React.createElement('section', {
             id: 'global-cube-section',
@@ -167,6 +312,7 @@ const MapGalleryApp = () => {
             map: selectedMap,
             isOpen: isModalOpen,
             onClose: closeModal,
+            onSelectMap: openModal,
             key: 'modal'
         }) : null
     ]);
@@ -1,6 +1,21 @@
+// srcset built from the responsive variants written by optimize_gallery.py
+const gallerySrcSet = (img) => (img && img.variants
+    ? img.variants.map(variant => `${variant.url} ${variant.width}w`).join(', ')
+    : undefined);
+
+// <source> elements for the transcoded variants written by optimize_videos.py
+const videoSourceElements = (img) => (img && img.sources
+    ? img.sources.map((source, index) => React.createElement('source', {
+        src: source.url,
+        type: source.type,
+        key: `source-${index}`
+    }))
+    : undefined);
+
 // Modal Component
-const MapModal = ({ map, isOpen, onClose }) => {
+const MapModal = ({ map, isOpen, onClose, onSelectMap }) => {
     const [viewerOpen, setViewerOpen] = React.useState(false);
+    const [relatedMaps, setRelatedMaps] = React.useState([]);
     const [selectedImageIndex, setSelectedImageIndex] = React.useState(0);
     const [showFirstTimeMessage2D, setShowFirstTimeMessage2D] = React.useState(false);
     const [showFirstTimeMessageInteractive, setShowFirstTimeMessageInteractive] = React.useState(false);
@@ -21,6 +36,22 @@ const MapModal = ({ map, isOpen, onClose }) => {
         }
     }, [isOpen, map.images, map.mode]);
 
+    // Similar maps, precomputed server-side (see related.py)
+    React.useEffect(() => {
+        if (!isOpen) return undefined;
+        let cancelled = false;
+        setRelatedMaps([]);
+        fetch(`/api/maps/${map.id}/related?limit=6`)
+            .then(response => response.ok ? response.json() : null)
+            .then(data => {
+                if (!cancelled && data) {
+                    setRelatedMaps(data.maps);
+                }
+            })
+            .catch(err => console.error('Error fetching related maps:', err));
+        return () => { cancelled = true; };
+    }, [isOpen, map.id]);
+
     const handleDontRemindAgain2D = () => {
         localStorage.setItem('hasSeenImageViewer2DMessage', 'true');
         setShowFirstTimeMessage2D(false);
@@ -194,12 +225,16 @@ const MapModal = ({ map, isOpen, onClose }) => {
                                 key: `gallery-video-${index}`,
                                 title: 'Cliquer pour voir la vidéo'
                             }, [
+                                // With a poster nothing is downloaded until playback starts
                                 React.createElement('video', {
-                                    src: mediaUrl,
+                                    src: img.sources ? undefined : mediaUrl,
+                                    poster: img.poster,
+                                    width: img.width,
+                                    height: img.height,
                                     className: 'gallery-image',
                                     key: 'video-element',
-                                    preload: 'metadata'
-                                }),
+                                    preload: img.poster ? 'none' : 'metadata'
+                                }, videoSourceElements(img)),
                                 React.createElement('div', {
                                     className: 'video-play-overlay',
                                     key: 'play-overlay'
@@ -211,6 +246,16 @@ const MapModal = ({ map, isOpen, onClose }) => {
                         } else {
                             return React.createElement('img', {
                                 src: mediaUrl,
+                                srcSet: gallerySrcSet(img),
+                                sizes: '(max-width: 768px) 100vw, 33vw',
+                                width: img.width,
+                                height: img.height,
+                                loading: 'lazy',
+                                decoding: 'async',
+                                style: img.placeholder ? {
+                                    backgroundImage: `url(${img.placeholder})`,
+                                    backgroundSize: 'cover'
+                                } : undefined,
                                 alt: `${map.title} - Image ${index + 1}`,
                                 className: 'gallery-image',
                                 onClick: () => handleImageClick(index),
@@ -298,7 +343,20 @@ const MapModal = ({ map, isOpen, onClose }) => {
                             key: index
                         }, tag)
                     )),
-                    React.createElement(MapCube, { config: map.maceachren, key: 'mapcube' })
+                    React.createElement(MapCube, { config: map.maceachren, key: 'mapcube' }),
+                    relatedMaps.length > 0 && onSelectMap ? React.createElement('div', { key: 'related-section' }, [
+                        React.createElement('h3', { key: 'related-title' }, 'Cartes similaires'),
+                        React.createElement('div', { key: 'related-list', className: 'sources-list' },
+                            relatedMaps.map(related =>
+                                React.createElement('button', {
+                                    key: `related-${related.id}`,
+                                    className: 'source-badge related-map',
+                                    onClick: () => onSelectMap(related),
+                                    title: related.category
+                                }, related.title)
+                            )
+                        )
+                    ]) : null
                 ])
             ]),
             React.createElement('div', {
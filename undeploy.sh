@@ -32,4 +32,3 @@ echo "Note: Virtual environment and logs are preserved."
 echo "To remove them manually, delete:"
 echo "  - venv/"
 echo "  - logs/"
-echo "  - gunicorn_config.py"
@@ -0,0 +1,326 @@
+"""
+Time-bucketed view analytics: hourly ring buffers and daily rollups.
+
+Views are buffered per (hour, map) in memory and appended in batches to a
+shared log (`hours.log`, one `hour<TAB>map<TAB>count` line per bucket), which
+every worker tails through the view counter's `TailedLog`. Each worker folds
+the log into:
+
+- a ring buffer of the last `hours` hourly counts per map (24h window);
+- per-day totals for the days not rolled up yet.
+
+Complete days are rolled up into `daily.json` (kept for `days` days) and the
+log is rewritten with only the hours the ring still needs, so it stays small.
+Window totals (`totals`, `trending`) are computed once per state change from
+the rollups, never from raw events, and cached until the next one.
+
+Hours and days are UTC and counted from the epoch.
+"""
+import json
+import os
+import time
+from array import array
+from datetime import datetime, timezone
+
+from view_counter import TailedLog, atomic_write_json
+
+# `window=` / `range=` values: (number of hours, number of days)
+WINDOWS = {
+    '24h': (24, 1),
+    '7d': (24 * 7, 7),
+    '30d': (24 * 30, 30),
+}
+
+
+def current_hour(now=None):
+    return int((time.time() if now is None else now) // 3600)
+
+
+def hour_start(hour):
+    """ISO 8601 timestamp of the start of an epoch hour."""
+    return datetime.fromtimestamp(hour * 3600, timezone.utc).isoformat()
+
+
+def day_start(day):
+    return datetime.fromtimestamp(day * 86400, timezone.utc).date().isoformat()
+
+
+def parse_window(value, default='7d'):
+    """Validate a `window=` / `range=` parameter."""
+    value = value or default
+    if value not in WINDOWS:
+        raise ValueError(f"window must be one of: {', '.join(WINDOWS)}")
+    return value
+
+
+class HourlyRing:
+    """Per-map counts for the last `size` hours, in fixed-size arrays."""
+
+    def __init__(self, size):
+        self.size = size
+        self.latest = None
+        # Hour held by each slot (-1: empty); shared by every map's array
+        self._hours = [-1] * size
+        self._counts = {}
+
+    def clear(self):
+        self.latest = None
+        self._hours = [-1] * self.size
+        self._counts = {}
+
+    def advance(self, hour):
+        """Move the window so it ends at `hour`, clearing expired slots."""
+        if self.latest is not None and hour <= self.latest:
+            return
+        start = hour - self.size + 1 if self.latest is None else max(self.latest + 1, hour - self.size + 1)
+        for h in range(start, hour + 1):
+            slot = h % self.size
+            if self._hours[slot] != -1:
+                for counts in self._counts.values():
+                    counts[slot] = 0
+            self._hours[slot] = h
+        self.latest = hour
+
+    def add(self, hour, key, n):
+        """Count `n` views; returns False if `hour` is outside the window."""
+        self.advance(hour)
+        if hour <= self.latest - self.size:
+            return False
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = array('I', bytes(4 * self.size))
+        counts[hour % self.size] += n
+        return True
+
+    def series(self, key, last_hour, hours):
+        """Counts of `key` for the `hours` hours ending at `last_hour`."""
+        counts = self._counts.get(key)
+        out = []
+        for h in range(last_hour - hours + 1, last_hour + 1):
+            slot = h % self.size
+            out.append(counts[slot] if counts is not None and self._hours[slot] == h else 0)
+        return out
+
+    def totals(self, last_hour, hours):
+        """{map: views} over the `hours` hours ending at `last_hour`."""
+        slots = [h % self.size for h in range(last_hour - hours + 1, last_hour + 1)
+                 if self._hours[h % self.size] == h]
+        out = {}
+        for key, counts in self._counts.items():
+            n = sum(counts[slot] for slot in slots)
+            if n:
+                out[key] = n
+        return out
+
+
+class ViewAnalytics(TailedLog):
+    """Hourly and daily view counts per map, shared across workers."""
+
+    flusher_name = 'analytics-flusher'
+
+    def __init__(self, directory, hours=48, days=90, flush_interval=5.0, compact_bytes=512 * 1024):
+        super().__init__(os.path.join(directory, 'hours.log'),
+                         os.path.join(directory, 'analytics.lock'), flush_interval)
+        self.directory = directory
+        self.rollup_path = os.path.join(directory, 'daily.json')
+        self.days = days
+        self.compact_bytes = compact_bytes
+
+        self._ring = HourlyRing(hours)
+        # Days not rolled up yet, from the log: {day: {map: views}}
+        self._log_days = {}
+        # Rolled-up days: {day: {map: views}}; days <= _rolled_through
+        self._daily = {}
+        self._rolled_through = -1
+        self._rollup_stamp = None
+        self._changes = 0
+        self._cache = {}
+
+    # -- public API -------------------------------------------------------
+
+    def record(self, map_id, now=None):
+        """Count one view of `map_id` in the current hour."""
+        bucket = (current_hour(now), str(map_id))
+        with self._lock:
+            self._ensure_flusher()
+            self._pending[bucket] = self._pending.get(bucket, 0) + 1
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    @property
+    def version(self):
+        """Changes whenever any count or the current hour changes."""
+        with self._lock:
+            self.sync()
+            return f"{self._log_ino}.{self._changes}.{current_hour()}"
+
+    def totals(self, window):
+        """{map: views} over `window` ('24h', '7d' or '30d'), cached."""
+        return self._window(window)[0]
+
+    def trending(self, window, limit=None):
+        """[(map id, views), ...] over `window`, most viewed first."""
+        ranked = self._window(window)[1]
+        return ranked if limit is None else ranked[:limit]
+
+    def series(self, map_id, window):
+        """[(bucket start, views), ...]: hourly for '24h', daily otherwise."""
+        key = str(map_id)
+        with self._lock:
+            self.sync()
+            hour = current_hour()
+            hours, days = WINDOWS[window]
+            if days == 1:
+                counts = self._ring.series(key, hour, hours)
+                return [(hour_start(hour - hours + 1 + i), n) for i, n in enumerate(counts)]
+            today = hour // 24
+            return [(day_start(day), self._day_views(day).get(key, 0))
+                    for day in range(today - days + 1, today + 1)]
+
+    def sync(self):
+        """Pick up buckets other workers appended, and new rollups."""
+        with self._lock, self._file_lock(shared=True):
+            self._read_rollups()
+            self._read_log()
+
+    def flush(self):
+        """Append buffered buckets to the log; roll up complete days."""
+        with self._lock:
+            with self._file_lock():
+                self._read_rollups()
+                self._read_log()
+                if self._pending:
+                    self._roll_late(self._pending)
+                    self._append_log(''.join(
+                        f"{hour}\t{key}\t{n}\n" for (hour, key), n in self._pending.items()))
+                    self._pending = {}
+                    self._read_log()
+                self._last_flush = time.monotonic()
+                today = current_hour() // 24
+                complete = any(self._rolled_through < day < today for day in self._log_days)
+                if complete or self._offset >= self.compact_bytes:
+                    self._compact(today)
+
+    # -- internals --------------------------------------------------------
+
+    def _day_views(self, day):
+        if day <= self._rolled_through:
+            return self._daily.get(day, {})
+        return self._log_days.get(day, {})
+
+    def _window(self, window):
+        """(totals, ranking) for `window`, recomputed once per state change."""
+        with self._lock:
+            self.sync()
+            hour = current_hour()
+            key = (hour, self._changes, self._log_ino)
+            cached = self._cache.get(window)
+            if cached is None or cached[0] != key:
+                totals = self._compute_totals(window, hour)
+                ranked = sorted(totals.items(), key=lambda item: (-item[1], _id_order(item[0])))
+                cached = self._cache[window] = (key, totals, ranked)
+            return cached[1:]
+
+    def _compute_totals(self, window, hour):
+        hours, days = WINDOWS[window]
+        if days == 1:
+            return self._ring.totals(hour, hours)
+        out = {}
+        today = hour // 24
+        for day in range(today - days + 1, today + 1):
+            for key, n in self._day_views(day).items():
+                out[key] = out.get(key, 0) + n
+        return out
+
+    def _read_rollups(self):
+        try:
+            st = os.stat(self.rollup_path)
+        except FileNotFoundError:
+            return
+        stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if stamp == self._rollup_stamp:
+            return
+        try:
+            with open(self.rollup_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except ValueError:
+            return
+        self._daily = {int(day): counts for day, counts in data.get('days', {}).items()}
+        self._rolled_through = data.get('rolled_through', -1)
+        self._rollup_stamp = stamp
+        self._changes += 1
+
+    def _read_log(self):
+        """Consume new log lines. Caller holds the file lock."""
+        self._ring.advance(current_hour())
+        self._tail_log()
+
+    def _reset(self):
+        # The log was compacted: rebuild from its head
+        self._ring.clear()
+        self._ring.advance(current_hour())
+        self._log_days = {}
+        self._changes += 1
+
+    def _consume(self, lines):
+        for line in lines:
+            try:
+                hour, key, n = line.split('\t')
+                hour, n = int(hour), int(n)
+            except ValueError:
+                continue
+            self._ring.add(hour, key, n)
+            counts = self._log_days.setdefault(hour // 24, {})
+            counts[key] = counts.get(key, 0) + n
+        self._changes += 1
+
+    def _roll_late(self, buckets):
+        """Add buckets of already rolled-up days (buffered across midnight)
+        straight to daily.json. Caller holds the exclusive file lock."""
+        late = [(hour // 24, key, n) for (hour, key), n in buckets.items()
+                if hour // 24 <= self._rolled_through]
+        if not late:
+            return
+        daily = {day: dict(counts) for day, counts in self._daily.items()}
+        for day, key, n in late:
+            counts = daily.setdefault(day, {})
+            counts[key] = counts.get(key, 0) + n
+        self._write_rollups(daily, self._rolled_through)
+
+    def _write_rollups(self, daily, rolled_through):
+        atomic_write_json(self.rollup_path, {
+            'rolled_through': rolled_through,
+            'days': {str(day): counts for day, counts in sorted(daily.items())},
+        })
+        self._read_rollups()
+
+    def _compact(self, today):
+        """Roll complete days into daily.json and rewrite the log.
+
+        Caller holds the exclusive file lock. The log keeps the hours the
+        ring buffer still covers, merged into one line per (hour, map).
+        """
+        daily = dict(self._daily)
+        for day, counts in self._log_days.items():
+            if self._rolled_through < day < today:
+                daily[day] = counts
+        rolled_through = max(self._rolled_through, today - 1)
+        daily = {day: counts for day, counts in daily.items() if day > today - self.days}
+        self._write_rollups(daily, rolled_through)
+
+        buckets = {}
+        with open(self.log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    hour, key, n = line.rstrip('\n').split('\t')
+                    hour, n = int(hour), int(n)
+                except ValueError:
+                    continue
+                if hour > current_hour() - self._ring.size:
+                    buckets[(hour, key)] = buckets.get((hour, key), 0) + n
+        self._replace_log(''.join(f"{hour}\t{key}\t{n}\n" for (hour, key), n in sorted(buckets.items())))
+        self._read_log()
+
+
+def _id_order(key):
+    return (0, int(key), '') if key.isdigit() else (1, 0, key)
@@ -0,0 +1,384 @@
+"""
+Batched, lock-safe view counter with write-behind flushing.
+
+Increments are buffered in memory and appended in batches to a shared,
+append-only log. Every worker tails that log, so counts stay accurate across
+gunicorn processes. Once the log grows past a threshold it is folded into a
+counts file the counter owns (`views.json` next to the log) with an atomic
+rename. Each log starts with a random generation line, and the counts file
+records the generation and offset it folded, so a crash between writing the
+counts and replacing the log cannot count the same views twice. maps.json
+is never rewritten, so view traffic does not change the catalog version. The log tailing and write-behind flushing live in
+`TailedLog`, which view_analytics.py builds on too.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows dev server: single process, no file locking
+    fcntl = None
+
+
+def atomic_write_json(path, data):
+    """Write `data` to `path` through a temp file and an atomic rename."""
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def catalog_lock_path(instance_path=None):
+    """Lock file guarding every rewrite of maps.json.
+
+    Build scripts and the SQLite export take it exclusively so they never
+    race each other. It lives in the app's instance directory, resolved as
+    app.py does: `instance_path`, else $INSTANCE_PATH, else ./instance.
+    """
+    if instance_path is None:
+        instance_path = os.environ.get('INSTANCE_PATH') or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'instance')
+    return os.path.join(instance_path, 'catalog.lock')
+
+
+@contextmanager
+def file_lock(lock_path, shared=False):
+    """Hold a cross-process flock on `lock_path` (no-op without fcntl)."""
+    if fcntl is None:
+        yield
+        return
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def update_catalog_json(path, update, lock_path=None):
+    """Read-modify-write `path` (maps.json) under the catalog lock.
+
+    `update(data)` edits the parsed document in place and returns how many
+    entries it changed; the file is only rewritten, atomically, when that is
+    truthy, so a run with nothing new leaves the catalog version alone.
+    Returns `update`'s result.
+    """
+    lock_path = lock_path or catalog_lock_path()
+    os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+    with file_lock(lock_path):
+        # Re-read under the lock: another script may have rewritten the file
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        changed = update(data)
+        if changed:
+            atomic_write_json(path, data)
+    return changed
+
+
+class TailedLog:
+    """Append-only log shared by every worker, with write-behind flushing.
+
+    Subclasses buffer entries in `_pending` and append them with
+    `_append_log`. `_tail_log` feeds the complete lines other workers
+    appended since the last call to `_consume`, and calls `_reset` first
+    when the log was replaced (compacted) so derived state is rebuilt from
+    its head. A background thread per (forked) process calls `flush()`
+    every `flush_interval` seconds while entries are pending, and once more
+    at exit.
+    """
+
+    flusher_name = 'log-flusher'
+
+    def __init__(self, log_path, lock_path, flush_interval):
+        self.log_path = log_path
+        self.lock_path = lock_path
+        self.flush_interval = flush_interval
+
+        self._lock = threading.RLock()
+        self._pending = {}
+        self._offset = 0
+        self._log_ino = None
+        self._last_flush = time.monotonic()
+        self._flusher_pid = None
+
+        os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+        atexit.register(self._flush_at_exit)
+
+    def flush(self):
+        raise NotImplementedError
+
+    def _reset(self):
+        """Forget state derived from the previous log. May move `_offset`
+        past the head of the new one if it is already accounted for."""
+
+    def _consume(self, lines):
+        """Fold newly appended `lines` into the in-memory state."""
+        raise NotImplementedError
+
+    def _file_lock(self, shared=False):
+        return file_lock(self.lock_path, shared)
+
+    def _tail_log(self):
+        """Consume new complete log lines. Caller holds the file lock."""
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            st = None
+        ino = st.st_ino if st else None
+        if ino != self._log_ino or (st and st.st_size < self._offset):
+            # The log was replaced: start over from its head
+            self._offset = 0
+            self._log_ino = ino
+            self._reset()
+        if st is None or st.st_size <= self._offset:
+            return
+
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._offset)
+            chunk = f.read(st.st_size - self._offset)
+        end = chunk.rfind(b'\n') + 1
+        if end:
+            self._consume(chunk[:end].decode('utf-8').splitlines())
+            self._offset += end
+
+    def _append_log(self, lines):
+        """Append `lines` (newline-terminated text). Caller holds the
+        exclusive file lock."""
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+        self._last_flush = time.monotonic()
+
+    def _replace_log(self, lines=''):
+        """Atomically replace the log with `lines`. Caller holds the
+        exclusive file lock."""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.log_path) or '.',
+                                        prefix='.tmp-', suffix='.log')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(lines)
+        os.replace(tmp_path, self.log_path)
+
+    def _flush_at_exit(self):
+        # Nothing to persist otherwise; the log may even be gone by now
+        if self._pending:
+            self.flush()
+
+    def _ensure_flusher(self):
+        """Start the background flush thread once per (forked) process."""
+        pid = os.getpid()
+        if self._flusher_pid == pid:
+            return
+        self._flusher_pid = pid
+        thread = threading.Thread(target=self._flush_loop, name=self.flusher_name, daemon=True)
+        thread.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                if self._pending:
+                    self.flush()
+            except Exception as e:
+                print(f"Error flushing {self.log_path}: {e}")
+
+
+class ViewCounter(TailedLog):
+    """Counts map views on top of the `views` stored in the catalog."""
+
+    flusher_name = 'view-flusher'
+
+    def __init__(self, catalog_store, log_path, counts_path=None, batch_size=50,
+                 flush_interval=2.0, compact_bytes=256 * 1024):
+        super().__init__(log_path, log_path + '.lock', flush_interval)
+        self.catalog_store = catalog_store
+        self.counts_path = counts_path or os.path.splitext(log_path)[0] + '.json'
+        self.batch_size = batch_size
+        self.compact_bytes = compact_bytes
+
+        self._pending_total = 0
+        self._flushed = {}
+        self._flushed_total = 0
+        # Increments folded into the counts file by earlier compactions
+        self._compacted = {}
+        self._compacted_total = 0
+        self._counts_stamp = None
+        # (log generation, offset) the counts file already includes
+        self._folded = None
+        self._log_generation = None
+        self._catalog = None
+
+        os.makedirs(os.path.dirname(self.counts_path) or '.', exist_ok=True)
+
+    # -- public API -------------------------------------------------------
+
+    def record(self, map_id):
+        """Record one view and return the map's updated view count."""
+        key = str(map_id)
+        with self._lock:
+            self._ensure_flusher()
+            self._pending[key] = self._pending.get(key, 0) + 1
+            self._pending_total += 1
+            due = (self._pending_total >= self.batch_size or
+                   time.monotonic() - self._last_flush >= self.flush_interval)
+            if due:
+                self.flush()
+            else:
+                self.sync()
+            return self._count(key)
+
+    def count(self, map_id):
+        """Return the current view count of a map."""
+        with self._lock:
+            self.sync()
+            return self._count(str(map_id))
+
+    def counts(self):
+        """Return the current view count of every map, keyed by str id."""
+        with self._lock:
+            self.sync()
+            return {key: self._count(key) for key in self._catalog.by_id}
+
+    def total(self):
+        """Return the number of views across the whole catalog."""
+        with self._lock:
+            self.sync()
+            return (self._catalog.stats.base_views + self._compacted_total +
+                    self._flushed_total + self._pending_total)
+
+    def sync(self):
+        """Pick up increments other workers appended to the log."""
+        with self._lock, self._file_lock(shared=True):
+            self._read_log()
+
+    def flush(self):
+        """Append buffered increments to the log; compact it if it grew large."""
+        with self._lock:
+            if not self._pending:
+                self.sync()
+                return
+            with self._file_lock(shared=False):
+                self._read_log()
+                lines = ''.join(f"{k}\t{n}\n" for k, n in self._pending.items())
+                if not os.path.exists(self.log_path) or os.path.getsize(self.log_path) == 0:
+                    lines = self._log_header() + lines
+                self._append_log(lines)
+                self._pending = {}
+                self._pending_total = 0
+                self._read_log()
+                if self._offset >= self.compact_bytes:
+                    self._compact()
+
+    def compact(self):
+        """Fold every logged increment into the counts file and start a new log."""
+        with self._lock:
+            self.flush()
+            with self._file_lock(shared=False):
+                self._read_log()
+                self._compact()
+
+    # -- internals --------------------------------------------------------
+
+    def _count(self, key):
+        record = self._catalog.get(key)
+        base = record.get('views', 0) if record is not None else 0
+        return (base + self._compacted.get(key, 0) +
+                self._flushed.get(key, 0) + self._pending.get(key, 0))
+
+    def _read_counts(self):
+        """Reload the counts file after a compaction. Caller holds the file lock."""
+        try:
+            st = os.stat(self.counts_path)
+        except FileNotFoundError:
+            st = None
+        stamp = (st.st_mtime_ns, st.st_size, st.st_ino) if st else None
+        if stamp == self._counts_stamp:
+            return
+        counts = {}
+        self._folded = None
+        if st is not None:
+            with open(self.counts_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data.get('counts'), dict):
+                counts = data['counts']
+                folded = data.get('folded')
+                if folded:
+                    self._folded = (folded.get('log'), folded.get('offset', 0))
+            else:
+                # Written before compactions recorded what they folded
+                counts = data
+        self._compacted = counts
+        self._compacted_total = sum(counts.values())
+        self._counts_stamp = stamp
+        # Tail the log again against the new counts (see `_reset`)
+        self._log_ino = None
+
+    def _read_log(self):
+        """Consume new log lines. Caller holds the file lock."""
+        self._read_counts()
+        self._tail_log()
+        # Read the catalog under the same lock so its base counts always
+        # match the log we are tailing
+        self._catalog = self.catalog_store.get()
+
+    def _reset(self):
+        # The log was compacted into the counts file. If a compaction crashed
+        # before replacing it, its folded head is skipped, not counted twice
+        self._flushed = {}
+        self._flushed_total = 0
+        self._log_generation = self._read_generation()
+        if self._folded is not None and self._folded[0] == self._log_generation:
+            self._offset = self._folded[1]
+
+    def _read_generation(self):
+        """Generation of the current log (None for logs without a header)."""
+        try:
+            with open(self.log_path, 'rb') as f:
+                first = f.readline()
+        except FileNotFoundError:
+            return None
+        if first.startswith(b'#') and first.endswith(b'\n'):
+            return first[1:-1].decode('ascii')
+        return None
+
+    @staticmethod
+    def _log_header():
+        return f"#{uuid.uuid4().hex}\n"
+
+    def _consume(self, lines):
+        for line in lines:
+            key, _, n = line.partition('\t')
+            try:
+                n = int(n)
+            except ValueError:
+                continue
+            self._flushed[key] = self._flushed.get(key, 0) + n
+            self._flushed_total += n
+
+    def _compact(self):
+        """Add logged counts to the counts file. Caller holds the file lock."""
+        if not self._flushed:
+            return
+        counts = dict(self._compacted)
+        for key, n in self._flushed.items():
+            counts[key] = counts.get(key, 0) + n
+        atomic_write_json(self.counts_path, {
+            'counts': counts,
+            'folded': {'log': self._log_generation, 'offset': self._offset},
+        })
+        self._replace_log(self._log_header())
+        self._read_log()
@@ -0,0 +1,167 @@
+"""
+Probabilistic deduplication of view increments.
+
+A visitor reopening a map or reloading the page should count once. Each
+(client, map) pair is hashed with a secret salt (raw addresses are never
+stored) and checked against rotating Bloom filters: the filter of the
+current time window and the one before it, so a repeat is dropped for
+between one and two windows. Filters are sized for `capacity` distinct pairs
+per window at `error_rate` false positives, and memory never grows beyond
+that, however many visitors come.
+
+The filters live in a memory-mapped file shared by every worker, so a
+repeat is caught whichever worker serves it. Bits are set without locking:
+two workers racing on the same byte can at worst lose one bit, which lets a
+duplicate through, never drops a first view. Rotation (clearing the oldest
+slot for a new window) happens under a file lock.
+
+    <MAGIC> <salt> (<window number> <bits>) x SLOTS
+"""
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from view_counter import file_lock
+
+MAGIC = b'GEOVISBLOOM\x01'
+SALT_SIZE = 16
+SLOT_HEADER = struct.Struct('<q')
+# Current window plus the previous one
+SLOTS = 2
+
+
+def bloom_parameters(capacity, error_rate):
+    """(bits, hashes) of a Bloom filter for `capacity` items at `error_rate`."""
+    bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    bits = (bits + 7) // 8 * 8
+    hashes = max(1, round(bits / capacity * math.log(2)))
+    return bits, hashes
+
+
+class ViewDeduplicator:
+    """Remembers recently seen (client, map) pairs in rotating Bloom filters."""
+
+    def __init__(self, path, window=3600, capacity=100000, error_rate=0.001):
+        self.path = path
+        self.window = window
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits, self.hashes = bloom_parameters(capacity, error_rate)
+        self.slot_size = SLOT_HEADER.size + self.bits // 8
+        self.size = len(MAGIC) + SALT_SIZE + SLOTS * self.slot_size
+        # Views this worker let through and dropped (see metrics)
+        self.accepted = 0
+        self.duplicates = 0
+        self._lock = threading.Lock()
+        self._map = None
+        self._pid = None
+
+    def _mapping(self):
+        """The shared filter file, created or resized on first use."""
+        if self._map is not None and self._pid == os.getpid():
+            return self._map
+        with self._lock:
+            if self._map is None or self._pid != os.getpid():
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with file_lock(self.path + '.lock'):
+                    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                    with os.fdopen(fd, 'r+b') as f:
+                        head = f.read(len(MAGIC))
+                        if head != MAGIC or os.fstat(f.fileno()).st_size != self.size:
+                            # New file or other filter parameters: start over
+                            f.seek(0)
+                            f.truncate()
+                            f.write(MAGIC + os.urandom(SALT_SIZE))
+                            f.truncate(self.size)
+                        f.flush()
+                        self._map = mmap.mmap(f.fileno(), self.size)
+                self._pid = os.getpid()
+        return self._map
+
+    def _slot_offset(self, slot):
+        return len(MAGIC) + SALT_SIZE + slot * self.slot_size
+
+    def _slot_window(self, mapping, slot):
+        offset = self._slot_offset(slot)
+        return SLOT_HEADER.unpack(mapping[offset:offset + SLOT_HEADER.size])[0]
+
+    def _rotate(self, mapping, current):
+        """Assign the slot of window `current`, clearing what it held."""
+        slot = current % SLOTS
+        if self._slot_window(mapping, slot) == current:
+            return
+        with file_lock(self.path + '.lock'):
+            if self._slot_window(mapping, slot) != current:
+                offset = self._slot_offset(slot)
+                # Mark the slot before clearing it so readers never trust stale bits
+                mapping[offset:offset + SLOT_HEADER.size] = SLOT_HEADER.pack(-1)
+                mapping[offset + SLOT_HEADER.size:offset + self.slot_size] = bytes(self.bits // 8)
+                mapping[offset:offset + SLOT_HEADER.size] = SLOT_HEADER.pack(current)
+
+    def _positions(self, mapping, client, map_id):
+        salt = mapping[len(MAGIC):len(MAGIC) + SALT_SIZE]
+        digest = hashlib.blake2b(f"{client}\x1f{map_id}".encode('utf-8'),
+                                 digest_size=16, key=salt).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        # Double hashing: k positions from two 64-bit hashes
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def _contains(self, mapping, base, positions):
+        return all(mapping[base + p // 8] & (1 << (p % 8)) for p in positions)
+
+    def current_window(self, now=None):
+        """Number of the time window new views are recorded in."""
+        return int((time.time() if now is None else now) // self.window)
+
+    def seen(self, client, map_id, now=None):
+        """Record a view; return True if it repeats one from the last windows."""
+        mapping = self._mapping()
+        current = self.current_window(now)
+        self._rotate(mapping, current)
+        positions = self._positions(mapping, client, map_id)
+        for window in (current, current - 1):
+            slot = window % SLOTS
+            if self._slot_window(mapping, slot) == window:
+                base = self._slot_offset(slot) + SLOT_HEADER.size
+                if self._contains(mapping, base, positions):
+                    self.duplicates += 1
+                    return True
+        base = self._slot_offset(current % SLOTS) + SLOT_HEADER.size
+        for p in positions:
+            mapping[base + p // 8] |= 1 << (p % 8)
+        self.accepted += 1
+        return False
+
+    def stats(self, now=None):
+        """Fill and estimated false-positive rate of the active filters."""
+        mapping = self._mapping()
+        current = self.current_window(now)
+        miss = 1.0
+        entries = 0
+        for window in (current, current - 1):
+            slot = window % SLOTS
+            if self._slot_window(mapping, slot) != window:
+                continue
+            base = self._slot_offset(slot) + SLOT_HEADER.size
+            ones = int.from_bytes(mapping[base:base + self.bits // 8], 'little').bit_count()
+            fill = ones / self.bits
+            # Probability that all k bits of a new pair are already set
+            miss *= 1.0 - fill ** self.hashes
+            if ones < self.bits:
+                # Swamidass-Baldi estimate of the number of pairs inserted
+                entries += round(-self.bits / self.hashes * math.log(1.0 - fill))
+            else:
+                entries += self.capacity
+        return {
+            'window_seconds': self.window,
+            'capacity': self.capacity,
+            'target_error_rate': self.error_rate,
+            'estimated_entries': entries,
+            'false_positive_rate': round(1.0 - miss, 8),
+            'memory_bytes': self.size,
+        }